@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .instrumentation import install_query_recorder
+        from .metrics import collect_cache, collect_db_pools, register_collector
+
+        connection_created.connect(install_query_recorder, dispatch_uid='api.install_query_recorder')
+        register_collector(collect_cache)
+        register_collector(collect_db_pools)
@@ -0,0 +1,235 @@
+"""
+Two-tier application cache with tag-based invalidation.
+
+L1 is a small in-process LRU with a short TTL; L2 is the shared Django cache
+(Redis when ``REDIS_URL`` is set, local memory otherwise). Every entry is
+stored with the versions of its tags. Invalidating a tag bumps its version in
+L2 and drops matching L1 entries in this process. Other processes stop
+serving their L1 copies within ``API_CACHE_L1_TTL_SECONDS``, and stale L2
+entries are never served.
+
+Typical use::
+
+    data = app_cache.get_or_set(
+        'job_categories:list', lambda: JobCategorySerializer(qs, many=True).data,
+        tags=['job_categories'],
+    )
+
+    invalidate_on_change(JobCategory, 'job_categories')
+"""
+import collections
+import functools
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+KEY_PREFIX = 'appcache:'
+TAG_PREFIX = 'appcache:tag:'
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with per-entry expiry."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete_where(self, predicate):
+        with self._lock:
+            for key in [key for key, (_, value) in self._entries.items() if predicate(value)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TwoTierCache:
+    """
+    Read-through cache over an in-process LRU (L1) and a Django cache (L2).
+    """
+
+    def __init__(self, alias='default', l1_max_entries=None, l1_ttl=None, default_timeout=None):
+        self.alias = alias
+        self.l1 = LRUCache(
+            l1_max_entries or getattr(settings, 'API_CACHE_L1_MAX_ENTRIES', 1000),
+            l1_ttl or getattr(settings, 'API_CACHE_L1_TTL_SECONDS', 30),
+        )
+        self.default_timeout = default_timeout or getattr(settings, 'API_CACHE_DEFAULT_TIMEOUT', 300)
+        self.stats = collections.Counter()
+
+    @property
+    def l2(self):
+        return caches[self.alias]
+
+    def tag_versions(self, tags):
+        if not tags:
+            return {}
+        stored = self.l2.get_many([TAG_PREFIX + tag for tag in tags])
+        return {tag: stored.get(TAG_PREFIX + tag, 0) for tag in tags}
+
+    def get(self, key, default=None):
+        entry = self.l1.get(key)
+        if entry is not None:
+            self.stats['l1_hits'] += 1
+            return entry['value']
+
+        entry = self.l2.get(KEY_PREFIX + key)
+        if entry is not None and self.tag_versions(list(entry['tags'])) == entry['tags']:
+            self.stats['l2_hits'] += 1
+            self.l1.set(key, entry)
+            return entry['value']
+
+        self.stats['misses'] += 1
+        return default
+
+    def set(self, key, value, tags=(), timeout=None, versions=None):
+        entry = {'value': value, 'tags': versions if versions is not None else self.tag_versions(list(tags))}
+        self.l2.set(KEY_PREFIX + key, entry, timeout or self.default_timeout)
+        self.l1.set(key, entry)
+        self.stats['sets'] += 1
+
+    def get_or_set(self, key, producer, tags=(), timeout=None):
+        """Return the cached value for ``key``, computing and storing it on a miss."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            # Snapshot versions before computing, so an invalidation that lands
+            # while the producer runs leaves the stored entry already stale
+            versions = self.tag_versions(list(tags))
+            value = producer()
+            self.set(key, value, tags, timeout, versions)
+        return value
+
+    def invalidate_tags(self, *tags):
+        """Make every entry carrying any of ``tags`` stale, in all processes."""
+        for tag in tags:
+            key = TAG_PREFIX + tag
+            # Tag versions never expire; add() seeds the counter on first use
+            self.l2.add(key, 0, timeout=None)
+            try:
+                self.l2.incr(key)
+            except ValueError:
+                self.l2.set(key, 1, timeout=None)
+        tags = set(tags)
+        self.l1.delete_where(lambda entry: not tags.isdisjoint(entry['tags']))
+        self.stats['invalidations'] += len(tags)
+
+    def clear_local(self):
+        self.l1.clear()
+
+    def get_stats(self):
+        lookups = self.stats['l1_hits'] + self.stats['l2_hits'] + self.stats['misses']
+        return {
+            'l1_hits': self.stats['l1_hits'],
+            'l2_hits': self.stats['l2_hits'],
+            'misses': self.stats['misses'],
+            'sets': self.stats['sets'],
+            'invalidations': self.stats['invalidations'],
+            'l1_evictions': self.l1.evictions,
+            'l1_entries': len(self.l1),
+            'hit_ratio': (lookups - self.stats['misses']) / lookups if lookups else 0.0,
+        }
+
+
+app_cache = TwoTierCache()
+
+
+def make_key(*parts):
+    """Cache key from arbitrary parts; long keys are hashed to stay backend-safe."""
+    key = ':'.join(str(part) for part in parts)
+    if len(key) > 200:
+        key = f'{key[:100]}:{hashlib.sha1(key.encode()).hexdigest()}'
+    return key
+
+
+def cached(tags=(), timeout=None, key=None):
+    """
+    Decorator for read-through caching of a function's result.
+
+    ``key`` builds the cache key from the call arguments; by default the
+    function's qualified name and the arguments' reprs are used. ``tags`` may
+    be a sequence or a callable taking the same arguments.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs) if key else make_key(
+                func.__module__, func.__qualname__, *args, *sorted(kwargs.items())
+            )
+            entry_tags = tags(*args, **kwargs) if callable(tags) else tags
+            return app_cache.get_or_set(cache_key, lambda: func(*args, **kwargs), entry_tags, timeout)
+        wrapper.invalidate = lambda *args, **kwargs: app_cache.invalidate_tags(
+            *(tags(*args, **kwargs) if callable(tags) else tags)
+        )
+        return wrapper
+    return decorator
+
+
+def invalidate_on_change(model, *tags, ignore_fields=()):
+    """
+    Invalidate tags whenever ``model`` rows are saved or deleted.
+
+    Each tag is a string or a callable ``tag(instance)`` returning a tag or an
+    iterable of tags. Saves that only touch ``ignore_fields`` (via
+    ``update_fields``) are skipped. Invalidation runs after the surrounding
+    transaction commits.
+    """
+    ignore_fields = frozenset(ignore_fields)
+
+    def resolve(instance):
+        resolved = []
+        for tag in tags:
+            value = tag(instance) if callable(tag) else tag
+            if isinstance(value, str):
+                resolved.append(value)
+            elif value:
+                resolved.extend(value)
+        return resolved
+
+    def handler(sender, instance, update_fields=None, **kwargs):
+        if update_fields and ignore_fields.issuperset(update_fields):
+            return
+        resolved = resolve(instance)
+        if resolved:
+            transaction.on_commit(lambda: app_cache.invalidate_tags(*resolved))
+
+    dispatch_uid = f'app_cache:{model._meta.label}:{id(tags)}'
+    post_save.connect(handler, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    post_delete.connect(handler, sender=model, weak=False, dispatch_uid=dispatch_uid)
+    return handler
+
+
+def cache_stats():
+    return app_cache.get_stats()
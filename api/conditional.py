@@ -0,0 +1,73 @@
+"""
+Conditional GET (ETag / Last-Modified) for read endpoints.
+
+Views compute cheap validators -- ``updated_at`` stamps or an aggregate over
+them -- before any serialization happens. When the client's ``If-None-Match``
+or ``If-Modified-Since`` still matches, a bodiless 304 is returned and the
+response is never built::
+
+    return conditional_response(
+        request,
+        lambda: Response(JobSerializer(job, context={'request': request}).data),
+        etag=request_etag(request, 'job', job.pk, job.updated_at),
+    )
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """
+    Weak ETag over ``parts``.
+
+    Weak because the body is re-rendered on every full response rather than
+    stored, so it is only guaranteed to be semantically equivalent.
+    """
+    digest = hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def request_etag(request, *parts):
+    """``make_etag`` over ``parts`` plus what varies the body between requests."""
+    return make_etag(
+        request.user.pk,
+        getattr(request, 'accepted_media_type', ''),
+        # Media URLs in the body are absolute
+        request.build_absolute_uri('/'),
+        sorted(request.query_params.lists()),
+        *parts
+    )
+
+
+def conditional_response(request, build, etag=None, last_modified=None):
+    """
+    Answer a conditional GET with 304, or return ``build()``.
+
+    ``build`` is only called when a full response is needed. Successful
+    responses carry the validators and ``Cache-Control: no-cache`` so
+    browsers revalidate instead of guessing freshness from Last-Modified.
+    Responses for signed-in users are also marked private.
+
+    Only pass ``last_modified`` when it moves on every change to the body.
+    A list validated by a row count plus ``Max(updated_at)`` must not send
+    it: deleting a row lowers the count but not the maximum, so a client
+    revalidating with ``If-Modified-Since`` alone would get a wrong 304.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = build()
+    if response.status_code not in (200, 304):
+        return response
+
+    if etag:
+        response.headers['ETag'] = etag
+    if timestamp is not None:
+        response.headers['Last-Modified'] = http_date(timestamp)
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
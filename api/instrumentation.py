@@ -0,0 +1,156 @@
+"""
+Per-request and per-WebSocket-event SQL instrumentation.
+
+An execute wrapper installed on every database connection records each query
+into the ``QueryStats`` of the unit of work being measured: an HTTP request
+(``api.middleware.SQLInstrumentationMiddleware``) or one consumer event
+(``InstrumentedConsumerMixin``). Outside a measured unit the wrapper only
+does a context variable lookup, so sampling a fraction of production traffic
+costs almost nothing.
+
+For each measured unit we log one JSON line with the query count, total DB
+time and the query shapes run repeatedly. A shape repeated
+``SQL_N_PLUS_ONE_THRESHOLD`` times is almost always an N+1. Units that run
+more queries than their budget (``SQL_QUERY_BUDGETS`` by URL name or consumer
+event, else ``SQL_QUERY_BUDGET_DEFAULT``), or that contain an N+1, are logged
+as warnings. ``log_event`` writes the same kind of JSON line for other
+structured events.
+"""
+import collections
+import contextlib
+import contextvars
+import json
+import logging
+import random
+import re
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('sql_stats', default=None)
+
+_IN_LIST = re.compile(r'\bIN \((?:%s|\?)(?:, (?:%s|\?))*\)', re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """The shape of ``sql``: literals and parameter lists collapsed."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class QueryStats:
+    """Queries run by one request or consumer event."""
+
+    def __init__(self, label):
+        self.label = label
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = collections.Counter()
+
+    def record(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        self.shapes[fingerprint(sql)] += 1
+
+    def repeated(self, threshold):
+        """``(shape, count)`` for shapes run at least ``threshold`` times, most frequent first."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+def record_queries(execute, sql, params, many, context):
+    """Execute wrapper that feeds the ``QueryStats`` being collected, if any."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.record(sql, time.perf_counter() - started)
+
+
+def install_query_recorder(connection, **kwargs):
+    """``connection_created`` receiver; wrapper lists outlive pooled reconnects."""
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+def sampled():
+    rate = getattr(settings, 'SQL_INSTRUMENTATION_SAMPLE_RATE', 0.0)
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+@contextlib.contextmanager
+def collect_queries(label):
+    """Record the queries run inside the block, including from ``sync_to_async`` threads."""
+    stats = QueryStats(label)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def query_budget(label):
+    budgets = getattr(settings, 'SQL_QUERY_BUDGETS', {})
+    return budgets.get(label, getattr(settings, 'SQL_QUERY_BUDGET_DEFAULT', None))
+
+
+def log_event(logger, event, level=logging.INFO, **fields):
+    """Log a structured event as one JSON line: ``{"event": event, **fields}``."""
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({'event': event, **fields}, default=str))
+
+
+def report(stats, **fields):
+    """Log ``stats`` as one JSON line; returns True when the unit was flagged."""
+    budget = query_budget(stats.label)
+    repeated = stats.repeated(getattr(settings, 'SQL_N_PLUS_ONE_THRESHOLD', 5))
+    over_budget = budget is not None and stats.count > budget
+    fields = {
+        'label': stats.label,
+        'queries': stats.count,
+        'db_ms': round(stats.duration * 1000, 2),
+        'budget': budget,
+        'over_budget': over_budget,
+        'repeated': [{'count': count, 'sql': shape[:500]} for shape, count in repeated],
+        **fields,
+    }
+    flagged = over_budget or bool(repeated)
+    log_event(logger, 'sql', level=logging.WARNING if flagged else logging.INFO, **fields)
+    return flagged
+
+
+def server_timing(stats, total=None):
+    """A ``Server-Timing`` header value for ``stats``."""
+    metrics = [f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"']
+    if total is not None:
+        metrics.append(f'app;dur={total * 1000:.1f}')
+    return ', '.join(metrics)
+
+
+class InstrumentedConsumerMixin:
+    """
+    Measure the queries run by each event a Channels consumer handles.
+
+    Events are labelled ``<Consumer>.<event type>``, e.g.
+    ``ChatConsumer.websocket.receive``, which is also their budget key.
+    """
+
+    async def dispatch(self, message):
+        if not sampled():
+            return await super().dispatch(message)
+        label = f"{type(self).__name__}.{message.get('type')}"
+        started = time.perf_counter()
+        with collect_queries(label) as stats:
+            try:
+                return await super().dispatch(message)
+            finally:
+                report(stats, total_ms=round((time.perf_counter() - started) * 1000, 2))
@@ -0,0 +1,436 @@
+import http.client
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import Client
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.cache import app_cache
+from chat.models import Conversation, InboxEntry, Message
+from users.models import Bid, Job, JobCategory, User
+from users.signals import JOB_CATEGORIES_TAG, WORKERS_TAG
+
+from .bench_startup import free_port
+
+# Seeded users share this email domain, so the data can be found again and removed
+BENCH_DOMAIN = 'bench.workconnect.invalid'
+
+HOST = 'localhost'
+
+# (name, user that makes the request, path); paths are formatted with the seeded ids
+SCENARIOS = (
+    ('jobs-list', 'worker', '/api/jobs/'),
+    ('jobs-search', 'worker', '/api/jobs/?search=leaking'),
+    ('workers-list', 'client', '/api/workers/'),
+    ('job-detail', 'worker', '/api/jobs/{job}/'),
+    ('job-bids', 'client', '/api/jobs/{job}/bids/'),
+    ('inbox', 'client', '/api/chat/conversations/'),
+    ('message-history', 'worker', '/api/chat/conversations/{conversation}/messages/'),
+)
+
+# Relative change that counts as a regression in --compare
+DEFAULT_THRESHOLD = 0.15
+
+
+def bench_email(name):
+    return f'{name}@{BENCH_DOMAIN}'
+
+
+def read_status_kb(pid, field):
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def reset_peak_rss(pid):
+    """Reset the kernel's peak RSS counter (Linux); a no-op elsewhere."""
+    try:
+        with open(f'/proc/{pid}/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mib(pid):
+    """Peak RSS of ``pid`` since ``reset_peak_rss``, falling back to the process lifetime peak."""
+    peak = read_status_kb(pid, 'VmHWM')
+    if peak is None and pid == os.getpid():
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024, 1) if peak is not None else None
+
+
+def summarize(latencies, errors, elapsed, peak):
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'p99_ms': round(quantiles[98] * 1000, 2),
+        'rps': round(len(latencies) / elapsed, 1),
+        'peak_rss_mib': peak,
+    }
+
+
+class InProcessTarget:
+    """Requests through Django's handler in this process, one test client per thread."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.local = threading.local()
+
+    def request(self, path, token):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client(HTTP_HOST=HOST)
+        return client.get(path, HTTP_AUTHORIZATION=f'Bearer {token}').status_code
+
+    def thread_done(self):
+        connections.close_all()
+
+    def close(self):
+        pass
+
+
+class DaphneTarget:
+    """Requests over keep-alive HTTP connections to a Daphne server started for the run."""
+
+    def __init__(self, stdout, timeout=60):
+        self.port = free_port()
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        self.server = subprocess.Popen(
+            [sys.executable, '-m', 'daphne', '-b', '127.0.0.1', '-p', str(self.port), 'workconnect.asgi:application'],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        self.pid = self.server.pid
+        self.local = threading.local()
+        started = time.perf_counter()
+        while True:
+            try:
+                self.request('/api/health/', None)
+                break
+            except OSError:
+                self.local.connection = None
+                if self.server.poll() is not None:
+                    raise CommandError(f'Daphne exited early:\n{self.server.stderr.read().decode()}')
+                if time.perf_counter() - started > timeout:
+                    self.close()
+                    raise CommandError(f'Daphne did not answer within {timeout:.0f}s')
+                time.sleep(0.05)
+        stdout.write(f'Daphne serving on 127.0.0.1:{self.port} (pid {self.pid})')
+
+    def request(self, path, token):
+        conn = getattr(self.local, 'connection', None)
+        if conn is None:
+            conn = self.local.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        headers = {'Host': HOST}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self.local.connection = None
+            raise
+        return response.status
+
+    def thread_done(self):
+        conn = getattr(self.local, 'connection', None)
+        if conn is not None:
+            conn.close()
+
+    def close(self):
+        self.server.terminate()
+        try:
+            self.server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.server.kill()
+            self.server.wait()
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the hot read endpoints (jobs, workers, bids, inbox, message history) '
+        'against seeded data: p50/p99 latency, requests per second and peak RSS per endpoint. '
+        'Results can be saved as a JSON baseline and compared against one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=['inprocess', 'daphne'], default='inprocess',
+                            help='Drive Django in this process, or a Daphne server started for the run')
+        parser.add_argument('--seed', action='store_true', help='Seed the benchmark dataset if it is missing')
+        parser.add_argument('--reseed', action='store_true', help='Remove the benchmark dataset and seed it again')
+        parser.add_argument('--flush', action='store_true', help='Remove the benchmark dataset and exit')
+        parser.add_argument('--scale', type=int, default=1000,
+                            help='Workers, jobs and messages to seed; bids and conversations are a tenth of this')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--only', nargs='+', metavar='ENDPOINT', choices=[name for name, _, _ in SCENARIOS],
+                            help='Endpoints to run (default: all)')
+        parser.add_argument('--save', metavar='PATH', help='Write the results to PATH as a JSON baseline')
+        parser.add_argument('--compare', metavar='PATH', help='Compare against a baseline and fail on regressions')
+        parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help='Relative slowdown (p50, p99) or throughput drop that counts as a regression')
+        parser.add_argument('--force', action='store_true', help='Allow seeding with DEBUG off')
+
+    def handle(self, *args, **options):
+        if options['flush'] or options['reseed']:
+            self.check_can_write(options)
+            self.flush()
+            if options['flush']:
+                return
+        data = self.load()
+        if data is None:
+            if not (options['seed'] or options['reseed']):
+                raise CommandError('No benchmark data; run with --seed first')
+            self.check_can_write(options)
+            data = self.seed(options['scale'])
+
+        tokens = {role: str(RefreshToken.for_user(user).access_token) for role, user in data['users'].items()}
+        scenarios = [scenario for scenario in SCENARIOS if not options['only'] or scenario[0] in options['only']]
+
+        target = DaphneTarget(self.stdout) if options['target'] == 'daphne' else InProcessTarget()
+        results = {}
+        try:
+            for name, role, path in scenarios:
+                path = path.format(**data['ids'])
+                results[name] = self.run_scenario(target, path, tokens[role], options)
+                self.stdout.write(self.format_result(name, results[name]))
+        finally:
+            target.close()
+
+        report = {
+            'meta': {
+                'target': options['target'],
+                'scale': data['scale'],
+                'concurrency': options['concurrency'],
+                'requests': options['requests'],
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            },
+            'results': results,
+        }
+        if options['save']:
+            with open(options['save'], 'w') as baseline:
+                json.dump(report, baseline, indent=2, sort_keys=True)
+                baseline.write('\n')
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {options["save"]}'))
+        if options['compare']:
+            self.compare(report, options['compare'], options['threshold'])
+
+    def check_can_write(self, options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('Refusing to write benchmark data with DEBUG off; pass --force if this is not production')
+
+    # Dataset
+
+    def load(self):
+        client = User.objects.filter(email=bench_email('client')).first()
+        if client is None:
+            return None
+        worker = User.objects.get(email=bench_email('worker'))
+        job = Job.objects.filter(client=client, bids__isnull=False).distinct().first()
+        conversation = Conversation.objects.filter(participants=worker).filter(participants=client).first()
+        return {
+            'scale': User.objects.filter(email__endswith=f'@{BENCH_DOMAIN}', role='worker').count() - 1,
+            'users': {'client': client, 'worker': worker},
+            'ids': {'job': job.pk, 'conversation': conversation.pk},
+        }
+
+    def flush(self):
+        users = User.objects.filter(email__endswith=f'@{BENCH_DOMAIN}')
+        with transaction.atomic():
+            Conversation.objects.filter(participants__in=users).delete()
+            deleted = users.delete()[0]
+            JobCategory.objects.filter(slug='bench').delete()
+        app_cache.invalidate_tags(WORKERS_TAG, JOB_CATEGORIES_TAG)
+        self.stdout.write(f'Removed benchmark data ({deleted} rows)')
+
+    @transaction.atomic
+    def seed(self, scale):
+        """Seed ``scale`` workers, jobs and hot-conversation messages, plus ``scale // 10`` bids and conversations."""
+        started = time.perf_counter()
+        fanout = max(1, scale // 10)
+        category, _ = JobCategory.objects.get_or_create(slug='bench', defaults={'name': 'Benchmark'})
+        client = User.objects.create(email=bench_email('client'), first_name='Bench', last_name='Client', role='client')
+        worker = User.objects.create(email=bench_email('worker'), first_name='Bench', last_name='Worker', role='worker')
+        workers = User.objects.bulk_create([
+            User(
+                email=bench_email(f'worker-{i}'),
+                first_name='Worker',
+                last_name=str(i),
+                role='worker',
+                skills=['plumbing', 'pipes'] if i % 2 else ['painting', 'interior'],
+                address=f'{i} Main St, Springfield',
+                years_of_experience=i % 20,
+                password='!',
+            )
+            for i in range(scale)
+        ])
+
+        jobs = Job.objects.bulk_create([
+            Job(
+                client=client,
+                title=f'Fix a leaking sink #{i}' if i % 4 == 0 else f'Paint the fence #{i}',
+                category=category,
+                description='Benchmark job. ' * 20,
+                address=f'{i} Main St',
+                city='Springfield',
+                budget=Decimal(100 + i % 400),
+                status='open',
+            )
+            for i in range(scale)
+        ])
+        job = jobs[0]
+        Bid.objects.bulk_create([
+            Bid(job=job, worker=bidder, price=Decimal(90 + i % 50), availability='Within 1 week', proposal='I can do this. ' * 10)
+            for i, bidder in enumerate(workers[:fanout])
+        ])
+
+        conversations = Conversation.objects.bulk_create([Conversation() for _ in range(fanout)])
+        pairs = [(conversations[0], worker)] + list(zip(conversations[1:], workers))
+        Conversation.participants.through.objects.bulk_create([
+            Conversation.participants.through(conversation=conversation, user=user)
+            for conversation, other in pairs for user in (client, other)
+        ])
+        InboxEntry.objects.bulk_create([
+            InboxEntry(conversation=conversation, user=user)
+            for conversation, other in pairs for user in (client, other)
+        ])
+        hot = conversations[0]
+        messages = Message.objects.bulk_create([
+            Message(conversation=hot, sender=worker if i % 2 else client, content=f'Message {i} about the sink', seq=i + 1)
+            for i in range(scale)
+        ] + [
+            Message(conversation=conversation, sender=other, content='Hello', seq=1)
+            for conversation, other in pairs[1:]
+        ])
+        hot.last_message, hot.last_seq = messages[scale - 1], scale
+        last_messages = dict(zip(conversations[1:], messages[scale:]))
+        for conversation in conversations[1:]:
+            conversation.last_message, conversation.last_seq = last_messages[conversation], 1
+        Conversation.objects.bulk_update(conversations, ['last_message', 'last_seq'])
+
+        # bulk_create skips the signals that invalidate cached lists
+        transaction.on_commit(lambda: app_cache.invalidate_tags(WORKERS_TAG, JOB_CATEGORIES_TAG))
+        self.stdout.write(f'Seeded benchmark data at scale {scale} in {time.perf_counter() - started:.1f}s')
+        return {
+            'scale': scale,
+            'users': {'client': client, 'worker': worker},
+            'ids': {'job': job.pk, 'conversation': hot.pk},
+        }
+
+    # Measurement
+
+    def run_scenario(self, target, path, token, options):
+        for _ in range(options['warmup']):
+            target.request(path, token)
+        target.thread_done()
+
+        total = options['requests']
+        lock = threading.Lock()
+        latencies, failures = [], []
+        issued = iter(range(total))
+
+        def client():
+            try:
+                while True:
+                    with lock:
+                        if next(issued, None) is None:
+                            return
+                    started = time.perf_counter()
+                    try:
+                        status = target.request(path, token)
+                    except Exception as exc:
+                        status = repr(exc)
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        if not isinstance(status, int) or status >= 400:
+                            failures.append(status)
+            finally:
+                target.thread_done()
+
+        reset_peak_rss(target.pid)
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client) for _ in range(max(1, options['concurrency']))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if failures:
+            self.stderr.write(f'  {path}: {len(failures)} failed requests, e.g. {failures[0]}')
+        return summarize(latencies, len(failures), elapsed, peak_rss_mib(target.pid))
+
+    def format_result(self, name, result):
+        peak = f'{result["peak_rss_mib"]:.0f} MiB' if result['peak_rss_mib'] is not None else 'n/a'
+        errors = f', {result["errors"]} errors' if result['errors'] else ''
+        return (
+            f'{name:16} p50 {result["p50_ms"]:8.1f} ms  p99 {result["p99_ms"]:8.1f} ms  '
+            f'{result["rps"]:8.1f} req/s  peak RSS {peak}{errors}'
+        )
+
+    def compare(self, report, path, threshold):
+        try:
+            with open(path) as baseline_file:
+                baseline = json.load(baseline_file)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read baseline {path}: {exc}')
+
+        different = [
+            key for key in ('target', 'scale', 'concurrency', 'database')
+            if baseline['meta'].get(key) != report['meta'][key]
+        ]
+        if different:
+            self.stdout.write(self.style.WARNING(
+                f'Baseline was recorded with different {", ".join(different)}; comparison may be misleading'
+            ))
+
+        regressions = []
+        self.stdout.write(f'Compared with {path} (threshold {threshold:.0%}):')
+        for name, result in report['results'].items():
+            before = baseline['results'].get(name)
+            if before is None:
+                self.stdout.write(f'  {name:16} not in baseline')
+                continue
+            changes = []
+            for key, higher_is_worse in (('p50_ms', True), ('p99_ms', True), ('rps', False)):
+                if not before[key]:
+                    continue
+                change = (result[key] - before[key]) / before[key]
+                regressed = change > threshold if higher_is_worse else change < -threshold
+                changes.append(f'{key} {before[key]} -> {result[key]} ({change:+.0%}){" REGRESSION" if regressed else ""}')
+                if regressed:
+                    regressions.append(f'{name} {key}')
+            if result['errors'] > before.get('errors', 0):
+                changes.append(f'errors {before.get("errors", 0)} -> {result["errors"]} REGRESSION')
+                regressions.append(f'{name} errors')
+            self.stdout.write(f'  {name:16} ' + ', '.join(changes))
+
+        if regressions:
+            raise CommandError(f'Regressions against {path}: {", ".join(regressions)}')
+        self.stdout.write(self.style.SUCCESS('No regressions'))
@@ -0,0 +1,105 @@
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Django loads the URLconf lazily on the first request; time it separately
+IMPORT_SNIPPET = (
+    'import time; started = time.perf_counter(); '
+    'import workconnect.asgi; '
+    'imported = time.perf_counter(); '
+    'from django.urls import get_resolver; get_resolver().url_patterns; '
+    'print(imported - started, time.perf_counter() - imported)'
+)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure ASGI cold start: time to import workconnect.asgi, and time from launching '
+        'Daphne to its first HTTP response'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Cold starts to measure')
+        parser.add_argument('--path', default='/api/health/', help='URL requested once the server is up')
+        parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait for the first response')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        imports, urlconfs, first_responses = [], [], []
+        for run in range(1, options['runs'] + 1):
+            imported, urlconf = self.measure_import(env)
+            imports.append(imported)
+            urlconfs.append(urlconf)
+            elapsed, status = self.measure_first_response(env, options['path'], options['timeout'])
+            first_responses.append(elapsed)
+            self.stdout.write(
+                f'  run {run}: import {imported * 1000:.0f} ms, URLconf {urlconf * 1000:.0f} ms, '
+                f'first response {elapsed * 1000:.0f} ms (HTTP {status})'
+            )
+
+        for label, values in (
+            ('import workconnect.asgi', imports),
+            ('load URLconf', urlconfs),
+            ('time to first response', first_responses),
+        ):
+            self.stdout.write(
+                f'{label}: median {statistics.median(values) * 1000:.0f} ms, '
+                f'min {min(values) * 1000:.0f} ms, max {max(values) * 1000:.0f} ms'
+            )
+
+    def measure_import(self, env):
+        result = subprocess.run(
+            [sys.executable, '-c', IMPORT_SNIPPET],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        if result.returncode:
+            raise CommandError(f'Importing workconnect.asgi failed:\n{result.stderr}')
+        imported, urlconf = result.stdout.strip().splitlines()[-1].split()
+        return float(imported), float(urlconf)
+
+    def measure_first_response(self, env, path, timeout):
+        port = free_port()
+        url = f'http://127.0.0.1:{port}{path}'
+        started = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'daphne', '-b', '127.0.0.1', '-p', str(port), 'workconnect.asgi:application'],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+        )
+        try:
+            while True:
+                try:
+                    with urllib.request.urlopen(url, timeout=timeout) as response:
+                        status = response.status
+                    break
+                except urllib.error.HTTPError as exc:
+                    # Any HTTP response means the app is serving
+                    status = exc.code
+                    break
+                except (urllib.error.URLError, ConnectionError):
+                    if server.poll() is not None:
+                        raise CommandError(f'Daphne exited early:\n{server.stderr.read().decode()}')
+                    if time.perf_counter() - started > timeout:
+                        raise CommandError(f'No response from {url} after {timeout:.0f}s')
+                    time.sleep(0.01)
+            return time.perf_counter() - started, status
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
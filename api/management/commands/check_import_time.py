@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# SDKs that are imported lazily by the code that needs them; loading any of
+# them during startup is a regression
+DEFERRED_MODULES = ('stripe', 'google.generativeai', 'google.oauth2')
+
+MARKER = '--urlconf--'
+
+SNIPPET = (
+    'import sys, time, resource, django; '
+    'django.setup(); '
+    f'sys.stderr.write({MARKER!r} + "\\n"); '
+    'started = time.perf_counter(); '
+    'from django.urls import get_resolver; get_resolver().url_patterns; '
+    'print(time.perf_counter() - started, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)'
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Fail if loading the URLconf (what a worker does before serving its first request) '
+        'takes longer than a budget, or pulls in SDKs that should be imported lazily'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--budget-ms',
+            type=float,
+            default=None,
+            help='URLconf import budget (default: URLCONF_IMPORT_BUDGET_MS)'
+        )
+        parser.add_argument('--runs', type=int, default=3, help='Cold imports to measure; the fastest is compared')
+        parser.add_argument('--top', type=int, default=10, help='Slowest top-level imports to list')
+
+    def handle(self, *args, **options):
+        budget = options['budget_ms'] or getattr(settings, 'URLCONF_IMPORT_BUDGET_MS', 500)
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+
+        runs = [self.measure(env) for _ in range(max(1, options['runs']))]
+        elapsed, max_rss, imports, loaded = min(runs, key=lambda run: run[0])
+
+        self.stdout.write(f'URLconf import: {elapsed * 1000:.0f} ms (budget {budget:.0f} ms), max RSS {max_rss / 1024:.0f} MiB')
+        self.stdout.write('Slowest top-level imports while loading the URLconf:')
+        for module, cumulative in sorted(imports, key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'  {cumulative / 1000:8.1f} ms  {module}')
+
+        failures = []
+        deferred = [name for name in DEFERRED_MODULES if name in loaded]
+        if deferred:
+            failures.append(f'imported at startup but should be lazy: {", ".join(deferred)}')
+        if elapsed * 1000 > budget:
+            failures.append(f'URLconf import took {elapsed * 1000:.0f} ms, over the {budget:.0f} ms budget')
+        if failures:
+            raise CommandError('; '.join(failures))
+        self.stdout.write(self.style.SUCCESS('Import time within budget'))
+
+    def measure(self, env):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', SNIPPET],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        if result.returncode:
+            raise CommandError(f'Loading the URLconf failed:\n{result.stderr[-2000:]}')
+        elapsed, max_rss = result.stdout.split()
+
+        loaded, top_level, after_marker = set(), [], False
+        for line in result.stderr.splitlines():
+            if line == MARKER:
+                after_marker = True
+                continue
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            _, cumulative, name = line.split('|', 2)
+            loaded.add(name.strip())
+            # Two spaces of indentation per nesting level; unindented lines are top-level imports
+            if after_marker and not name[1:].startswith(' '):
+                top_level.append((name.strip(), int(cumulative)))
+        return float(elapsed), int(max_rss), top_level, loaded
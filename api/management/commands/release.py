@@ -0,0 +1,101 @@
+import time
+from contextlib import contextmanager
+
+from decouple import config
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+# Arbitrary, but fixed: every release process must ask for the same lock
+RELEASE_LOCK_ID = 0x574f524b
+
+
+class Command(BaseCommand):
+    help = (
+        'Release phase: wait for the database, apply migrations and bootstrap the superuser. '
+        'Run once per deploy, before starting the servers; concurrent runs are serialized '
+        'with a Postgres advisory lock.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database to release against')
+        parser.add_argument('--wait', type=float, default=60, help='Seconds to wait for the database to accept connections')
+        parser.add_argument('--lock-timeout', type=float, default=600, help='Seconds to wait for another release to finish')
+        parser.add_argument('--collectstatic', action='store_true', help='Also collect static files')
+        parser.add_argument('--skip-superuser', action='store_true', help='Do not create the initial superuser')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        started = time.perf_counter()
+        self.wait_for_db(connection, options['wait'])
+
+        with self.release_lock(connection, options['lock_timeout']):
+            call_command('migrate', database=options['database'], interactive=False, verbosity=options['verbosity'])
+            if not options['skip_superuser']:
+                self.ensure_superuser(options['database'])
+
+        if options['collectstatic']:
+            call_command('collectstatic', interactive=False, verbosity=options['verbosity'])
+
+        self.stdout.write(self.style.SUCCESS(f'Release finished in {time.perf_counter() - started:.1f}s'))
+
+    def wait_for_db(self, connection, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                connection.ensure_connection()
+                return
+            except OperationalError as exc:
+                if time.monotonic() >= deadline:
+                    raise CommandError(f'Database unavailable after {timeout:.0f}s: {exc}')
+                self.stdout.write('Waiting for database...')
+                time.sleep(2)
+
+    @contextmanager
+    def release_lock(self, connection, timeout):
+        """
+        Hold a session-level advisory lock for the duration of the release.
+
+        Only Postgres is shared between deploy processes here; other backends
+        are local development databases and run unlocked.
+        """
+        if connection.vendor != 'postgresql':
+            yield
+            return
+
+        deadline = time.monotonic() + timeout
+        waiting = False
+        with connection.cursor() as cursor:
+            while True:
+                cursor.execute('SELECT pg_try_advisory_lock(%s)', [RELEASE_LOCK_ID])
+                if cursor.fetchone()[0]:
+                    break
+                if time.monotonic() >= deadline:
+                    raise CommandError(f'Another release still holds the lock after {timeout:.0f}s')
+                if not waiting:
+                    self.stdout.write('Another release is running; waiting for it to finish...')
+                    waiting = True
+                time.sleep(1)
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [RELEASE_LOCK_ID])
+
+    def ensure_superuser(self, database):
+        User = get_user_model()
+        if User.objects.using(database).filter(is_superuser=True).exists():
+            self.stdout.write('Superuser already exists.')
+            return
+
+        # Same variables as ``createsuperuser --noinput``
+        email = config('DJANGO_SUPERUSER_EMAIL', default='admin@workconnect.com')
+        password = config('DJANGO_SUPERUSER_PASSWORD', default='')
+        if not password:
+            self.stdout.write(self.style.WARNING(
+                'No superuser exists; set DJANGO_SUPERUSER_PASSWORD (and DJANGO_SUPERUSER_EMAIL) to create one.'
+            ))
+            return
+        User.objects.db_manager(database).create_superuser(email, password)
+        self.stdout.write(self.style.SUCCESS(f'Superuser {email} created.'))
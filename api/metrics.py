@@ -0,0 +1,282 @@
+"""
+In-process metrics in the Prometheus text format, served at ``/metrics``.
+
+Hot paths only touch ``Counter``, ``Gauge`` and ``Histogram`` objects: a dict
+lookup and an addition under a lock, with no I/O. Stats the app already keeps
+elsewhere (the two-tier cache, the database pools, the outbound WebSocket
+queues) are read by collectors when the endpoint is scraped, so they cost
+nothing between scrapes.
+
+Every process keeps its own numbers, like ``pool_stats`` and
+``outbound_stats``; scrape each worker, or sum them in the query.
+"""
+import bisect
+import contextlib
+import math
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_metrics = {}
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Metric:
+    """A named metric with a fixed set of label names."""
+
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f'{self.name} takes labels {self.label_names}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self):
+        """``(suffix, label names, label values, value)`` for every series."""
+        with self._lock:
+            items = list(self._values.items())
+        return [('', self.label_names, key, value) for key, value in sorted(items)]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Observations counted into ``buckets`` (upper bounds, in seconds for latencies)."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then the sum
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._values.items()]
+        names = self.label_names + ('le',)
+        samples = []
+        for key, series in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                samples.append(('_bucket', names, key + (format_value(float(bound)),), cumulative))
+            samples.append(('_sum', self.label_names, key, series[-1]))
+            samples.append(('_count', self.label_names, key, cumulative))
+        return samples
+
+
+def _register(cls, name, help, labels=(), **kwargs):
+    with _registry_lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = cls(name, help, labels, **kwargs)
+        elif not isinstance(metric, cls) or metric.label_names != tuple(labels):
+            raise ValueError(f'Metric {name} is already registered with a different type or labels')
+        return metric
+
+
+def counter(name, help, labels=()):
+    """The process-wide ``Counter`` called ``name``, created on first use."""
+    return _register(Counter, name, help, labels)
+
+
+def gauge(name, help, labels=()):
+    return _register(Gauge, name, help, labels)
+
+
+def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram, name, help, labels, buckets=buckets)
+
+
+def register_collector(collect):
+    """
+    Add a scrape-time collector.
+
+    ``collect()`` returns ``(name, type, help, samples)`` tuples where
+    ``samples`` is a list of ``(labels dict, value)``.
+    """
+    with _registry_lock:
+        if collect not in _collectors:
+            _collectors.append(collect)
+
+
+def render():
+    """Every metric and collector in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = sorted(_metrics.values(), key=lambda metric: metric.name)
+        collectors = list(_collectors)
+
+    lines = []
+    for metric in metrics:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for suffix, names, values, value in metric.samples():
+            lines.append(f'{metric.name}{suffix}{format_labels(names, values)} {format_value(value)}')
+
+    for collect in collectors:
+        for name, type, help, samples in collect():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {type}')
+            for labels, value in samples:
+                lines.append(f'{name}{format_labels(tuple(labels), tuple(labels.values()))} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+http_request_duration = histogram(
+    'http_request_duration_seconds',
+    'Time to produce a response, by URL name.',
+    ('view', 'method', 'status'),
+)
+websocket_connections = gauge(
+    'websocket_connections',
+    'Open WebSocket connections, by consumer.',
+    ('consumer',),
+)
+channel_layer_send_duration = histogram(
+    'channel_layer_group_send_seconds',
+    'Channel layer group_send and group_send_bulk latency.',
+    ('method',),
+)
+external_call_duration = histogram(
+    'external_call_duration_seconds',
+    'Latency of calls to third-party APIs.',
+    ('service', 'operation'),
+)
+external_call_errors = counter(
+    'external_call_errors_total',
+    'Third-party API calls that raised.',
+    ('service', 'operation'),
+)
+
+
+@contextlib.contextmanager
+def track_call(service, operation):
+    """
+    Time a third-party call and count it as an error if it raises.
+
+    Works as a context manager or a decorator::
+
+        @track_call('stripe', 'create_customer')
+        def create_customer(user): ...
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        external_call_errors.inc(service=service, operation=operation)
+        raise
+    finally:
+        external_call_duration.observe(time.perf_counter() - started, service=service, operation=operation)
+
+
+def collect_cache():
+    from .cache import cache_stats
+
+    stats = cache_stats()
+    return [
+        ('app_cache_hits_total', 'counter', 'Two-tier cache hits, by tier.',
+         [({'tier': 'l1'}, stats['l1_hits']), ({'tier': 'l2'}, stats['l2_hits'])]),
+        ('app_cache_misses_total', 'counter', 'Two-tier cache misses.', [({}, stats['misses'])]),
+        ('app_cache_sets_total', 'counter', 'Two-tier cache writes.', [({}, stats['sets'])]),
+        ('app_cache_invalidations_total', 'counter', 'Cache tag invalidations.', [({}, stats['invalidations'])]),
+        ('app_cache_l1_evictions_total', 'counter', 'Entries evicted from the in-process tier.', [({}, stats['l1_evictions'])]),
+        ('app_cache_l1_entries', 'gauge', 'Entries in the in-process tier.', [({}, stats['l1_entries'])]),
+        ('app_cache_hit_ratio', 'gauge', 'Hits over lookups since the process started.', [({}, stats['hit_ratio'])]),
+    ]
+
+
+def collect_db_pools():
+    from workconnect.db.pool import pool_stats
+
+    pools = pool_stats()
+
+    def per_alias(key):
+        return [({'alias': alias}, stats[key]) for alias, stats in sorted(pools.items())]
+
+    connections = []
+    for alias, stats in sorted(pools.items()):
+        connections.append(({'alias': alias, 'state': 'idle'}, stats['idle']))
+        connections.append(({'alias': alias, 'state': 'in_use'}, stats['in_use']))
+    return [
+        ('db_pool_connections', 'gauge', 'Pooled connections, by state.', connections),
+        ('db_pool_max_size', 'gauge', 'Connection pool capacity.', per_alias('max_size')),
+        ('db_pool_checkouts_total', 'counter', 'Connections checked out of the pool.', per_alias('checkouts')),
+        ('db_pool_waits_total', 'counter', 'Checkouts that found the pool exhausted.', per_alias('waits')),
+        ('db_pool_timeouts_total', 'counter', 'Checkouts that gave up waiting.', per_alias('timeouts')),
+        ('db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a connection.', per_alias('wait_seconds_total')),
+    ]
@@ -0,0 +1,68 @@
+import time
+
+from .instrumentation import collect_queries, report, sampled, server_timing
+from .metrics import http_request_duration
+
+
+class SQLInstrumentationMiddleware:
+    """
+    Measure the SQL run by a sampled fraction of requests.
+
+    Sampled responses carry a ``Server-Timing`` header (DB time and query
+    count, plus total time) and are logged by ``api.instrumentation.report``,
+    keyed by URL name so they can be matched against ``SQL_QUERY_BUDGETS``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not sampled():
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with collect_queries(request.path) as stats:
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        if match is not None and match.view_name:
+            stats.label = match.view_name
+        report(
+            stats,
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+            total_ms=round(total * 1000, 2),
+        )
+
+        timing = server_timing(stats, total)
+        if response.has_header('Server-Timing'):
+            timing = f"{response['Server-Timing']}, {timing}"
+        response['Server-Timing'] = timing
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Record every response in the ``http_request_duration_seconds`` histogram.
+
+    Requests are labelled by URL name rather than path so that IDs in the path
+    do not create a series each; anything that did not resolve (static files,
+    404s) is ``unmatched``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        http_request_duration.observe(
+            time.perf_counter() - started,
+            view=match.view_name if match is not None and match.view_name else 'unmatched',
+            method=request.method,
+            status=response.status_code,
+        )
+        return response
@@ -0,0 +1,99 @@
+"""
+Query-count assertions for API tests.
+
+``QueryBudgetMixin.assertQueriesConstant`` runs a request against seeded data
+of growing size (``query_sizes``) and fails if the number of queries grows
+with it. The failure message lists the query shapes that grew, which for a
+list endpoint is almost always a per-row query in a serializer.
+``assertMaxQueries`` checks a plain budget for endpoints whose cost does not
+depend on a row count.
+
+``get_routes`` lists the GET routes of a URLconf so a suite can check it
+covers all of them.
+
+Queries are counted with ``api.instrumentation``, so every database alias is
+included, not just ``default``.
+"""
+from django.core.cache import cache
+from django.urls import URLPattern, URLResolver
+
+from .cache import app_cache
+from .instrumentation import collect_queries
+
+DEFAULT_SIZES = (10, 100, 1000)
+
+
+def get_routes(urlpatterns):
+    """Names of the routes in ``urlpatterns`` (recursively) that answer GET."""
+    names = set()
+    for pattern in urlpatterns:
+        if isinstance(pattern, URLResolver):
+            names |= get_routes(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            callback = pattern.callback
+            actions = getattr(callback, 'actions', None)
+            view_class = getattr(callback, 'cls', None) or getattr(callback, 'view_class', None)
+            if actions is not None:
+                allows_get = 'get' in actions
+            else:
+                allows_get = view_class is not None and hasattr(view_class, 'get')
+            if allows_get:
+                names.add(pattern.name)
+    return names
+
+
+def format_shapes(shapes, before=None):
+    lines = []
+    for shape, count in shapes.most_common():
+        previous = before[shape] if before is not None else None
+        if previous is not None and count <= previous:
+            continue
+        growth = f'{previous} -> {count}' if previous is not None else str(count)
+        lines.append(f'  {growth:>12}x  {shape}')
+    return '\n'.join(lines)
+
+
+class QueryBudgetMixin:
+    """Mixin for ``TestCase`` classes; see the module docstring."""
+
+    query_sizes = DEFAULT_SIZES
+
+    def measure(self, request, status=200):
+        """Run ``request()`` with empty caches; return its ``QueryStats``."""
+        # Seeding bypasses the signals that invalidate cached responses
+        cache.clear()
+        app_cache.clear_local()
+        with collect_queries('test') as stats:
+            response = request()
+        self.assertEqual(
+            response.status_code, status,
+            f'Unexpected status {response.status_code}: {getattr(response, "data", response.content)!r}'
+        )
+        return stats
+
+    def assertQueriesConstant(self, request, seed, sizes=None, status=200):
+        """
+        Assert ``request()`` runs the same number of queries for every size.
+
+        ``seed(n)`` is called with each size in increasing order and must leave
+        n rows of whatever the endpoint lists; it may add only the difference.
+        """
+        runs = []
+        for size in sizes or self.query_sizes:
+            seed(size)
+            runs.append((size, self.measure(request, status)))
+
+        (_, first), (_, last) = runs[0], runs[-1]
+        if any(stats.count != first.count for _, stats in runs):
+            counts = ', '.join(f'{stats.count} at N={size}' for size, stats in runs)
+            self.fail(
+                f'Query count grows with N ({counts}); shapes that grew:\n'
+                f'{format_shapes(last.shapes, first.shapes)}'
+            )
+        return first.count
+
+    def assertMaxQueries(self, budget, request, status=200):
+        stats = self.measure(request, status)
+        if stats.count > budget:
+            self.fail(f'{stats.count} queries, over the budget of {budget}:\n{format_shapes(stats.shapes)}')
+        return stats.count
@@ -2,12 +2,16 @@ from django.shortcuts import render
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
-from google.oauth2 import id_token
-from google.auth.transport import requests
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+import hmac
 import json
 
+from . import metrics as app_metrics
+
 User = get_user_model()
 
 # Create your views here.
@@ -16,6 +20,23 @@ User = get_user_model()
 def health_check(request):
     return Response({'status': 'healthy', 'message': 'WorkConnect API is running'})
 
+@require_GET
+def metrics(request):
+    """
+    Prometheus scrape endpoint for this process.
+
+    Requires ``Authorization: Bearer <METRICS_TOKEN>``. Without a token
+    configured it is only served when DEBUG is on.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            return HttpResponse('Unauthorized', status=401, headers={'WWW-Authenticate': 'Bearer'})
+    elif not settings.DEBUG:
+        raise Http404
+    return HttpResponse(app_metrics.render(), content_type=app_metrics.CONTENT_TYPE)
+
 @api_view(['POST'])
 def google_login(request):
     """
@@ -33,6 +54,10 @@ def google_login(request):
         
         # Verify the ID token with Google
         try:
+            # google-auth is only needed here; keep it out of worker startup
+            from google.oauth2 import id_token
+            from google.auth.transport import requests
+            
             # You should replace this with your actual Google Client ID
             CLIENT_ID = "your-google-client-id.apps.googleusercontent.com"
             idinfo = id_token.verify_oauth2_token(
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Conversation, Message, UserPresence, MessageReadStatus
+from .models import ArchivedMessageBlock, Conversation, Message, UserPresence, MessageReadStatus
 
 
 @admin.register(Conversation)
@@ -41,3 +41,11 @@ class MessageReadStatusAdmin(admin.ModelAdmin):
     list_filter = ['read_at']
     search_fields = ['message__content', 'user__email']
     readonly_fields = ['read_at']
+
+
+@admin.register(ArchivedMessageBlock)
+class ArchivedMessageBlockAdmin(admin.ModelAdmin):
+    list_display = ['conversation', 'month', 'first_seq', 'last_seq', 'message_count', 'codec', 'created_at']
+    list_filter = ['month', 'codec']
+    exclude = ['payload']
+    readonly_fields = ['conversation', 'month', 'first_seq', 'last_seq', 'message_count', 'codec', 'created_at']
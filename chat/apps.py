@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
+
+    def ready(self):
+        from api.metrics import register_collector
+
+        from . import signals  # noqa: F401
+        from .outbound import collect_outbound
+
+        register_collector(collect_outbound)
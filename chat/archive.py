@@ -0,0 +1,169 @@
+"""
+Cold archival of old chat messages and transparent history reads.
+
+Messages older than the horizon are grouped per conversation and calendar
+month, serialized as JSON lines, compressed (zstd when the ``zstandard``
+package is installed, zlib otherwise) and stored as ``ArchivedMessageBlock``
+rows. The hot rows are then deleted in the same transaction.
+"""
+import json
+import zlib
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Sum
+from django.utils.dateparse import parse_datetime
+
+from .models import ArchivedMessageBlock, Conversation, Message
+
+User = get_user_model()
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+
+def compress(data):
+    if ZSTD_AVAILABLE:
+        return 'zstd', zstandard.ZstdCompressor(level=10).compress(data)
+    return 'zlib', zlib.compress(data, 9)
+
+
+def decompress(codec, data):
+    data = bytes(data)
+    if codec == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise ImportError("zstandard package is required to read zstd archive blocks")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def encode_messages(messages):
+    lines = []
+    for message in messages:
+        lines.append(json.dumps({
+            'id': str(message.id),
+            'seq': message.seq,
+            'sender_id': message.sender_id,
+            'content': message.content,
+            'message_type': message.message_type,
+            'file_attachment': message.file_attachment.name or None,
+            'is_read': message.is_read,
+            'created_at': message.created_at.isoformat(),
+            'updated_at': message.updated_at.isoformat(),
+        }, separators=(',', ':')))
+    return '\n'.join(lines).encode('utf-8')
+
+
+def decode_block(block):
+    """Unsaved ``Message`` instances for a block, oldest first."""
+    messages = []
+    for line in decompress(block.codec, block.payload).decode('utf-8').splitlines():
+        record = json.loads(line)
+        message = Message(
+            id=record['id'],
+            conversation_id=block.conversation_id,
+            seq=record['seq'],
+            sender_id=record['sender_id'],
+            content=record['content'],
+            message_type=record['message_type'],
+            file_attachment=record['file_attachment'],
+            is_read=record['is_read'],
+        )
+        message.created_at = parse_datetime(record['created_at'])
+        message.updated_at = parse_datetime(record['updated_at'])
+        messages.append(message)
+    return messages
+
+
+def archive_conversation(conversation_id, cutoff, batch_size=5000):
+    """
+    Move messages sent before ``cutoff`` into monthly archive blocks.
+
+    The conversation's ``last_message`` is never archived so inbox previews
+    keep working. Returns the number of messages archived.
+    """
+    last_message_id = Conversation.objects.filter(pk=conversation_id).values_list('last_message_id', flat=True).first()
+    archived = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Message.objects.select_for_update()
+                .filter(conversation_id=conversation_id, created_at__lt=cutoff)
+                .exclude(id=last_message_id)
+                .order_by('seq')[:batch_size]
+            )
+            if not batch:
+                return archived
+
+            months = {}
+            for message in batch:
+                month = message.created_at.date().replace(day=1)
+                months.setdefault(month, []).append(message)
+
+            blocks = []
+            for month, messages in months.items():
+                codec, payload = compress(encode_messages(messages))
+                blocks.append(ArchivedMessageBlock(
+                    conversation_id=conversation_id,
+                    month=month,
+                    first_seq=messages[0].seq,
+                    last_seq=messages[-1].seq,
+                    message_count=len(messages),
+                    codec=codec,
+                    payload=payload,
+                ))
+            ArchivedMessageBlock.objects.bulk_create(blocks)
+            Message.objects.filter(id__in=[message.id for message in batch]).delete()
+            archived += len(batch)
+
+
+def archived_count(conversation_id):
+    return ArchivedMessageBlock.objects.filter(
+        conversation_id=conversation_id
+    ).aggregate(total=Sum('message_count'))['total'] or 0
+
+
+def conversation_history(conversation, offset, limit):
+    """
+    One page of a conversation's messages, newest first, across hot and cold storage.
+
+    Returns ``(messages, total)``. Archived blocks are only fetched and
+    decompressed when the page reaches past the hot messages.
+    """
+    hot = conversation.messages.select_related('sender').order_by('-created_at')
+    messages = list(hot[offset:offset + limit])
+    hot_total = conversation.messages.count()
+    cold_total = archived_count(conversation.id)
+    if len(messages) == limit or not cold_total:
+        return messages, hot_total + cold_total
+
+    # Walk block sizes (newest first) to find the blocks covering the page
+    cold_offset = max(0, offset - hot_total)
+    needed = limit - len(messages)
+    block_ids, skipped, covered = [], 0, 0
+    for block_id, count in ArchivedMessageBlock.objects.filter(
+        conversation_id=conversation.id
+    ).order_by('-last_seq').values_list('id', 'message_count'):
+        if skipped + count <= cold_offset and not block_ids:
+            skipped += count
+            continue
+        block_ids.append(block_id)
+        covered += count
+        if skipped + covered >= cold_offset + needed:
+            break
+
+    cold = []
+    for block in ArchivedMessageBlock.objects.filter(id__in=block_ids):
+        cold.extend(decode_block(block))
+    cold.sort(key=lambda message: message.seq, reverse=True)
+    start = cold_offset - skipped
+    cold = cold[start:start + needed]
+
+    senders = User.objects.in_bulk({message.sender_id for message in cold})
+    cold = [message for message in cold if message.sender_id in senders]
+    for message in cold:
+        message.sender = senders[message.sender_id]
+    return messages + cold, hot_total + cold_total
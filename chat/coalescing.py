@@ -0,0 +1,111 @@
+"""
+Per-connection coalescing of chatty client events (typing, read receipts).
+"""
+import asyncio
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class TypingCoalescer:
+    """
+    Debounce typing indicators for one user in one conversation.
+
+    At most one state change is emitted per ``interval`` seconds. Frames that
+    do not change the state are dropped, and a change arriving inside the
+    window is emitted on its trailing edge so a final ``typing_stop`` is never
+    lost.
+    """
+
+    def __init__(self, emit, interval):
+        self._emit = emit
+        self.interval = interval
+        self._desired = False
+        self._broadcast = False
+        self._last_change = None
+        self._pending = None
+
+    async def set(self, is_typing):
+        self._desired = is_typing
+        if self._pending is None:
+            await self._flush()
+
+    async def close(self):
+        """Cancel any pending change and clear a visible typing state."""
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        if self._broadcast:
+            self._broadcast = False
+            await self._emit(False)
+
+    async def _flush(self):
+        if self._desired == self._broadcast:
+            return
+        loop = asyncio.get_running_loop()
+        wait = 0 if self._last_change is None else self._last_change + self.interval - loop.time()
+        if wait > 0:
+            self._pending = asyncio.ensure_future(self._flush_later(wait))
+            return
+        self._broadcast = self._desired
+        self._last_change = loop.time()
+        await self._emit(self._broadcast)
+
+    async def _flush_later(self, wait):
+        await asyncio.sleep(wait)
+        self._pending = None
+        try:
+            await self._flush()
+        except Exception:
+            logger.exception("Failed to emit coalesced typing indicator")
+
+
+class ReadReceiptBatcher:
+    """
+    Collect read receipts and flush them once per ``window`` seconds.
+
+    ``flush`` is awaited with the de-duplicated list of message ids, so the
+    caller can do one UPDATE and one broadcast per window.
+    """
+
+    def __init__(self, flush, window):
+        self._flush = flush
+        self.window = window
+        self._message_ids = {}
+        self._pending = None
+
+    async def add(self, message_ids):
+        for message_id in message_ids:
+            try:
+                self._message_ids[str(uuid.UUID(str(message_id)))] = None
+            except ValueError:
+                continue
+        if not self._message_ids:
+            return
+        if self.window <= 0:
+            await self._drain()
+        elif self._pending is None:
+            self._pending = asyncio.ensure_future(self._drain_later())
+
+    async def close(self):
+        """Flush whatever is buffered immediately."""
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        await self._drain()
+
+    async def _drain(self):
+        if not self._message_ids:
+            return
+        message_ids = list(self._message_ids)
+        self._message_ids = {}
+        await self._flush(message_ids)
+
+    async def _drain_later(self):
+        await asyncio.sleep(self.window)
+        self._pending = None
+        try:
+            await self._drain()
+        except Exception:
+            logger.exception("Failed to flush read receipts")
@@ -1,16 +1,122 @@
-import json
+import logging
 import uuid
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ObjectDoesNotExist
-from .models import Conversation, Message, UserPresence
+from .coalescing import ReadReceiptBatcher, TypingCoalescer
+from .models import Conversation, InboxEntry, Message
+from .outbound import PRIORITY_HIGH, PRIORITY_LOW, SLOW_CONSUMER_CLOSE_CODE, OutboundQueue
+from .notifications import group_send_many, notification_group, notify_new_message
+from .presence import ensure_presence_maintenance, get_contact_ids, presence_group, presence_store
+from .protocol import JSONCodec, negotiate
+from .replay import messages_since, remember_message, resolve_seq
+from .services import post_message, serialize_message
 from django.conf import settings
+from api.instrumentation import InstrumentedConsumerMixin, log_event
+from api.metrics import websocket_connections
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
 
-class ChatConsumer(AsyncWebsocketConsumer):
+class PresenceMixin:
+    """
+    Connection-level presence bookkeeping shared by chat and presence sockets.
+    
+    Chat and presence sockets hold references on the same counter, so whichever
+    connection takes the first reference or drops the last one announces it.
+    """
+    
+    async def presence_connect(self):
+        """Take a presence reference; returns True if the user just came online."""
+        ensure_presence_maintenance()
+        came_online = await sync_to_async(presence_store.connect)(self.user.id)
+        if came_online:
+            await self.broadcast_presence(True)
+        return came_online
+
+    async def presence_disconnect(self):
+        """Drop a presence reference; returns True if the user just went offline."""
+        went_offline = await sync_to_async(presence_store.disconnect)(self.user.id)
+        if went_offline:
+            await self.broadcast_presence(False)
+        return went_offline
+
+    async def broadcast_presence(self, is_online):
+        """Send a status change to the presence groups of the user's contacts."""
+        # Looked up on every transition: contacts may have changed since connect
+        contact_ids = await database_sync_to_async(get_contact_ids)(self.user.id)
+        await group_send_many(
+            self.channel_layer,
+            [presence_group(contact_id) for contact_id in contact_ids],
+            {
+                'type': 'user_status_change',
+                'user_id': self.user.id,
+                'user_name': self.user.get_full_name() or self.user.email,
+                'is_online': is_online
+            }
+        )
+
+    async def presence_heartbeat(self):
+        await sync_to_async(presence_store.heartbeat)([self.user.id])
+
+
+class OutboundQueueMixin:
+    """
+    Route server-to-client frames through a bounded per-connection queue.
+    
+    Channel-layer handlers call ``send_event`` and return immediately; see
+    ``chat.outbound`` for prioritisation, coalescing and slow-consumer handling.
+    Frames are encoded with the codec negotiated in ``accept_client`` (JSON
+    unless the client offers the MessagePack subprotocol, see ``chat.protocol``).
+    """
+    
+    codec = JSONCodec()
+    
+    async def accept_client(self):
+        self.codec = negotiate(self.scope.get('subprotocols'))
+        await self.accept(self.codec.subprotocol)
+        websocket_connections.inc(consumer=type(self).__name__)
+        self.counted = True
+    
+    def decode_frame(self, text_data=None, bytes_data=None):
+        return self.codec.decode(text_data, bytes_data)
+    
+    def send_event(self, payload, priority=PRIORITY_HIGH, coalesce_key=None):
+        if getattr(self, 'outbound', None) is None:
+            self.outbound = OutboundQueue(
+                self.send_frame, self.close_slow_consumer, on_send_error=self.close_after_send_error
+            )
+        self.outbound.put(self.codec.encode(payload), priority, coalesce_key)
+    
+    async def send_frame(self, frame):
+        if isinstance(frame, bytes):
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
+    
+    async def close_slow_consumer(self):
+        await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+    
+    async def close_after_send_error(self):
+        try:
+            await self.close(code=1011)
+        except Exception:
+            # The socket is most likely gone already
+            pass
+    
+    async def stop_outbound(self):
+        if getattr(self, 'counted', False):
+            websocket_connections.dec(consumer=type(self).__name__)
+            self.counted = False
+        if getattr(self, 'outbound', None) is not None:
+            await self.outbound.close()
+
+
+class ChatConsumer(InstrumentedConsumerMixin, OutboundQueueMixin, PresenceMixin, AsyncWebsocketConsumer):
     """
     WebSocket consumer for handling chat messages in a specific conversation.
     """
@@ -36,41 +142,62 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         
-        await self.accept()
+        await self.accept_client()
+        
+        # Coalesce chatty client frames before they hit the channel layer / DB
+        self.typing = TypingCoalescer(
+            self.broadcast_typing,
+            getattr(settings, 'CHAT_TYPING_DEBOUNCE_SECONDS', 2.0)
+        )
+        self.read_receipts = ReadReceiptBatcher(
+            self.flush_read_receipts,
+            getattr(settings, 'CHAT_READ_RECEIPT_WINDOW_SECONDS', 1.0)
+        )
         
-        # Update user presence
-        await self.update_user_presence(True)
+        # Take a presence reference for this connection
+        await self.presence_connect()
     
     async def disconnect(self, close_code):
+        await self.stop_outbound()
+        
+        # Flush buffered receipts and clear our typing state
+        if hasattr(self, 'read_receipts'):
+            await self.read_receipts.close()
+            await self.typing.close()
+        
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
         
-        # Update user presence
-        if hasattr(self, 'user') and self.user.is_authenticated:
-            await self.update_user_presence(False)
+        # Release this connection's presence reference
+        if hasattr(self, 'read_receipts'):
+            await self.presence_disconnect()
     
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            text_data_json = json.loads(text_data)
-            message_type = text_data_json.get('type')
-            
-            if message_type == 'send_message':
-                await self.handle_send_message(text_data_json)
-            elif message_type == 'mark_as_read':
-                await self.handle_mark_as_read(text_data_json)
-            elif message_type == 'typing_start':
-                await self.handle_typing_indicator(text_data_json, True)
-            elif message_type == 'typing_stop':
-                await self.handle_typing_indicator(text_data_json, False)
-                
-        except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({
+            data = self.decode_frame(text_data, bytes_data)
+            message_type = data.get('type')
+        except (ValueError, AttributeError):
+            self.send_event({
                 'type': 'error',
-                'message': 'Invalid JSON format'
-            }))
+                'message': 'Invalid message format'
+            })
+            return
+        
+        if message_type == 'send_message':
+            await self.handle_send_message(data)
+        elif message_type == 'mark_as_read':
+            await self.handle_mark_as_read(data)
+        elif message_type == 'typing_start':
+            await self.handle_typing_indicator(data, True)
+        elif message_type == 'typing_stop':
+            await self.handle_typing_indicator(data, False)
+        elif message_type == 'resume':
+            await self.handle_resume(data)
+        elif message_type == 'heartbeat':
+            await self.presence_heartbeat()
     
     async def handle_send_message(self, data):
         content = data.get('content', '').strip()
@@ -83,34 +210,52 @@ class ChatConsumer(AsyncWebsocketConsumer):
         message = await self.save_message(content, message_type)
         
         if message:
+            payload = serialize_message(message)
+            
+            # Record in the replay ring before broadcasting so a client that
+            # reconnects in between can still pick it up with 'resume'
+            await sync_to_async(remember_message)(self.conversation_id, payload)
+            
             # Send message to room group
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
                     'type': 'chat_message',
-                    'message': {
-                        'id': str(message.id),
-                        'content': message.content,
-                        'message_type': message.message_type,
-                        'sender': {
-                            'id': message.sender.id,
-                            'name': message.sender.get_full_name() or message.sender.email,
-                            'avatar': self.get_avatar_url(message.sender),
-                            'role': message.sender.role
-                        },
-                        'file_url': self.get_file_url(message),
-                        'is_read': message.is_read,
-                        'created_at': message.created_at.isoformat(),
-                        'updated_at': message.updated_at.isoformat()
-                    }
+                    'message': payload
                 }
             )
             
             # Send global notifications to all participants (except sender)
             await self.send_global_notifications(message)
     
+    async def handle_resume(self, data):
+        """Replay messages the client missed, given its last seen seq or message id"""
+        last_seq = data.get('last_seq')
+        if last_seq is None and data.get('last_message_id'):
+            last_seq = await database_sync_to_async(resolve_seq)(
+                self.conversation_id, data['last_message_id']
+            )
+        
+        try:
+            last_seq = int(last_seq)
+        except (TypeError, ValueError):
+            messages, complete = [], False
+        else:
+            messages, complete = await database_sync_to_async(messages_since)(
+                self.conversation_id, last_seq
+            )
+        
+        self.send_event({
+            'type': 'replay',
+            'messages': messages,
+            'complete': complete
+        })
+    
     async def handle_mark_as_read(self, data):
-        message_ids = data.get('message_ids', [])
+        await self.read_receipts.add(data.get('message_ids', []))
+    
+    async def flush_read_receipts(self, message_ids):
+        """One UPDATE and one broadcast for a window of read receipts"""
         await self.mark_messages_as_read(message_ids)
         
         # Notify other participants
@@ -124,6 +269,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
         )
     
     async def handle_typing_indicator(self, data, is_typing):
+        await self.typing.set(is_typing)
+    
+    async def broadcast_typing(self, is_typing):
         await self.channel_layer.group_send(
             self.room_group_name,
             {
@@ -138,27 +286,27 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def chat_message(self, event):
         message = event['message']
         
-        await self.send(text_data=json.dumps({
+        self.send_event({
             'type': 'message_received',
             'message': message
-        }))
+        })
     
     async def messages_read(self, event):
-        await self.send(text_data=json.dumps({
+        self.send_event({
             'type': 'messages_read',
             'message_ids': event['message_ids'],
             'reader_id': event['reader_id']
-        }))
+        })
     
     async def typing_indicator(self, event):
         # Don't send typing indicator to the sender
         if event['user_id'] != self.user.id:
-            await self.send(text_data=json.dumps({
+            self.send_event({
                 'type': 'typing_indicator',
                 'user_id': event['user_id'],
                 'user_name': event['user_name'],
                 'is_typing': event['is_typing']
-            }))
+            }, PRIORITY_LOW, coalesce_key=('typing', event['user_id']))
     
     @database_sync_to_async
     def is_participant(self):
@@ -171,85 +319,46 @@ class ChatConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def save_message(self, content, message_type):
         try:
-            conversation = Conversation.objects.get(id=self.conversation_id)
-            message = Message.objects.create(
-                conversation=conversation,
-                sender=self.user,
+            return post_message(
+                self.conversation_id,
+                self.user,
                 content=content,
                 message_type=message_type
             )
-            return message
         except Conversation.DoesNotExist:
             return None
     
     @database_sync_to_async
     def mark_messages_as_read(self, message_ids):
-        Message.objects.filter(
+        updated = Message.objects.filter(
             id__in=message_ids,
             conversation_id=self.conversation_id
         ).exclude(sender=self.user).update(is_read=True)
+        if updated:
+            InboxEntry.refresh_unread(self.conversation_id)
     
     @database_sync_to_async
     def get_conversation_participants(self):
         """Get list of participant IDs for the current conversation"""
-        try:
-            conversation = Conversation.objects.get(id=self.conversation_id)
-            return list(conversation.participants.values_list('id', flat=True))
-        except Conversation.DoesNotExist:
-            return []
-    
-    @database_sync_to_async
-    def update_user_presence(self, is_online):
-        presence, created = UserPresence.objects.get_or_create(
-            user=self.user,
-            defaults={'is_online': is_online}
+        return list(
+            Conversation.participants.through.objects.filter(
+                conversation_id=self.conversation_id
+            ).values_list('user_id', flat=True)
         )
-        if not created:
-            presence.is_online = is_online
-            presence.save()
-
-    def get_avatar_url(self, user):
-        """Generate absolute URL for user avatar"""
-        if user.profile_picture:
-            # Build absolute URL - API server runs on port 8001
-            base_url = getattr(settings, 'SITE_URL', 'http://localhost:8001')
-            return f"{base_url}{user.profile_picture.url}"
-        return None
-
-    def get_file_url(self, message):
-        """Generate absolute URL for message file attachment"""
-        if message.file_attachment:
-            # Build absolute URL - API server runs on port 8001
-            base_url = getattr(settings, 'SITE_URL', 'http://localhost:8001')
-            return f"{base_url}{message.file_attachment.url}"
-        return None
-
+    
     async def send_global_notifications(self, message):
         """Send global notifications to all conversation participants except sender"""
         participants = await self.get_conversation_participants()
-        sender_name = message.sender.get_full_name() or message.sender.email
-        
-        for participant_id in participants:
-            if participant_id != message.sender.id:  # Don't notify sender
-                await self.channel_layer.group_send(
-                    f'notifications_{participant_id}',
-                    {
-                        'type': 'new_message_notification',
-                        'conversation_id': str(self.conversation_id),
-                        'message': {
-                            'id': str(message.id),
-                            'content': message.content,
-                            'sender_name': sender_name,
-                            'created_at': message.created_at.isoformat()
-                        },
-                        'sender_name': sender_name
-                    }
-                )
+        await notify_new_message(self.channel_layer, self.conversation_id, message, participants)
 
 
-class PresenceConsumer(AsyncWebsocketConsumer):
+class PresenceConsumer(InstrumentedConsumerMixin, OutboundQueueMixin, PresenceMixin, AsyncWebsocketConsumer):
     """
     WebSocket consumer for handling user presence (online/offline status).
+    
+    Presence is scoped to contacts (users sharing a conversation): each user
+    listens on their own ``presence_<id>`` group and status changes are sent
+    only to the groups of that user's contacts.
     """
     
     async def connect(self):
@@ -259,85 +368,70 @@ class PresenceConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
         
-        self.room_group_name = 'presence'
+        self.room_group_name = presence_group(self.user.id)
         
-        # Join presence group
+        # Join this user's presence group
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
         
-        await self.accept()
+        await self.accept_client()
+        
+        # Take a presence reference; the first connection announces to contacts
+        await self.presence_connect()
         
-        # Update user presence to online
-        await self.update_user_presence(True)
+        self.contact_ids = await self.get_contact_ids()
         
-        # Send initial presence data to the connecting user
+        # Send initial presence data (online contacts only) to the connecting user
         online_users = await self.get_online_users()
-        await self.send(text_data=json.dumps({
+        self.send_event({
             'type': 'initial_presence',
             'online_users': online_users
-        }))
-        
-        # Notify others that user is online
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_status_change',
-                'user_id': self.user.id,
-                'user_name': self.user.get_full_name() or self.user.email,
-                'is_online': True
-            }
-        )
+        })
     
     async def disconnect(self, close_code):
+        await self.stop_outbound()
+        
+        if not hasattr(self, 'room_group_name'):
+            return
+        
         # Leave presence group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
         
-        # Update user presence to offline
-        await self.update_user_presence(False)
-        
-        # Notify others that user is offline
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_status_change',
-                'user_id': self.user.id,
-                'user_name': self.user.get_full_name() or self.user.email,
-                'is_online': False
-            }
-        )
+        # Release the presence reference; the last connection announces
+        await self.presence_disconnect()
+    
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            if self.decode_frame(text_data, bytes_data).get('type') == 'heartbeat':
+                await self.presence_heartbeat()
+        except (ValueError, AttributeError):
+            pass
     
     async def user_status_change(self, event):
         # Don't send status change to the user themselves
         if event['user_id'] != self.user.id:
-            await self.send(text_data=json.dumps({
+            self.send_event({
                 'type': 'user_status_change',
                 'user_id': event['user_id'],
                 'user_name': event['user_name'],
                 'is_online': event['is_online']
-            }))
+            }, PRIORITY_LOW, coalesce_key=('presence', event['user_id']))
     
     @database_sync_to_async
-    def update_user_presence(self, is_online):
-        presence, created = UserPresence.objects.get_or_create(
-            user=self.user,
-            defaults={'is_online': is_online}
-        )
-        if not created:
-            presence.is_online = is_online
-            presence.save()
+    def get_contact_ids(self):
+        return get_contact_ids(self.user.id)
 
-    @database_sync_to_async
-    def get_online_users(self):
-        """Get list of currently online user IDs"""
-        return list(UserPresence.objects.filter(is_online=True).values_list('user_id', flat=True))
+    async def get_online_users(self):
+        """Get list of currently online contact IDs"""
+        return await sync_to_async(presence_store.online_user_ids)(self.contact_ids)
 
 
-class GlobalNotificationsConsumer(AsyncWebsocketConsumer):
+class GlobalNotificationsConsumer(InstrumentedConsumerMixin, OutboundQueueMixin, AsyncWebsocketConsumer):
     """
     WebSocket consumer for handling global notifications (new messages in other conversations).
     """
@@ -349,7 +443,7 @@ class GlobalNotificationsConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
         
-        self.room_group_name = f'notifications_{self.user.id}'
+        self.room_group_name = notification_group(self.user.id)
         
         # Join user's notification group
         await self.channel_layer.group_add(
@@ -357,22 +451,27 @@ class GlobalNotificationsConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
         
-        await self.accept()
-        print(f"Global notifications connected for user {self.user.id}")
+        await self.accept_client()
+        log_event(logger, 'ws.connect', consumer='GlobalNotificationsConsumer', user_id=self.user.id)
     
     async def disconnect(self, close_code):
+        await self.stop_outbound()
+        
         # Leave notification group
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
-        print(f"Global notifications disconnected for user {self.user.id}")
+        log_event(
+            logger, 'ws.disconnect', consumer='GlobalNotificationsConsumer',
+            user_id=self.user.id, close_code=close_code
+        )
     
     async def new_message_notification(self, event):
         """Send notification about new message in a conversation"""
-        await self.send(text_data=json.dumps({
+        self.send_event({
             'type': 'new_message_notification',
             'conversation_id': event['conversation_id'],
             'message': event['message'],
             'sender_name': event['sender_name']
-        })) 
\ No newline at end of file
+        }) 
\ No newline at end of file
@@ -0,0 +1,61 @@
+"""
+Maintenance of the ``Contact`` table from conversation participant changes.
+
+Every pair of users sharing a conversation has two ``Contact`` rows (one per
+direction) counting their shared conversations. Participant adds, removes and
+clears, and conversation deletes, are turned into per-pair count deltas and
+applied with one UPDATE per affected user.
+"""
+from collections import Counter, defaultdict
+
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import Contact, Conversation
+
+
+def participant_ids(conversation_id):
+    return set(
+        Conversation.participants.through.objects.filter(
+            conversation_id=conversation_id
+        ).values_list('user_id', flat=True)
+    )
+
+
+def pair_deltas(changed_ids, member_ids, delta):
+    """Deltas for every (changed, member) pair in both directions."""
+    pairs = set()
+    for user_id in changed_ids:
+        for other_id in member_ids:
+            if other_id != user_id:
+                pairs.add((user_id, other_id))
+                pairs.add((other_id, user_id))
+    return Counter({pair: delta for pair in pairs})
+
+
+def apply_deltas(deltas):
+    """Apply per-pair conversation count changes to the Contact table."""
+    increments = [pair for pair, delta in deltas.items() if delta > 0]
+    if increments:
+        Contact.objects.bulk_create(
+            [Contact(user_id=user_id, contact_id=contact_id) for user_id, contact_id in increments],
+            ignore_conflicts=True,
+        )
+
+    by_user = defaultdict(list)
+    for (user_id, contact_id), delta in deltas.items():
+        if delta:
+            by_user[user_id, delta].append(contact_id)
+    for (user_id, delta), contact_ids in by_user.items():
+        Contact.objects.filter(user_id=user_id, contact_id__in=contact_ids).update(
+            conversation_count=Greatest(F('conversation_count') + delta, 0)
+        )
+
+    removed_from = {user_id for (user_id, _), delta in deltas.items() if delta < 0}
+    if removed_from:
+        Contact.objects.filter(user_id__in=removed_from, conversation_count=0).delete()
+
+
+def get_contact_ids(user_id):
+    """Ids of users who share at least one conversation with ``user_id``."""
+    return set(Contact.objects.filter(user_id=user_id).values_list('contact_id', flat=True))
@@ -0,0 +1,157 @@
+"""
+Channel layer extensions for the chat app.
+"""
+import asyncio
+import collections
+import logging
+import time
+
+import msgpack
+from channels.exceptions import ChannelFull
+from channels.layers import InMemoryChannelLayer
+from channels_redis.core import RedisChannelLayer
+
+from api.metrics import channel_layer_send_duration
+
+logger = logging.getLogger(__name__)
+
+# Same delivery script channels_redis uses for group_send: enqueue the
+# per-key message unless the channel is at capacity.
+GROUP_SEND_LUA = """
+    local over_capacity = 0
+    local current_time = ARGV[#ARGV - 1]
+    local expiry = ARGV[#ARGV]
+    for i=1,#KEYS do
+        if redis.call('ZCOUNT', KEYS[i], '-inf', '+inf') < tonumber(ARGV[i + #KEYS]) then
+            redis.call('ZADD', KEYS[i], current_time, ARGV[i])
+            redis.call('EXPIRE', KEYS[i], expiry)
+        else
+            over_capacity = over_capacity + 1
+        end
+    end
+    return over_capacity
+"""
+
+
+class GroupSendTimingMixin:
+    """
+    Record ``group_send`` latency in ``channel_layer_group_send_seconds``.
+    """
+
+    async def group_send(self, group, message):
+        with channel_layer_send_duration.time(method='group_send'):
+            await super().group_send(group, message)
+
+
+class BulkRedisChannelLayer(GroupSendTimingMixin, RedisChannelLayer):
+    """
+    Redis channel layer that can deliver one message to many groups at once.
+
+    ``group_send_bulk`` resolves the membership of every group with one
+    pipelined round trip per Redis shard, serializes the message once per
+    destination key and enqueues everything with a single script call per
+    shard, instead of one full ``group_send`` per group.
+    """
+
+    async def group_send_bulk(self, groups, message):
+        with channel_layer_send_duration.time(method='group_send_bulk'):
+            await self._group_send_bulk(groups, message)
+
+    async def _group_send_bulk(self, groups, message):
+        groups = list(dict.fromkeys(groups))
+        for group in groups:
+            assert self.valid_group_name(group), "Group name not valid"
+        if not groups:
+            return
+
+        # Resolve group membership, pipelined per shard
+        keys_by_connection = collections.defaultdict(list)
+        for group in groups:
+            keys_by_connection[self.consistent_hash(group)].append(self._group_key(group))
+
+        group_cutoff = int(time.time()) - self.group_expiry
+        channel_names = set()
+        for index, group_keys in keys_by_connection.items():
+            pipe = self.connection(index).pipeline()
+            for key in group_keys:
+                pipe.zremrangebyscore(key, min=0, max=group_cutoff)
+                pipe.zrange(key, 0, -1)
+            results = await pipe.execute()
+            for members in results[1::2]:
+                channel_names.update(member.decode("utf8") for member in members)
+
+        if not channel_names:
+            return
+
+        (
+            connection_to_channel_keys,
+            channel_keys_to_message,
+            channel_keys_to_capacity,
+        ) = self._map_channel_keys_to_connection(sorted(channel_names), message)
+
+        message_cutoff = int(time.time()) - int(self.expiry)
+        for connection_index, channel_redis_keys in connection_to_channel_keys.items():
+            connection = self.connection(connection_index)
+
+            # Discard expired messages before checking capacity
+            pipe = connection.pipeline()
+            for key in channel_redis_keys:
+                pipe.zremrangebyscore(key, min=0, max=message_cutoff)
+            await pipe.execute()
+
+            args = [channel_keys_to_message[key] for key in channel_redis_keys]
+            args += [channel_keys_to_capacity[key] for key in channel_redis_keys]
+            args += [time.time(), self.expiry]
+
+            channels_over_capacity = await connection.eval(
+                GROUP_SEND_LUA, len(channel_redis_keys), *channel_redis_keys, *args
+            )
+            if channels_over_capacity > 0:
+                logger.info(
+                    "%s of %s channels over capacity in bulk send to %s groups",
+                    channels_over_capacity,
+                    len(channel_names),
+                    len(groups),
+                )
+
+
+class TimedInMemoryChannelLayer(GroupSendTimingMixin, InMemoryChannelLayer):
+    """The stock in-memory layer with ``group_send`` timing, for development."""
+
+
+class SerializingInMemoryChannelLayer(InMemoryChannelLayer):
+    """
+    In-process stand-in for the Redis layer, for load testing without Redis.
+
+    Every message is msgpack-encoded per destination channel and decoded on
+    receive, as channels_redis does. Each send or group send also waits
+    ``round_trip`` seconds to model the network hop to Redis.
+    """
+
+    def __init__(self, round_trip=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.round_trip = round_trip
+
+    async def send(self, channel, message):
+        if self.round_trip:
+            await asyncio.sleep(self.round_trip)
+        await self._send_packed(channel, message)
+
+    async def _send_packed(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        await super().send(channel, {'packed': msgpack.packb(message, use_bin_type=True)})
+
+    async def receive(self, channel):
+        message = await super().receive(channel)
+        return msgpack.unpackb(message['packed'], raw=False)
+
+    async def group_send(self, group, message):
+        assert self.valid_group_name(group), "Invalid group name"
+        if self.round_trip:
+            await asyncio.sleep(self.round_trip)
+        self._clean_expired()
+        for channel in list(self.groups.get(group, {})):
+            try:
+                await self._send_packed(channel, message)
+            except ChannelFull:
+                pass
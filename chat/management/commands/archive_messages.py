@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat.archive import ZSTD_AVAILABLE, archive_conversation
+from chat.models import Message
+
+
+class Command(BaseCommand):
+    help = 'Move chat messages older than the archive horizon into compressed cold storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            default=None,
+            help='Archive horizon in days (default: CHAT_ARCHIVE_AFTER_DAYS)'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Messages per archive transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be archived')
+
+    def handle(self, *args, **options):
+        days = options['older_than_days']
+        if days is None:
+            days = getattr(settings, 'CHAT_ARCHIVE_AFTER_DAYS', 180)
+        cutoff = timezone.now() - timedelta(days=days)
+
+        conversation_ids = list(
+            Message.objects.filter(created_at__lt=cutoff)
+            .values_list('conversation_id', flat=True)
+            .distinct()
+        )
+        self.stdout.write(
+            f'{len(conversation_ids)} conversation(s) have messages older than {days} days '
+            f'(codec: {"zstd" if ZSTD_AVAILABLE else "zlib"})'
+        )
+        if options['dry_run']:
+            return
+
+        total = 0
+        for conversation_id in conversation_ids:
+            total += archive_conversation(conversation_id, cutoff, batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} messages'))
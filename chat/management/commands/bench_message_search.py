@@ -0,0 +1,99 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from chat.models import Conversation, Message
+from chat.search import search_messages
+
+User = get_user_model()
+
+WORDS = (
+    'plumber pipe leak kitchen sink bathroom tile paint wall ceiling garden lawn '
+    'fence roof gutter window door lock key invoice payment quote schedule monday '
+    'tuesday morning evening urgent tomorrow estimate materials deposit receipt '
+    'electrician wiring socket switch breaker heater boiler cleaning carpet sofa'
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a message fixture and measure chat search latency against '
+        'CHAT_SEARCH_TIMEOUT_MS (use --messages 10000000 for the full-size fixture)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=100000, help='Messages to seed')
+        parser.add_argument('--conversations', type=int, default=1000, help='Conversations to spread messages over')
+        parser.add_argument('--queries', type=int, default=200, help='Search queries to time')
+        parser.add_argument('--budget-ms', type=float, default=None, help='p95 budget (default: CHAT_SEARCH_TIMEOUT_MS)')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data')
+
+    def handle(self, *args, **options):
+        budget = options['budget_ms'] or getattr(settings, 'CHAT_SEARCH_TIMEOUT_MS', 500)
+        rng = random.Random(42)
+        run_id = uuid.uuid4().hex[:8]
+
+        searcher, other = [
+            User.objects.create_user(email=f'search-bench-{run_id}-{i}@workconnect.local', first_name='Bench')
+            for i in range(2)
+        ]
+        conversations = Conversation.objects.bulk_create(
+            [Conversation() for _ in range(options['conversations'])]
+        )
+        Through = Conversation.participants.through
+        # The searcher is in a tenth of the conversations; the rest exercise the prefilter
+        Through.objects.bulk_create(
+            [Through(conversation_id=c.id, user_id=other.id) for c in conversations]
+            + [Through(conversation_id=c.id, user_id=searcher.id) for c in conversations[::10]]
+        )
+
+        self.stdout.write(f"Seeding {options['messages']:,} messages...")
+        seeded = 0
+        seq = {c.id: 0 for c in conversations}
+        now = timezone.now()
+        while seeded < options['messages']:
+            batch = []
+            for _ in range(min(10000, options['messages'] - seeded)):
+                conversation = conversations[rng.randrange(len(conversations))]
+                seq[conversation.id] += 1
+                batch.append(Message(
+                    conversation_id=conversation.id,
+                    sender_id=other.id,
+                    seq=seq[conversation.id],
+                    content=' '.join(rng.choices(WORDS, k=rng.randint(4, 30))),
+                    created_at=now,
+                    updated_at=now,
+                ))
+            Message.objects.bulk_create(batch)
+            seeded += len(batch)
+        for conversation_id, last_seq in seq.items():
+            Conversation.objects.filter(pk=conversation_id).update(last_seq=last_seq)
+
+        timings = []
+        for _ in range(options['queries']):
+            query = ' '.join(rng.sample(WORDS, rng.randint(1, 2)))
+            start = time.perf_counter()
+            search_messages(searcher, query)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        timings.sort()
+        p50 = statistics.median(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f'{len(timings)} queries: p50 {p50:.1f} ms, p95 {p95:.1f} ms, max {timings[-1]:.1f} ms '
+            f'(budget {budget:.0f} ms)'
+        )
+
+        if not options['keep']:
+            Conversation.objects.filter(id__in=[c.id for c in conversations]).delete()
+            User.objects.filter(id__in=[searcher.id, other.id]).delete()
+
+        if p95 > budget:
+            raise CommandError(f'p95 search latency {p95:.1f} ms exceeds the {budget:.0f} ms budget')
+        self.stdout.write(self.style.SUCCESS('Search latency within budget'))
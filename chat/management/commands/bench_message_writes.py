@@ -0,0 +1,58 @@
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from chat.models import Conversation
+from chat.services import post_message
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the chat message write path and report inserts per second'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000, help='Number of messages to post')
+        parser.add_argument('--conversations', type=int, default=1, help='Number of conversations to spread messages over')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark data instead of deleting it')
+
+    def handle(self, *args, **options):
+        total = options['messages']
+        run_id = uuid.uuid4().hex[:8]
+
+        users = [
+            User.objects.create_user(
+                email=f'bench-{run_id}-{i}@workconnect.local',
+                password=None,
+                first_name='Bench',
+                last_name=str(i),
+            )
+            for i in range(2)
+        ]
+        conversations = []
+        for _ in range(max(options['conversations'], 1)):
+            conversation = Conversation.objects.create()
+            conversation.participants.set(users)
+            conversations.append(conversation.id)
+
+        self.stdout.write(f'Posting {total} messages across {len(conversations)} conversation(s)...')
+        start = time.perf_counter()
+        for i in range(total):
+            post_message(
+                conversations[i % len(conversations)],
+                users[i % 2],
+                content=f'Benchmark message {i}',
+            )
+        elapsed = time.perf_counter() - start
+
+        rate = total / elapsed if elapsed else float('inf')
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} messages in {elapsed:.3f}s: {rate:,.0f} inserts/s '
+            f'({elapsed / max(total, 1) * 1000:.3f} ms/message)'
+        ))
+
+        if not options['keep']:
+            Conversation.objects.filter(id__in=conversations).delete()
+            User.objects.filter(id__in=[u.id for u in users]).delete()
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import random
+import resource
+import time
+import tracemalloc
+import uuid
+
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from chat import routing
+from chat.models import Conversation
+
+User = get_user_model()
+
+LAYERS = {
+    'memory': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+    # Serializes like channels_redis and adds a simulated round trip (see --round-trip-ms)
+    'redis-standin': {'BACKEND': 'chat.layers.SerializingInMemoryChannelLayer'},
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate users chatting over ChatConsumer WebSockets in-process and report delivery '
+        'latency (p50/p95/p99), throughput and memory per connection for each channel layer'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Simulated users')
+        parser.add_argument('--conversations', type=int, default=10, help='Conversations to spread users over')
+        parser.add_argument('--members', type=int, default=5, help='Participants per conversation')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds of traffic per layer')
+        parser.add_argument('--message-rate', type=float, default=0.5, help='Messages per second per connection')
+        parser.add_argument('--typing-ratio', type=float, default=0.5, help='Share of messages preceded by typing')
+        parser.add_argument(
+            '--layers',
+            default=','.join(LAYERS),
+            help=f'Comma-separated channel layers to test ({", ".join(LAYERS)})'
+        )
+        parser.add_argument('--round-trip-ms', type=float, default=1.0, help='Simulated Redis round trip')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded users and conversations')
+
+    def handle(self, *args, **options):
+        layers = [name.strip() for name in options['layers'].split(',') if name.strip()]
+        unknown = set(layers) - set(LAYERS)
+        if unknown:
+            raise CommandError(f'Unknown layer(s): {", ".join(sorted(unknown))}')
+        if options['members'] > options['users']:
+            raise CommandError('--members cannot exceed --users')
+
+        users, conversations = self.seed(options)
+        memberships = [
+            (user, conversation)
+            for conversation, members in conversations
+            for user in members
+        ]
+        self.stdout.write(
+            f'{len(users)} users, {len(conversations)} conversations, {len(memberships)} connections, '
+            f'{options["duration"]:.0f}s per layer'
+        )
+
+        try:
+            for name in layers:
+                config = dict(LAYERS[name])
+                if name == 'redis-standin':
+                    config['CONFIG'] = {'round_trip': options['round_trip_ms'] / 1000}
+                with override_settings(CHANNEL_LAYERS={'default': config}):
+                    result = asyncio.run(self.run_load(memberships, options))
+                self.report(name, result)
+        finally:
+            if not options['keep']:
+                Conversation.objects.filter(id__in=[c.id for c, _ in conversations]).delete()
+                User.objects.filter(id__in=[u.id for u in users]).delete()
+
+    def seed(self, options):
+        run_id = uuid.uuid4().hex[:8]
+        users = [
+            User.objects.create_user(email=f'ws-bench-{run_id}-{i}@workconnect.local', first_name=f'Bench{i}')
+            for i in range(options['users'])
+        ]
+        Through = Conversation.participants.through
+        conversations, rows = [], []
+        for index, conversation in enumerate(
+            Conversation.objects.bulk_create([Conversation() for _ in range(options['conversations'])])
+        ):
+            members = [users[(index * options['members'] + k) % len(users)] for k in range(options['members'])]
+            members = list({user.id: user for user in members}.values())
+            conversations.append((conversation, members))
+            rows += [Through(conversation_id=conversation.id, user_id=user.id) for user in members]
+        Through.objects.bulk_create(rows)
+        return users, conversations
+
+    async def run_load(self, memberships, options):
+        app = URLRouter(routing.websocket_urlpatterns)
+        rng = random.Random(42)
+        latencies = []
+        counts = {'sent': 0, 'delivered': 0, 'typing': 0, 'read': 0}
+
+        # Build the layer first so its setup is not counted against connections
+        get_channel_layer()
+        tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        clients = []
+        for user, conversation in memberships:
+            communicator = WebsocketCommunicator(app, f'/ws/chat/{conversation.id}/')
+            communicator.scope['user'] = user
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise CommandError(f'Connection refused for user {user.id} in {conversation.id}')
+            clients.append(communicator)
+        connected_memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        async def receive(communicator):
+            unread = []
+            while True:
+                output = await communicator.receive_output(timeout=options['duration'] + 60)
+                if 'text' not in output:
+                    continue
+                event = json.loads(output['text'])
+                if event['type'] == 'message_received':
+                    content = event['message']['content']
+                    if content.startswith('bench '):
+                        latencies.append(time.perf_counter() - float(content.split()[1]))
+                        counts['delivered'] += 1
+                        unread.append(event['message']['id'])
+                        if len(unread) >= 5:
+                            await communicator.send_json_to({'type': 'mark_as_read', 'message_ids': unread})
+                            unread = []
+                elif event['type'] == 'typing_indicator':
+                    counts['typing'] += 1
+                elif event['type'] == 'messages_read':
+                    counts['read'] += 1
+
+        async def send(communicator, stop_at):
+            while True:
+                await asyncio.sleep(rng.expovariate(options['message_rate']))
+                if time.perf_counter() >= stop_at:
+                    return
+                if rng.random() < options['typing_ratio']:
+                    await communicator.send_json_to({'type': 'typing_start'})
+                await communicator.send_json_to({
+                    'type': 'send_message',
+                    'content': f'bench {time.perf_counter()!r}',
+                })
+                counts['sent'] += 1
+
+        receivers = [asyncio.ensure_future(receive(client)) for client in clients]
+        started = time.perf_counter()
+        await asyncio.gather(*(send(client, started + options['duration']) for client in clients))
+        elapsed = time.perf_counter() - started
+
+        # Let in-flight messages land before tearing down
+        await asyncio.sleep(2)
+        for receiver in receivers:
+            receiver.cancel()
+        await asyncio.gather(*receivers, return_exceptions=True)
+        for client in clients:
+            await client.disconnect()
+
+        latencies.sort()
+        return {
+            'connections': len(clients),
+            'elapsed': elapsed,
+            'latencies': latencies,
+            'memory_per_connection': (connected_memory - baseline) / max(1, len(clients)),
+            **counts,
+        }
+
+    def report(self, name, result):
+        latencies = result['latencies']
+        ms = [value * 1000 for value in latencies]
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n[{name}]'))
+        self.stdout.write(
+            f'  sent {result["sent"]:,} messages ({result["sent"] / result["elapsed"]:.1f}/s), '
+            f'delivered {result["delivered"]:,} ({result["delivered"] / result["elapsed"]:.1f}/s)'
+        )
+        self.stdout.write(
+            f'  delivery latency: p50 {percentile(ms, 50):.1f} ms, p95 {percentile(ms, 95):.1f} ms, '
+            f'p99 {percentile(ms, 99):.1f} ms, max {ms[-1] if ms else 0:.1f} ms'
+        )
+        self.stdout.write(
+            f'  typing frames {result["typing"]:,}, read receipts {result["read"]:,}'
+        )
+        self.stdout.write(
+            f'  memory: {result["memory_per_connection"] / 1024:.1f} KiB per connection '
+            f'(process max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB)'
+        )
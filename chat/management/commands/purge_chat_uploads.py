@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete unfinished chunked chat uploads and their stored parts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-hours',
+            type=int,
+            default=None,
+            help='Idle time before an upload is purged (default: CHAT_UPLOAD_EXPIRY_HOURS)'
+        )
+
+    def handle(self, *args, **options):
+        hours = options['older_than_hours']
+        if hours is None:
+            hours = getattr(settings, 'CHAT_UPLOAD_EXPIRY_HOURS', 24)
+        purged = purge_stale_uploads(timedelta(hours=hours))
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} unfinished upload(s)'))
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.21 on 2026-10-19 04:21
+
+from django.db import migrations, models
+
+
+def create_fts_index(apps, schema_editor):
+    # GIN expression index used by chat.search; PostgreSQL only
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS chat_message_content_fts ON chat_message "
+        "USING gin (to_tsvector('english'::regconfig, COALESCE(content, '')))"
+    )
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS chat_message_content_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_message_seq'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', '-created_at'], name='chat_msg_conv_created_idx'),
+        ),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
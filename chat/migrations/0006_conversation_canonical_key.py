@@ -0,0 +1,18 @@
+# Generated by Django 4.2.21 on 2026-10-19 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_archivedmessageblock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='canonical_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+    ]
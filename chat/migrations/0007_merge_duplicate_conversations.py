@@ -0,0 +1,131 @@
+# Generated by Django 4.2.21 on 2026-10-19 04:23
+
+import hashlib
+import json
+import zlib
+from datetime import datetime
+
+from django.db import migrations
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def canonical_key(participant_ids, job_id):
+    # Frozen copy of chat.models.make_canonical_key
+    participants = ','.join(str(user_id) for user_id in sorted(set(participant_ids)))
+    return hashlib.sha256(f'{participants}|{job_id or ""}'.encode()).hexdigest()
+
+
+# Frozen copies of the chat.archive block codecs
+def compress(data):
+    if zstandard is not None:
+        return 'zstd', zstandard.ZstdCompressor(level=10).compress(data)
+    return 'zlib', zlib.compress(data, 9)
+
+
+def decompress(codec, data):
+    data = bytes(data)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError("zstandard package is required to read zstd archive blocks")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def merge_thread(apps, canonical_id, duplicate_ids):
+    """
+    Move the duplicates' messages and archive blocks into the canonical thread.
+
+    Hot and archived messages are renumbered together in sent order, so seqs
+    stay unique across both. Archived messages are regrouped into one block
+    per month, as ``chat.archive.archive_conversation`` writes them.
+    """
+    Conversation = apps.get_model('chat', 'Conversation')
+    Message = apps.get_model('chat', 'Message')
+    ArchivedMessageBlock = apps.get_model('chat', 'ArchivedMessageBlock')
+    thread_ids = [canonical_id] + duplicate_ids
+
+    blocks = list(ArchivedMessageBlock.objects.filter(conversation_id__in=thread_ids))
+    archived = []
+    for block in blocks:
+        for line in decompress(block.codec, block.payload).decode('utf-8').splitlines():
+            archived.append(json.loads(line))
+    hot = list(Message.objects.filter(conversation_id__in=thread_ids))
+
+    # (sent at, id, archived record or hot message)
+    thread = [(datetime.fromisoformat(record['created_at']), record['id'], record) for record in archived]
+    thread += [(message.created_at, str(message.id), message) for message in hot]
+    thread.sort(key=lambda item: item[:2])
+
+    # Park hot seqs above both the old and the new ranges first so the
+    # (conversation, seq) unique constraint is never hit while rows move
+    offset = max([message.seq for message in hot] + [len(thread)]) + 1
+    for index, message in enumerate(hot):
+        message.seq = offset + index
+        message.conversation_id = canonical_id
+    Message.objects.bulk_update(hot, ['seq', 'conversation_id'], batch_size=1000)
+
+    months = {}
+    for seq, (_, _, item) in enumerate(thread, start=1):
+        if isinstance(item, dict):
+            item['seq'] = seq
+            months.setdefault(item['created_at'][:7], []).append(item)
+        else:
+            item.seq = seq
+    Message.objects.bulk_update(hot, ['seq'], batch_size=1000)
+
+    ArchivedMessageBlock.objects.filter(id__in=[block.id for block in blocks]).delete()
+    new_blocks = []
+    for month, records in months.items():
+        codec, payload = compress('\n'.join(json.dumps(record, separators=(',', ':')) for record in records).encode('utf-8'))
+        new_blocks.append(ArchivedMessageBlock(
+            conversation_id=canonical_id,
+            month=f'{month}-01',
+            first_seq=records[0]['seq'],
+            last_seq=records[-1]['seq'],
+            message_count=len(records),
+            codec=codec,
+            payload=payload,
+        ))
+    ArchivedMessageBlock.objects.bulk_create(new_blocks)
+
+    last_message = max(hot, key=lambda message: message.seq, default=None)
+    Conversation.objects.filter(pk=canonical_id).update(
+        last_seq=len(thread),
+        last_message_id=last_message.id if last_message else None,
+    )
+    Conversation.objects.filter(id__in=duplicate_ids).delete()
+
+
+def merge_duplicate_conversations(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    Participant = Conversation.participants.through
+
+    participants = {}
+    for conversation_id, user_id in Participant.objects.values_list('conversation_id', 'user_id'):
+        participants.setdefault(conversation_id, []).append(user_id)
+
+    by_key = {}
+    for conversation_id, job_id in Conversation.objects.order_by('created_at').values_list('id', 'job_id'):
+        key = canonical_key(participants.get(conversation_id, []), job_id)
+        by_key.setdefault(key, []).append(conversation_id)
+
+    for key, conversation_ids in by_key.items():
+        canonical_id, duplicate_ids = conversation_ids[0], conversation_ids[1:]
+        if duplicate_ids:
+            merge_thread(apps, canonical_id, duplicate_ids)
+        Conversation.objects.filter(pk=canonical_id).update(canonical_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_conversation_canonical_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.21 on 2026-10-19 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Separate from the merge in 0007: Postgres refuses to ALTER a table with
+    # FK trigger events still pending from the same transaction.
+
+    dependencies = [
+        ('chat', '0007_merge_duplicate_conversations'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conversation',
+            name='canonical_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.21 on 2026-10-19 04:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def backfill_inbox(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    Message = apps.get_model('chat', 'Message')
+    InboxEntry = apps.get_model('chat', 'InboxEntry')
+    Participant = Conversation.participants.through
+
+    # Unread for a participant = unread in the conversation minus unread they sent
+    unread_total, unread_sent = {}, {}
+    for conversation_id, sender_id, total in Message.objects.filter(
+        is_read=False
+    ).values_list('conversation_id', 'sender_id').annotate(total=models.Count('id')).order_by():
+        unread_total[conversation_id] = unread_total.get(conversation_id, 0) + total
+        unread_sent[conversation_id, sender_id] = total
+
+    activity = dict(Conversation.objects.values_list('id', 'updated_at'))
+    entries = []
+    for conversation_id, user_id in Participant.objects.values_list('conversation_id', 'user_id').iterator():
+        entries.append(InboxEntry(
+            user_id=user_id,
+            conversation_id=conversation_id,
+            last_activity=activity[conversation_id],
+            unread_count=unread_total.get(conversation_id, 0) - unread_sent.get((conversation_id, user_id), 0),
+        ))
+        if len(entries) >= 5000:
+            InboxEntry.objects.bulk_create(entries, ignore_conflicts=True)
+            entries = []
+    InboxEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0008_alter_conversation_canonical_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboxEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_activity', models.DateTimeField(default=django.utils.timezone.now)),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='chat.conversation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-last_activity'], name='chat_inbox_user_activity_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='inboxentry',
+            constraint=models.UniqueConstraint(fields=('user', 'conversation'), name='chat_inbox_user_conversation'),
+        ),
+        migrations.RunPython(backfill_inbox, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.21 on 2026-10-19 04:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_contacts(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    Contact = apps.get_model('chat', 'Contact')
+    quote = schema_editor.quote_name
+    contacts = quote(Contact._meta.db_table)
+    participants = quote(Conversation.participants.through._meta.db_table)
+    schema_editor.execute(
+        f'INSERT INTO {contacts} (user_id, contact_id, conversation_count) '
+        f'SELECT a.user_id, b.user_id, COUNT(*) FROM {participants} a '
+        f'JOIN {participants} b ON a.conversation_id = b.conversation_id AND a.user_id <> b.user_id '
+        f'GROUP BY a.user_id, b.user_id'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0009_inboxentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Contact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conversation_count', models.PositiveIntegerField(default=0)),
+                ('contact', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contact_of', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contacts', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='contact',
+            constraint=models.UniqueConstraint(fields=('user', 'contact'), name='chat_contact_user_contact'),
+        ),
+        migrations.RunPython(backfill_contacts, migrations.RunPython.noop),
+    ]
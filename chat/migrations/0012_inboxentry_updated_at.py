@@ -0,0 +1,18 @@
+# Generated by Django 4.2.21 on 2026-10-19 04:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_chatupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inboxentry',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.21 on 2026-10-19 05:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0012_inboxentry_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatupload',
+            name='assembling_since',
+            field=models.DateTimeField(blank=True, help_text='Set while a request assembles the parts', null=True),
+        ),
+        migrations.AddField(
+            model_name='chatuploadchunk',
+            name='name',
+            field=models.CharField(blank=True, help_text='Storage name of the part file', max_length=255),
+        ),
+    ]
@@ -1,11 +1,23 @@
-from django.db import models
+from datetime import timedelta
+from django.conf import settings
+from django.db import connections, models, router, transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from users.models import Job
+import hashlib
 import uuid
 
 User = get_user_model()
 
 
+def make_canonical_key(participant_ids, job_id=None):
+    """Stable key for a participant set + job, used to deduplicate conversations."""
+    participants = ','.join(str(user_id) for user_id in sorted(set(participant_ids)))
+    return hashlib.sha256(f'{participants}|{job_id or ""}'.encode()).hexdigest()
+
+
 class Conversation(models.Model):
     """
     Represents a conversation between users, optionally related to a job.
@@ -16,6 +28,9 @@ class Conversation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     last_message = models.ForeignKey('Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_seq = models.PositiveBigIntegerField(default=0)
+    # Hash of sorted participant ids + job id; one conversation per key
+    canonical_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
     
     class Meta:
         ordering = ['-updated_at']
@@ -30,6 +45,47 @@ class Conversation(models.Model):
     def unread_count(self):
         """Get total unread messages in this conversation"""
         return self.messages.filter(is_read=False).count()
+    
+    @classmethod
+    def advance(cls, conversation_id, message_id, timestamp=None):
+        """
+        Point a conversation at its newest message with a single UPDATE by pk.
+        
+        Allocates the next per-conversation sequence number and returns it,
+        or None when the conversation does not exist. ``updated_at`` is only
+        bumped when the previous bump is older than
+        ``CHAT_CONVERSATION_TOUCH_INTERVAL`` seconds, so very busy
+        conversations do not rewrite it on every message.
+        """
+        timestamp = timestamp or timezone.now()
+        interval = timedelta(seconds=getattr(settings, 'CHAT_CONVERSATION_TOUCH_INTERVAL', 5))
+        connection = connections[router.db_for_write(cls)]
+        
+        if connection.vendor == 'postgresql':
+            # UPDATE ... RETURNING hands back the allocated seq in the same statement
+            table = connection.ops.quote_name(cls._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {table} SET last_seq = last_seq + 1, last_message_id = %s, '
+                    f'updated_at = CASE WHEN updated_at >= %s THEN updated_at ELSE %s END '
+                    f'WHERE id = %s RETURNING last_seq',
+                    [str(message_id), timestamp - interval, timestamp, str(conversation_id)]
+                )
+                row = cursor.fetchone()
+            return row[0] if row else None
+        
+        updated = cls.objects.filter(pk=conversation_id).update(
+            last_seq=F('last_seq') + 1,
+            last_message_id=message_id,
+            updated_at=Case(
+                When(updated_at__gte=timestamp - interval, then=F('updated_at')),
+                default=Value(timestamp),
+            ),
+        )
+        if not updated:
+            return None
+        # The UPDATE holds the row lock, so this read sees our own increment
+        return cls.objects.filter(pk=conversation_id).values_list('last_seq', flat=True).get()
 
 
 class Message(models.Model):
@@ -48,6 +104,8 @@ class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     content = models.TextField(blank=True)
     message_type = models.CharField(max_length=20, choices=MESSAGE_TYPES, default='text')
+    # Monotonic per-conversation sequence number, used to replay gaps on reconnect
+    seq = models.PositiveBigIntegerField(default=0, editable=False)
     file_attachment = models.FileField(upload_to='chat_files/%Y/%m/%d/', null=True, blank=True)
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -55,18 +113,114 @@ class Message(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'seq'], name='chat_message_conversation_seq'),
+        ]
+        indexes = [
+            models.Index(fields=['conversation', '-created_at'], name='chat_msg_conv_created_idx'),
+        ]
     
     def __str__(self):
         return f"Message from {self.sender.get_full_name() or self.sender.email} at {self.created_at}"
     
     def save(self, *args, **kwargs):
-        is_new = self.pk is None
-        super().save(*args, **kwargs)
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
         
-        # Update conversation's last_message and updated_at
-        if is_new:
-            self.conversation.last_message = self
-            self.conversation.save(update_fields=['last_message', 'updated_at'])
+        # New message: advance the conversation and insert in one transaction.
+        # The conversation is updated by pk first so a missing conversation
+        # fails fast without fetching the row (last_message's FK is deferred).
+        timestamp = timezone.now()
+        with transaction.atomic():
+            seq = Conversation.advance(self.conversation_id, self.pk, timestamp)
+            if seq is None:
+                raise Conversation.DoesNotExist(
+                    f"Conversation {self.conversation_id} does not exist"
+                )
+            self.seq = seq
+            super().save(*args, **kwargs)
+            InboxEntry.record_message(self.conversation_id, self.sender_id, timestamp)
+
+
+class InboxEntry(models.Model):
+    """
+    One row per (participant, conversation), kept in inbox order.
+    
+    Maintained when messages are posted or read and when participants change
+    (see ``chat.signals``), so a user's inbox is a single range scan over
+    ``(user, -last_activity)`` instead of a sort over the participants join.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='inbox_entries')
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='inbox_entries')
+    last_activity = models.DateTimeField(default=timezone.now)
+    unread_count = models.PositiveIntegerField(default=0)
+    # Bumped whenever anything shown for this entry in the inbox list changes
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'conversation'], name='chat_inbox_user_conversation'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_activity'], name='chat_inbox_user_activity_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} - {self.conversation_id} ({self.unread_count} unread)"
+    
+    @classmethod
+    def record_message(cls, conversation_id, sender_id, timestamp):
+        """Move the conversation to the top of every participant's inbox; one UPDATE."""
+        cls.objects.filter(conversation_id=conversation_id).update(
+            last_activity=timestamp,
+            updated_at=timestamp,
+            unread_count=Case(
+                When(user_id=sender_id, then=F('unread_count')),
+                default=F('unread_count') + 1,
+            ),
+        )
+    
+    @classmethod
+    def refresh_unread(cls, conversation_id):
+        """Recount unread messages for every participant after messages are marked read."""
+        unread = Message.objects.filter(
+            conversation_id=conversation_id,
+            is_read=False,
+        ).exclude(
+            sender_id=OuterRef('user_id')
+        ).values('conversation_id').annotate(total=Count('id')).values('total')
+        # Read receipts change the last message's is_read too, so every entry is touched
+        cls.objects.filter(conversation_id=conversation_id).update(
+            unread_count=Coalesce(Subquery(unread), 0),
+            updated_at=timezone.now(),
+        )
+    
+    @classmethod
+    def touch(cls, conversation_ids):
+        """Mark the conversations' entries changed, e.g. when their participants change."""
+        cls.objects.filter(conversation_id__in=conversation_ids).update(updated_at=timezone.now())
+
+
+class Contact(models.Model):
+    """
+    Directed edge between two users who share at least one conversation.
+    
+    ``conversation_count`` is the number of shared conversations; the row is
+    removed when it drops to zero. Maintained from participant changes (see
+    ``chat.contacts``), so contact lookups are an index range scan on
+    ``(user, contact)``.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='contacts')
+    contact = models.ForeignKey(User, on_delete=models.CASCADE, related_name='contact_of')
+    conversation_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'contact'], name='chat_contact_user_contact'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} -> {self.contact} ({self.conversation_count})"
 
 
 class UserPresence(models.Model):
@@ -75,7 +229,7 @@ class UserPresence(models.Model):
     """
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='presence')
     is_online = models.BooleanField(default=False)
-    last_seen = models.DateTimeField(auto_now=True)
+    last_seen = models.DateTimeField(default=timezone.now)
     last_activity = models.DateTimeField(auto_now=True)
     
     def __str__(self):
@@ -96,3 +250,91 @@ class MessageReadStatus(models.Model):
     
     def __str__(self):
         return f"{self.user.get_full_name() or self.user.email} read message at {self.read_at}"
+
+
+class ArchivedMessageBlock(models.Model):
+    """
+    Compressed batch of archived messages from one conversation and month.
+    
+    Messages older than the archive horizon are moved out of the hot
+    ``chat_message`` table into these blocks (see ``chat.archive``) so the hot
+    table and its indexes stay small. ``payload`` holds one JSON document per
+    line, compressed with ``codec``.
+    """
+    CODEC_CHOICES = [
+        ('zstd', 'Zstandard'),
+        ('zlib', 'zlib'),
+    ]
+    
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='archived_blocks')
+    month = models.DateField(help_text="First day of the month the messages were sent in")
+    first_seq = models.PositiveBigIntegerField()
+    last_seq = models.PositiveBigIntegerField()
+    message_count = models.PositiveIntegerField()
+    codec = models.CharField(max_length=10, choices=CODEC_CHOICES)
+    payload = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['conversation', '-last_seq']
+        indexes = [
+            models.Index(fields=['conversation', '-last_seq'], name='chat_archive_conv_seq_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.message_count} archived messages ({self.month:%Y-%m}) in {self.conversation_id}"
+
+
+class ChatUpload(models.Model):
+    """
+    A resumable, chunked file upload that becomes a message once complete.
+    
+    Chunks are streamed to storage as separate parts (see ``chat.uploads``)
+    and assembled into the final attachment by ``complete``; each part is
+    verified against the SHA-256 the client sent with it.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='uploads')
+    uploader = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_uploads')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True, help_text="Optional checksum of the whole file")
+    message_type = models.CharField(max_length=20, choices=Message.MESSAGE_TYPES, default='file')
+    content = models.TextField(blank=True)
+    message = models.OneToOneField(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload')
+    assembling_since = models.DateTimeField(null=True, blank=True, help_text="Set while a request assembles the parts")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Upload {self.filename} ({self.size} bytes) by {self.uploader}"
+    
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.size // self.chunk_size))
+    
+    def chunk_length(self, index):
+        """Expected byte length of chunk ``index``."""
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+
+class ChatUploadChunk(models.Model):
+    """
+    A stored part of a ``ChatUpload``.
+    """
+    upload = models.ForeignKey(ChatUpload, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+    name = models.CharField(max_length=255, blank=True, help_text="Storage name of the part file")
+    
+    class Meta:
+        ordering = ['upload', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['upload', 'index'], name='chat_upload_chunk_index'),
+        ]
+    
+    def __str__(self):
+        return f"Chunk {self.index} of {self.upload_id}"
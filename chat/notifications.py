@@ -0,0 +1,57 @@
+"""
+Fan-out of chat events to per-user notification groups.
+"""
+import asyncio
+
+
+def notification_group(user_id):
+    """Name of the group a user's GlobalNotificationsConsumer listens on."""
+    return f'notifications_{user_id}'
+
+
+def build_message_notification(conversation_id, message):
+    """Build the ``new_message_notification`` event for a message (once per message)."""
+    sender_name = message.sender.get_full_name() or message.sender.email
+    return {
+        'type': 'new_message_notification',
+        'conversation_id': str(conversation_id),
+        'message': {
+            'id': str(message.id),
+            'content': message.content,
+            'sender_name': sender_name,
+            'created_at': message.created_at.isoformat()
+        },
+        'sender_name': sender_name
+    }
+
+
+async def group_send_many(channel_layer, groups, event):
+    """
+    Send the same event to many groups in one batch.
+
+    Uses the layer's ``group_send_bulk`` when available (see
+    ``chat.layers.BulkRedisChannelLayer``); other layers get all sends issued
+    concurrently rather than awaited one after another.
+    """
+    groups = list(groups)
+    if not groups:
+        return
+    group_send_bulk = getattr(channel_layer, 'group_send_bulk', None)
+    if group_send_bulk is not None:
+        await group_send_bulk(groups, event)
+    else:
+        await asyncio.gather(*(channel_layer.group_send(group, event) for group in groups))
+
+
+async def notify_new_message(channel_layer, conversation_id, message, participant_ids):
+    """Notify every participant except the sender about a new message."""
+    groups = [
+        notification_group(participant_id)
+        for participant_id in participant_ids
+        if participant_id != message.sender_id
+    ]
+    await group_send_many(
+        channel_layer,
+        groups,
+        build_message_notification(conversation_id, message)
+    )
@@ -0,0 +1,175 @@
+"""
+Per-connection outbound queue with priorities, coalescing and backpressure.
+
+Channel-layer handlers enqueue frames and return right away, so one slow
+socket cannot stall delivery from the channel layer. A writer task drains the
+queue: chat messages first, then droppable events (typing, presence). Droppable
+events that share a coalescing key replace each other while queued, so only the
+latest state is sent. A connection whose backlog of non-droppable frames
+exceeds the queue size, or whose oldest frame waits too long, is disconnected.
+"""
+import asyncio
+import collections
+import logging
+import time
+import weakref
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 'high'
+PRIORITY_LOW = 'low'
+
+# Close code sent to consumers that cannot keep up
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+_live_queues = weakref.WeakSet()
+_totals = collections.Counter()
+
+
+class SlowConsumer(Exception):
+    pass
+
+
+class OutboundQueue:
+    """
+    Bounded send queue for one WebSocket connection.
+    """
+
+    def __init__(self, send, on_slow_consumer, max_size=None, max_lag=None, max_droppable=None, on_send_error=None):
+        self._send = send
+        self._on_slow_consumer = on_slow_consumer
+        self._on_send_error = on_send_error
+        self.max_size = max_size or getattr(settings, 'CHAT_OUTBOUND_QUEUE_SIZE', 500)
+        self.max_lag = max_lag or getattr(settings, 'CHAT_OUTBOUND_MAX_LAG_SECONDS', 30)
+        self.max_droppable = max_droppable or getattr(settings, 'CHAT_OUTBOUND_MAX_DROPPABLE', 100)
+        self._high = collections.deque()
+        self._low = collections.OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._writer = None
+        self._closed = False
+        self.max_depth = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        _live_queues.add(self)
+
+    @property
+    def depth(self):
+        return len(self._high) + len(self._low)
+
+    def put(self, frame, priority=PRIORITY_HIGH, coalesce_key=None):
+        """Queue a frame (text or bytes) for sending."""
+        if self._closed:
+            return
+        if priority == PRIORITY_LOW:
+            key = coalesce_key if coalesce_key is not None else object()
+            if key in self._low:
+                self.coalesced += 1
+                _totals['coalesced'] += 1
+                del self._low[key]
+            elif len(self._low) >= self.max_droppable:
+                self._low.popitem(last=False)
+                self.dropped += 1
+                _totals['dropped'] += 1
+            self._low[key] = frame
+        else:
+            self._high.append((time.monotonic(), frame))
+            if len(self._high) > self.max_size or time.monotonic() - self._high[0][0] > self.max_lag:
+                self._slow_consumer()
+                return
+
+        self.max_depth = max(self.max_depth, self.depth)
+        if self._writer is None:
+            self._writer = asyncio.ensure_future(self._drain())
+        self._wakeup.set()
+
+    async def close(self):
+        """Stop the writer and discard anything still queued."""
+        self._closed = True
+        self._high.clear()
+        self._low.clear()
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+        _live_queues.discard(self)
+
+    def _slow_consumer(self):
+        _totals['slow_consumer_disconnects'] += 1
+        logger.warning(
+            "Disconnecting slow WebSocket consumer: %s frames queued, oldest %.1fs old",
+            self.depth, time.monotonic() - self._high[0][0] if self._high else 0.0
+        )
+        self._closed = True
+        self._high.clear()
+        self._low.clear()
+        asyncio.ensure_future(self._on_slow_consumer())
+
+    def _pop(self):
+        if self._high:
+            return self._high.popleft()[1]
+        if self._low:
+            return self._low.popitem(last=False)[1]
+        return None
+
+    async def _drain(self):
+        try:
+            while not self._closed:
+                frame = self._pop()
+                if frame is None:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                await self._send(frame)
+                self.sent += 1
+                _totals['sent'] += 1
+        except Exception:
+            # Without this the dead writer would go unnoticed until the
+            # backlog tripped the slow-consumer check
+            logger.exception("WebSocket writer failed; closing the connection")
+            _totals['send_errors'] += 1
+            self._writer = None
+            self._closed = True
+            self._high.clear()
+            self._low.clear()
+            _live_queues.discard(self)
+            if self._on_send_error is not None:
+                await self._on_send_error()
+
+
+def outbound_stats():
+    """Queue depth and drop/coalesce counters for this process."""
+    queues = list(_live_queues)
+    depths = [queue.depth for queue in queues]
+    return {
+        'connections': len(queues),
+        'queued_frames': sum(depths),
+        'max_queue_depth': max(depths, default=0),
+        'peak_queue_depth': max((queue.max_depth for queue in queues), default=0),
+        'sent_total': _totals['sent'],
+        'coalesced_total': _totals['coalesced'],
+        'dropped_total': _totals['dropped'],
+        'slow_consumer_disconnects_total': _totals['slow_consumer_disconnects'],
+        'send_errors_total': _totals['send_errors'],
+    }
+
+
+def collect_outbound():
+    """``outbound_stats`` as scrape-time metrics; see ``api.metrics.register_collector``."""
+    stats = outbound_stats()
+    return [
+        ('websocket_outbound_queued_frames', 'gauge', 'Frames waiting in outbound WebSocket queues.',
+         [({}, stats['queued_frames'])]),
+        ('websocket_outbound_max_queue_depth', 'gauge', 'Deepest outbound queue right now.',
+         [({}, stats['max_queue_depth'])]),
+        ('websocket_outbound_frames_total', 'counter', 'Outbound frames, by outcome.', [
+            ({'outcome': 'sent'}, stats['sent_total']),
+            ({'outcome': 'coalesced'}, stats['coalesced_total']),
+            ({'outcome': 'dropped'}, stats['dropped_total']),
+        ]),
+        ('websocket_slow_consumer_disconnects_total', 'counter', 'Connections closed for falling behind.',
+         [({}, stats['slow_consumer_disconnects_total'])]),
+        ('websocket_send_errors_total', 'counter', 'Connections closed because a send failed.',
+         [({}, stats['send_errors_total'])]),
+    ]
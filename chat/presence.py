@@ -0,0 +1,176 @@
+"""
+Presence helpers: who should hear about a user's status, and where to send it.
+
+Online state lives in the cache rather than the database. Every WebSocket
+connection holds a reference on the user's ``presence:conn:<id>`` counter.
+The counter carries a TTL that is refreshed by heartbeats, so users on a
+process that died without cleaning up expire instead of staying online
+forever. Online/offline transitions are buffered in-process and written to
+``UserPresence`` in periodic batches, and once more when the maintenance
+loop is cancelled or the process exits.
+"""
+import asyncio
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .contacts import get_contact_ids  # noqa: F401 (re-exported for consumers)
+from .models import UserPresence
+
+logger = logging.getLogger(__name__)
+
+
+def presence_group(user_id):
+    """Per-user group that receives status changes of the user's contacts."""
+    return f'presence_{user_id}'
+
+
+class PresenceStore:
+    """
+    Connection-refcounted presence kept in a TTL cache.
+    """
+
+    key_prefix = 'presence:conn:'
+
+    def __init__(self, cache_alias='default'):
+        self.cache_alias = cache_alias
+        self._lock = threading.Lock()
+        # Connections held by this process, refreshed by heartbeat()
+        self._local = Counter()
+        # user_id -> (is_online, timestamp) waiting to be flushed to the DB
+        self._pending = {}
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'CHAT_PRESENCE_TTL_SECONDS', 90)
+
+    def _key(self, user_id):
+        return f'{self.key_prefix}{user_id}'
+
+    def connect(self, user_id):
+        """Take a connection reference. Returns True if the user just came online."""
+        key = self._key(user_id)
+        self.cache.add(key, 0, self.ttl)
+        try:
+            count = self.cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr()
+            self.cache.set(key, 1, self.ttl)
+            count = 1
+        self.cache.touch(key, self.ttl)
+
+        with self._lock:
+            self._local[user_id] += 1
+            if count == 1:
+                self._pending[user_id] = (True, timezone.now())
+        return count == 1
+
+    def disconnect(self, user_id):
+        """Drop a connection reference. Returns True if the user just went offline."""
+        key = self._key(user_id)
+        try:
+            count = self.cache.decr(key)
+        except ValueError:
+            count = 0
+        if count <= 0:
+            self.cache.delete(key)
+
+        with self._lock:
+            self._local[user_id] -= 1
+            if self._local[user_id] <= 0:
+                del self._local[user_id]
+            if count <= 0:
+                self._pending[user_id] = (False, timezone.now())
+        return count <= 0
+
+    def heartbeat(self, user_ids=None):
+        """Refresh the TTL of the given users (default: everyone connected here)."""
+        if user_ids is None:
+            with self._lock:
+                user_ids = list(self._local)
+        for user_id in user_ids:
+            self.cache.touch(self._key(user_id), self.ttl)
+
+    def is_online(self, user_id):
+        return bool(self.cache.get(self._key(user_id)))
+
+    def online_user_ids(self, user_ids):
+        """Subset of ``user_ids`` that currently hold at least one connection."""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return []
+        counts = self.cache.get_many([self._key(user_id) for user_id in user_ids])
+        return [user_id for user_id in user_ids if counts.get(self._key(user_id))]
+
+    def flush(self):
+        """Write buffered online/offline transitions to UserPresence in one batch."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        UserPresence.objects.bulk_create(
+            [
+                UserPresence(user_id=user_id, is_online=is_online, last_seen=seen_at)
+                for user_id, (is_online, seen_at) in pending.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['is_online', 'last_seen'],
+        )
+        return len(pending)
+
+
+presence_store = PresenceStore()
+
+_maintenance_task = None
+_exit_flush_registered = False
+
+
+async def _maintain_presence():
+    interval = getattr(settings, 'CHAT_PRESENCE_HEARTBEAT_SECONDS', 30)
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await sync_to_async(presence_store.heartbeat)()
+                await database_sync_to_async(presence_store.flush)()
+            except Exception:
+                logger.exception("Presence heartbeat/flush failed")
+    except asyncio.CancelledError:
+        # Shutting down; keep the transitions buffered since the last tick
+        await database_sync_to_async(flush_on_exit)()
+        raise
+
+
+def flush_on_exit():
+    """Write whatever is still buffered; run when the worker stops."""
+    try:
+        presence_store.flush()
+    except Exception:
+        logger.exception("Presence flush at shutdown failed")
+
+
+def ensure_presence_maintenance():
+    """Start this process's heartbeat + batched DB flush loop once."""
+    global _maintenance_task, _exit_flush_registered
+    if (
+        _maintenance_task is None
+        or _maintenance_task.done()
+        or _maintenance_task.get_loop() is not asyncio.get_running_loop()
+    ):
+        _maintenance_task = asyncio.ensure_future(_maintain_presence())
+    if not _exit_flush_registered:
+        # The loop is not always cancelled on shutdown; catch a plain exit too
+        atexit.register(flush_on_exit)
+        _exit_flush_registered = True
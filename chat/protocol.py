@@ -0,0 +1,110 @@
+"""
+WebSocket frame codecs.
+
+JSON text frames are the default. Clients that offer the
+``workconnect.msgpack.v1`` subprotocol get MessagePack binary frames with
+short keys (see ``KEYS``). In that protocol, sender profiles are interned per
+connection: a message carries ``si`` (sender id), and the profile ``sp``
+(``n`` name, ``a`` avatar, ``r`` role) is only included the first time a
+sender appears or when their profile changes.
+"""
+import json
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+MSGPACK_SUBPROTOCOL = 'workconnect.msgpack.v1'
+
+# Long key -> short key; applied at every nesting level, unknown keys pass through
+KEYS = {
+    'type': 't',
+    'message': 'm',
+    'messages': 'ms',
+    'id': 'i',
+    'seq': 'q',
+    'content': 'c',
+    'message_type': 'mt',
+    'file_url': 'f',
+    'is_read': 'r',
+    'created_at': 'ca',
+    'updated_at': 'ua',
+    'message_ids': 'mi',
+    'reader_id': 'ri',
+    'user_id': 'u',
+    'user_name': 'un',
+    'is_typing': 'ty',
+    'is_online': 'o',
+    'online_users': 'ou',
+    'complete': 'cp',
+    'conversation_id': 'cv',
+    'sender_name': 'sn',
+    'last_seq': 'ls',
+    'last_message_id': 'lm',
+}
+LONG_KEYS = {short: long for long, short in KEYS.items()}
+
+
+class JSONCodec:
+    subprotocol = None
+
+    def encode(self, payload):
+        return json.dumps(payload)
+
+    def decode(self, text_data=None, bytes_data=None):
+        """Decode a client frame; raises ValueError on malformed input."""
+        if text_data is None:
+            raise ValueError("Expected a text frame")
+        return json.loads(text_data)
+
+
+class MsgpackCodec:
+    subprotocol = MSGPACK_SUBPROTOCOL
+
+    def __init__(self):
+        # sender id -> (name, avatar, role) last sent on this connection
+        self.senders = {}
+
+    def encode(self, payload):
+        return msgpack.packb(self.compact(payload))
+
+    def decode(self, text_data=None, bytes_data=None):
+        if bytes_data is None:
+            raise ValueError("Expected a binary frame")
+        try:
+            payload = msgpack.unpackb(bytes_data)
+        except Exception as exc:
+            raise ValueError("Invalid MessagePack frame") from exc
+        if not isinstance(payload, dict):
+            raise ValueError("Frame must be a map")
+        return {LONG_KEYS.get(key, key): value for key, value in payload.items()}
+
+    def compact(self, value):
+        if isinstance(value, dict):
+            compacted = {}
+            for key, item in value.items():
+                if key == 'sender' and isinstance(item, dict):
+                    compacted.update(self.intern_sender(item))
+                else:
+                    compacted[KEYS.get(key, key)] = self.compact(item)
+            return compacted
+        if isinstance(value, list):
+            return [self.compact(item) for item in value]
+        return value
+
+    def intern_sender(self, sender):
+        profile = (sender.get('name'), sender.get('avatar'), sender.get('role'))
+        fields = {'si': sender['id']}
+        if self.senders.get(sender['id']) != profile:
+            self.senders[sender['id']] = profile
+            fields['sp'] = {'n': profile[0], 'a': profile[1], 'r': profile[2]}
+        return fields
+
+
+def negotiate(subprotocols):
+    """Pick a codec from the subprotocols offered by the client."""
+    if MSGPACK_AVAILABLE and MSGPACK_SUBPROTOCOL in (subprotocols or ()):
+        return MsgpackCodec()
+    return JSONCodec()
@@ -0,0 +1,66 @@
+"""
+Replay of messages a client missed while its socket was down.
+
+Every posted message is appended to a bounded per-conversation ring in the
+cache. On ``resume`` the gap after the client's last seen ``seq`` is served
+from the ring when it covers it contiguously, and from the database
+otherwise (ring evicted, expired or lost an append).
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Conversation, Message
+from .services import serialize_message
+
+
+def ring_key(conversation_id):
+    return f'chat:ring:{conversation_id}'
+
+
+def remember_message(conversation_id, payload):
+    """Append a serialized message to the conversation's recent-message ring."""
+    size = getattr(settings, 'CHAT_REPLAY_RING_SIZE', 200)
+    key = ring_key(conversation_id)
+    ring = cache.get(key) or []
+    ring.append(payload)
+    cache.set(key, ring[-size:], getattr(settings, 'CHAT_REPLAY_RING_TTL_SECONDS', 86400))
+
+
+def resolve_seq(conversation_id, message_id):
+    """Sequence number of a message, or None if it is not in this conversation."""
+    try:
+        message_id = uuid.UUID(str(message_id))
+    except ValueError:
+        return None
+    return Message.objects.filter(
+        id=message_id, conversation_id=conversation_id
+    ).values_list('seq', flat=True).first()
+
+
+def messages_since(conversation_id, last_seq):
+    """
+    Messages with ``seq > last_seq``, oldest first.
+
+    Returns ``(messages, complete)``; ``complete`` is False when the gap is
+    larger than ``CHAT_REPLAY_MAX_MESSAGES`` and the client should reload
+    history over REST instead.
+    """
+    limit = getattr(settings, 'CHAT_REPLAY_MAX_MESSAGES', 500)
+    current_seq = Conversation.objects.filter(pk=conversation_id).values_list('last_seq', flat=True).first()
+    if current_seq is None or current_seq <= last_seq:
+        return [], True
+    if current_seq - last_seq > limit:
+        return [], False
+
+    ring = cache.get(ring_key(conversation_id)) or []
+    by_seq = {payload['seq']: payload for payload in ring}
+    wanted = range(last_seq + 1, current_seq + 1)
+    if all(seq in by_seq for seq in wanted):
+        return [by_seq[seq] for seq in wanted], True
+
+    messages = Message.objects.filter(
+        conversation_id=conversation_id, seq__gt=last_seq
+    ).select_related('sender').order_by('seq')
+    return [serialize_message(message) for message in messages], True
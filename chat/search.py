@@ -0,0 +1,91 @@
+"""
+Full-text search over chat messages, scoped to the caller's conversations.
+
+On PostgreSQL queries run against the ``chat_message_content_fts`` GIN
+expression index (see migration 0004) with ``ts_rank`` ordering and
+``ts_headline`` highlighting. Other backends (SQLite in tests/dev) fall back
+to a term match with ranking and highlighting done in Python.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections, router, transaction
+
+from .models import Conversation, Message
+
+# Must match the text search configuration used by the index in migration 0004
+SEARCH_CONFIG = 'english'
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+
+
+def search_messages(user, query, conversation_id=None, limit=50):
+    """
+    Return up to ``limit`` messages matching ``query``, best match first.
+
+    Each message gets ``rank`` and ``highlight`` attributes. Candidates are
+    prefiltered to the conversations ``user`` participates in before any
+    text matching happens.
+    """
+    conversation_ids = Conversation.participants.through.objects.filter(
+        user_id=user.id
+    ).values('conversation_id')
+    messages = Message.objects.filter(conversation_id__in=conversation_ids)
+    if conversation_id:
+        messages = messages.filter(conversation_id=conversation_id)
+    messages = messages.select_related('sender')
+
+    connection = connections[router.db_for_read(Message)]
+    if connection.vendor == 'postgresql':
+        return _search_postgres(connection, messages, query, limit)
+    return _search_fallback(messages, query, limit)
+
+
+def _search_postgres(connection, messages, query, limit):
+    from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+
+    vector = SearchVector('content', config=SEARCH_CONFIG)
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    results = messages.annotate(
+        document=vector
+    ).filter(
+        document=search_query
+    ).annotate(
+        rank=SearchRank(vector, search_query),
+        highlight=SearchHeadline(
+            'content',
+            search_query,
+            config=SEARCH_CONFIG,
+            start_sel=HIGHLIGHT_START,
+            stop_sel=HIGHLIGHT_STOP,
+        ),
+    ).order_by('-rank', '-created_at')
+
+    # Hold the query to the latency budget; Postgres cancels it past the limit
+    timeout_ms = getattr(settings, 'CHAT_SEARCH_TIMEOUT_MS', 500)
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL statement_timeout = %s', [timeout_ms])
+        return list(results[:limit])
+
+
+def _search_fallback(messages, query, limit):
+    terms = [term for term in re.findall(r'\w+', query.lower()) if term]
+    if not terms:
+        return []
+
+    for term in terms:
+        messages = messages.filter(content__icontains=term)
+    # Rank a bounded window of the newest candidates
+    candidates = list(messages.order_by('-created_at')[:limit * 4])
+
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    for message in candidates:
+        hits = len(pattern.findall(message.content))
+        message.rank = hits / (1 + len(message.content.split()))
+        message.highlight = pattern.sub(
+            lambda match: f'{HIGHLIGHT_START}{match.group(0)}{HIGHLIGHT_STOP}', message.content
+        )
+    candidates.sort(key=lambda message: message.rank, reverse=True)
+    return candidates[:limit]
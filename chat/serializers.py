@@ -1,10 +1,48 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.core.exceptions import SuspiciousFileOperation
 from django.core.files.uploadedfile import UploadedFile
-from .models import Conversation, Message, UserPresence, MessageReadStatus
+from django.core.files.utils import validate_file_name
+from django.utils.text import get_valid_filename
+from .models import ChatUpload, Conversation, Message, UserPresence, MessageReadStatus
+from .presence import presence_store
+from .services import get_or_create_conversation, post_message
 
 User = get_user_model()
 
+# Attachment limits, shared by direct and chunked uploads
+MAX_ATTACHMENT_SIZE = 10 * 1024 * 1024  # 10MB in bytes
+ALLOWED_ATTACHMENT_TYPES = [
+    # Images
+    'image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp',
+    # Documents
+    'application/pdf',
+    'application/msword',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.ms-excel',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'application/vnd.ms-powerpoint',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    # Text files
+    'text/plain', 'text/csv',
+    # Archives
+    'application/zip', 'application/x-rar-compressed', 'application/x-7z-compressed'
+]
+
+
+def validate_attachment(size, content_type):
+    # File size validation
+    if size > MAX_ATTACHMENT_SIZE:
+        raise serializers.ValidationError(
+            f"File size too large. Maximum size is {MAX_ATTACHMENT_SIZE // (1024 * 1024)}MB."
+        )
+    
+    # File type validation
+    if content_type is not None and content_type not in ALLOWED_ATTACHMENT_TYPES:
+        raise serializers.ValidationError(
+            "Invalid file type. Allowed types: images, PDF, Word, Excel, PowerPoint, text files, and archives."
+        )
+
 class UserBasicSerializer(serializers.ModelSerializer):
     """Basic user information for chat contexts."""
     name = serializers.SerializerMethodField()
@@ -34,10 +72,10 @@ class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
         fields = [
-            'id', 'content', 'message_type', 'sender', 'file_url',
+            'id', 'seq', 'content', 'message_type', 'sender', 'file_url',
             'is_read', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'sender', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'seq', 'sender', 'created_at', 'updated_at']
     
     def get_file_url(self, obj):
         if obj.file_attachment:
@@ -47,6 +85,14 @@ class MessageSerializer(serializers.ModelSerializer):
             return obj.file_attachment.url
         return None
 
+class MessageSearchResultSerializer(MessageSerializer):
+    """Message search hit with relevance rank and highlighted content."""
+    rank = serializers.FloatField(read_only=True)
+    highlight = serializers.CharField(read_only=True)
+    
+    class Meta(MessageSerializer.Meta):
+        fields = MessageSerializer.Meta.fields + ['rank', 'highlight']
+
 class MessageCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating new messages."""
     
@@ -57,35 +103,7 @@ class MessageCreateSerializer(serializers.ModelSerializer):
     def validate_file_attachment(self, value):
         """Validate file upload with size and type restrictions."""
         if value:
-            # File size validation (max 10MB)
-            max_size = 10 * 1024 * 1024  # 10MB in bytes
-            if value.size > max_size:
-                raise serializers.ValidationError(
-                    f"File size too large. Maximum size is {max_size // (1024 * 1024)}MB."
-                )
-            
-            # File type validation
-            allowed_types = [
-                # Images
-                'image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp',
-                # Documents
-                'application/pdf',
-                'application/msword',
-                'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                'application/vnd.ms-excel',
-                'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                'application/vnd.ms-powerpoint',
-                'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-                # Text files
-                'text/plain', 'text/csv',
-                # Archives
-                'application/zip', 'application/x-rar-compressed', 'application/x-7z-compressed'
-            ]
-            
-            if hasattr(value, 'content_type') and value.content_type not in allowed_types:
-                raise serializers.ValidationError(
-                    "Invalid file type. Allowed types: images, PDF, Word, Excel, PowerPoint, text files, and archives."
-                )
+            validate_attachment(value.size, getattr(value, 'content_type', None))
         
         return value
     
@@ -117,13 +135,7 @@ class MessageCreateSerializer(serializers.ModelSerializer):
         conversation_id = self.context['conversation_id']
         sender = self.context['request'].user
         
-        conversation = Conversation.objects.get(id=conversation_id)
-        message = Message.objects.create(
-            conversation=conversation,
-            sender=sender,
-            **validated_data
-        )
-        return message
+        return post_message(conversation_id, sender, **validated_data)
 
 class ConversationListSerializer(serializers.ModelSerializer):
     participants = UserBasicSerializer(many=True, read_only=True)
@@ -136,6 +148,9 @@ class ConversationListSerializer(serializers.ModelSerializer):
         fields = ["id", "participants", "job", "job_title", "last_message", "unread_count", "created_at", "updated_at"]
     
     def get_unread_count(self, obj):
+        # Set from the user's InboxEntry by the inbox list
+        if hasattr(obj, "inbox_unread_count"):
+            return obj.inbox_unread_count
         user = self.context.get("request").user
         if user:
             return obj.messages.filter(is_read=False).exclude(sender=user).count()
@@ -164,18 +179,67 @@ class ConversationCreateSerializer(serializers.ModelSerializer):
         fields = ["job", "participant_ids"]
     
     def create(self, validated_data):
-        participant_ids = validated_data.pop("participant_ids")
-        conversation = Conversation.objects.create(**validated_data)
-        participants = User.objects.filter(id__in=participant_ids)
-        conversation.participants.set(participants)
-        creator = self.context["request"].user
-        if creator not in conversation.participants.all():
-            conversation.participants.add(creator)
+        participant_ids = set(
+            User.objects.filter(id__in=validated_data.pop("participant_ids")).values_list("id", flat=True)
+        )
+        participant_ids.add(self.context["request"].user.id)
+        conversation, self.created = get_or_create_conversation(participant_ids, validated_data.get("job"))
         return conversation
 
 class UserPresenceSerializer(serializers.ModelSerializer):
+    """
+    Presence of one user. ``is_online`` comes from the presence store, not the
+    database row, which lags behind and misses expired connections. Pass
+    ``online_ids`` in the context to check a whole list with one cache read.
+    """
     user = UserBasicSerializer(read_only=True)
+    is_online = serializers.SerializerMethodField()
     
     class Meta:
         model = UserPresence
         fields = ["user", "is_online", "last_seen"]
+    
+    def get_is_online(self, obj):
+        online_ids = self.context.get('online_ids')
+        if online_ids is None:
+            return presence_store.is_online(obj.user_id)
+        return obj.user_id in online_ids
+
+
+class ChatUploadCreateSerializer(serializers.ModelSerializer):
+    """Serializer for starting a chunked upload."""
+    size = serializers.IntegerField(min_value=1)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, allow_blank=True)
+    
+    class Meta:
+        model = ChatUpload
+        fields = ['filename', 'content_type', 'size', 'sha256', 'message_type', 'content']
+    
+    def validate_filename(self, value):
+        """Reject paths now rather than after every chunk has been sent."""
+        try:
+            validate_file_name(value)
+            return get_valid_filename(value)
+        except SuspiciousFileOperation:
+            raise serializers.ValidationError("Enter a file name, not a path.")
+    
+    def validate(self, attrs):
+        validate_attachment(attrs['size'], attrs['content_type'])
+        return attrs
+
+
+class ChatUploadSerializer(serializers.ModelSerializer):
+    """State of a chunked upload, including which chunks the server has."""
+    total_chunks = serializers.IntegerField(read_only=True)
+    received_chunks = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ChatUpload
+        fields = [
+            'id', 'conversation', 'filename', 'content_type', 'size', 'chunk_size',
+            'total_chunks', 'received_chunks', 'message', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+    
+    def get_received_chunks(self, obj):
+        return sorted(chunk.index for chunk in obj.chunks.all())
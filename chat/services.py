@@ -0,0 +1,77 @@
+"""
+Service helpers shared by the REST and WebSocket chat paths.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from .models import Conversation, Message, make_canonical_key
+
+
+def post_message(conversation_id, sender, content='', message_type='text', **fields):
+    """
+    Create a message in a conversation without fetching the conversation row.
+
+    The write is one INSERT plus one UPDATE-by-pk of the conversation inside
+    a single transaction (see ``Message.save``). Raises
+    ``Conversation.DoesNotExist`` if the conversation is gone.
+    """
+    message = Message(
+        conversation_id=conversation_id,
+        sender=sender,
+        content=content,
+        message_type=message_type,
+        **fields
+    )
+    message.save(force_insert=True)
+    return message
+
+
+def get_or_create_conversation(participant_ids, job=None):
+    """
+    Return ``(conversation, created)`` for a participant set and optional job.
+
+    Looks the thread up by its unique canonical key, so repeated requests for
+    the same people and job reuse one conversation instead of creating
+    duplicates.
+    """
+    participant_ids = set(participant_ids)
+    key = make_canonical_key(participant_ids, job.id if job else None)
+    conversation = Conversation.objects.filter(canonical_key=key).first()
+    if conversation is not None:
+        return conversation, False
+    try:
+        with transaction.atomic():
+            conversation = Conversation.objects.create(job=job, canonical_key=key)
+            conversation.participants.set(participant_ids)
+    except IntegrityError:
+        # Lost a race with a concurrent create of the same thread
+        return Conversation.objects.get(canonical_key=key), False
+    return conversation, True
+
+
+def absolute_media_url(field_file):
+    """Absolute URL for a stored file, or None when the field is empty."""
+    if field_file:
+        base_url = getattr(settings, 'SITE_URL', 'http://localhost:8001')
+        return f"{base_url}{field_file.url}"
+    return None
+
+
+def serialize_message(message):
+    """Payload of a ``chat_message`` event (also what reconnect replay sends)."""
+    return {
+        'id': str(message.id),
+        'seq': message.seq,
+        'content': message.content,
+        'message_type': message.message_type,
+        'sender': {
+            'id': message.sender.id,
+            'name': message.sender.get_full_name() or message.sender.email,
+            'avatar': absolute_media_url(message.sender.profile_picture),
+            'role': message.sender.role
+        },
+        'file_url': absolute_media_url(message.file_attachment),
+        'is_read': message.is_read,
+        'created_at': message.created_at.isoformat(),
+        'updated_at': message.updated_at.isoformat()
+    }
@@ -0,0 +1,124 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models.signals import m2m_changed, pre_delete
+from django.dispatch import receiver
+
+from .contacts import apply_deltas, pair_deltas, participant_ids
+from .models import Conversation, InboxEntry, make_canonical_key
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def sync_inbox_entries(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep one InboxEntry per conversation participant."""
+    if action == 'post_add':
+        if reverse:
+            # user.conversations.add(...): instance is the user
+            conversations = Conversation.objects.filter(pk__in=pk_set).values_list('pk', 'updated_at')
+            entries = [
+                InboxEntry(user_id=instance.pk, conversation_id=conversation_id, last_activity=updated_at)
+                for conversation_id, updated_at in conversations
+            ]
+        else:
+            entries = [
+                InboxEntry(user_id=user_id, conversation_id=instance.pk, last_activity=instance.updated_at)
+                for user_id in pk_set
+            ]
+        InboxEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    elif action == 'post_remove':
+        if reverse:
+            InboxEntry.objects.filter(user_id=instance.pk, conversation_id__in=pk_set).delete()
+        else:
+            InboxEntry.objects.filter(conversation_id=instance.pk, user_id__in=pk_set).delete()
+    elif action == 'pre_clear':
+        if reverse:
+            entries = InboxEntry.objects.filter(user_id=instance.pk)
+            conversation_ids = list(entries.values_list('conversation_id', flat=True))
+            entries.delete()
+            InboxEntry.touch(conversation_ids)
+        else:
+            InboxEntry.objects.filter(conversation_id=instance.pk).delete()
+
+    if action in ('post_add', 'post_remove'):
+        # The inbox list shows participants, so the other members' entries changed too
+        InboxEntry.touch(pk_set if reverse else [instance.pk])
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def sync_contacts(sender, instance, action, reverse, pk_set, **kwargs):
+    """Adjust shared-conversation counts between participants."""
+    if action == 'pre_remove':
+        # remove() reports every pk it was given, members or not
+        if reverse:
+            members = instance.conversations.filter(pk__in=pk_set).values_list('pk', flat=True)
+        else:
+            members = Conversation.participants.through.objects.filter(
+                conversation_id=instance.pk, user_id__in=pk_set
+            ).values_list('user_id', flat=True)
+        instance._removed_member_ids = set(members)
+        return
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if action == 'post_remove':
+        pk_set = instance.__dict__.pop('_removed_member_ids', set())
+    elif action == 'pre_clear':
+        if reverse:
+            pk_set = set(instance.conversations.values_list('pk', flat=True))
+        else:
+            pk_set = participant_ids(instance.pk)
+    if reverse:
+        # instance is the user, pk_set the conversations
+        changes = [(conversation_id, {instance.pk}) for conversation_id in pk_set]
+    else:
+        changes = [(instance.pk, pk_set)]
+
+    deltas = Counter()
+    for conversation_id, changed_ids in changes:
+        # After an add the changed users are already members; after a remove they are not
+        member_ids = participant_ids(conversation_id) | set(changed_ids)
+        deltas.update(pair_deltas(changed_ids, member_ids, 1 if action == 'post_add' else -1))
+    apply_deltas(deltas)
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def sync_canonical_key(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep ``canonical_key`` in step with the participant set.
+
+    A conversation whose new participant set already has a canonical thread
+    gives up its key, so get_or_create_conversation keeps returning that one.
+    """
+    if action == 'pre_clear' and reverse:
+        # post_clear does not say which conversations the user left
+        instance._cleared_conversation_ids = list(instance.conversations.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        conversation_ids = [instance.pk]
+    elif action == 'post_clear':
+        conversation_ids = instance.__dict__.pop('_cleared_conversation_ids', [])
+    else:
+        conversation_ids = pk_set
+    for conversation_id, job_id, old_key in Conversation.objects.filter(
+        pk__in=conversation_ids
+    ).values_list('pk', 'job_id', 'canonical_key'):
+        key = make_canonical_key(participant_ids(conversation_id), job_id)
+        if key == old_key:
+            continue
+        try:
+            with transaction.atomic():
+                Conversation.objects.filter(pk=conversation_id).update(canonical_key=key)
+        except IntegrityError:
+            Conversation.objects.filter(pk=conversation_id).update(canonical_key=None)
+            key = None
+        if not reverse:
+            instance.canonical_key = key
+
+
+@receiver(pre_delete, sender=Conversation)
+def drop_conversation_contacts(sender, instance, **kwargs):
+    # Cascading deletes of participant rows do not send m2m_changed
+    members = participant_ids(instance.pk)
+    apply_deltas(pair_deltas(members, members, -1))
@@ -1,3 +1,1106 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import shutil
+import tempfile
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.testing import QueryBudgetMixin, get_routes
+from users.models import Job, JobCategory, User
+
+from . import presence, routing, urls
+from .archive import archive_conversation, conversation_history, decompress
+from .coalescing import ReadReceiptBatcher, TypingCoalescer
+from .contacts import get_contact_ids
+from .layers import SerializingInMemoryChannelLayer
+from .management.commands.bench_websocket_load import percentile
+from .consumers import OutboundQueueMixin
+from .notifications import group_send_many, notification_group, notify_new_message
+from .outbound import PRIORITY_LOW, SLOW_CONSUMER_CLOSE_CODE, OutboundQueue
+from .protocol import MSGPACK_SUBPROTOCOL, JSONCodec, MsgpackCodec, negotiate
+from .models import (
+    ArchivedMessageBlock, ChatUpload, ChatUploadChunk, Contact, Conversation, InboxEntry, Message, UserPresence,
+    make_canonical_key,
+)
+from .presence import PresenceStore, presence_store
+from .replay import messages_since, remember_message, resolve_seq
+from .search import search_messages
+from .services import get_or_create_conversation, post_message, serialize_message
+from .uploads import UploadError, complete_upload, part_name, received_chunks, start_upload, store_chunk
+
+
+def seed_users(count, prefix):
+    existing = User.objects.filter(email__startswith=f'{prefix}-').count()
+    User.objects.bulk_create([
+        User(email=f'{prefix}-{i}@example.com', username=f'{prefix}-{i}', first_name='Test', last_name=str(i), password='!')
+        for i in range(existing, count)
+    ])
+    return User.objects.filter(email__startswith=f'{prefix}-').order_by('id')
+
+
+class EndpointQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every GET route in chat.urls runs a fixed number of queries."""
+
+    covered_routes = {
+        'api-root', 'chat-connection-stats',
+        'conversation-list', 'conversation-detail', 'conversation-messages', 'conversation-upload-status',
+        'message-list', 'message-detail', 'message-search',
+        'presence-list', 'presence-detail', 'presence-online-users',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='me@example.com', username='me', first_name='Morgan', last_name='Me')
+        cls.other = User.objects.create(email='you@example.com', username='you', first_name='Yuri', last_name='You')
+        cls.conversation = Conversation.objects.create()
+        cls.conversation.participants.add(cls.user, cls.other)
+
+    def setUp(self):
+        self.api = APIClient()
+
+    def get(self, user, name, *args, query=''):
+        self.api.force_authenticate(user)
+        url = reverse(name, args=args) + query
+        return lambda: self.api.get(url)
+
+    def seed_messages(self, count):
+        """Bring the shared conversation up to ``count`` messages, alternating senders."""
+        existing = self.conversation.messages.count()
+        Message.objects.bulk_create([
+            Message(
+                conversation=self.conversation,
+                sender=self.user if i % 2 else self.other,
+                content=f'Is the sink still leaking? ({i})',
+                seq=i + 1,
+            )
+            for i in range(existing, count)
+        ])
+
+    def test_every_get_route_is_covered(self):
+        self.assertEqual(get_routes(urls.urlpatterns) - self.covered_routes, set())
+
+    def test_api_root(self):
+        self.assertMaxQueries(0, self.get(self.user, 'api-root'))
+
+    def test_connection_stats(self):
+        admin = User.objects.create(email='admin@example.com', username='admin', is_staff=True)
+        self.assertMaxQueries(0, self.get(admin, 'chat-connection-stats'))
+
+    def test_conversation_list(self):
+        def seed(count):
+            others = seed_users(count, 'contact')
+            have = set(InboxEntry.objects.filter(user=self.user).values_list('conversation__participants', flat=True))
+            conversations, participants, entries, messages = [], [], [], []
+            for other in others:
+                if other.pk in have:
+                    continue
+                conversation = Conversation()
+                conversations.append(conversation)
+                participants += [
+                    Conversation.participants.through(conversation=conversation, user=self.user),
+                    Conversation.participants.through(conversation=conversation, user=other),
+                ]
+                entries.append(InboxEntry(user=self.user, conversation=conversation, unread_count=1))
+                messages.append(Message(conversation=conversation, sender=other, content='Hello', seq=1))
+            Conversation.objects.bulk_create(conversations)
+            Conversation.participants.through.objects.bulk_create(participants)
+            InboxEntry.objects.bulk_create(entries)
+            Message.objects.bulk_create(messages)
+            for conversation, message in zip(conversations, messages):
+                conversation.last_message = message
+            Conversation.objects.bulk_update(conversations, ['last_message'])
+        self.assertQueriesConstant(self.get(self.user, 'conversation-list'), seed)
+
+    def test_conversation_detail(self):
+        self.assertQueriesConstant(self.get(self.user, 'conversation-detail', self.conversation.pk), self.seed_messages)
+
+    def test_conversation_messages(self):
+        self.assertQueriesConstant(self.get(self.user, 'conversation-messages', self.conversation.pk), self.seed_messages)
+
+    def test_upload_status(self):
+        upload = ChatUpload.objects.create(
+            conversation=self.conversation, uploader=self.user, filename='plan.pdf',
+            content_type='application/pdf', size=10_000_000, chunk_size=1000
+        )
+
+        def seed(count):
+            ChatUploadChunk.objects.bulk_create([
+                ChatUploadChunk(upload=upload, index=i, size=1000, sha256='0' * 64)
+                for i in range(upload.chunks.count(), count)
+            ])
+        self.assertQueriesConstant(
+            self.get(self.user, 'conversation-upload-status', self.conversation.pk, upload.pk), seed
+        )
+
+    def test_messages(self):
+        self.assertQueriesConstant(self.get(self.user, 'message-list'), self.seed_messages)
+        self.assertQueriesConstant(self.get(self.user, 'message-search', query='?q=leaking'), self.seed_messages)
+        message = self.conversation.messages.first()
+        self.assertMaxQueries(1, self.get(self.user, 'message-detail', message.pk))
+
+    def test_presence(self):
+        def seed(count):
+            contacts = seed_users(count, 'presence')
+            have = set(Contact.objects.filter(user=self.user).values_list('contact_id', flat=True))
+            new = [contact for contact in contacts if contact.pk not in have]
+            Contact.objects.bulk_create([
+                Contact(user=contact, contact=self.user, conversation_count=1) for contact in new
+            ] + [
+                Contact(user=self.user, contact=contact, conversation_count=1) for contact in new
+            ])
+            UserPresence.objects.bulk_create([UserPresence(user=contact) for contact in new])
+        self.assertQueriesConstant(self.get(self.user, 'presence-list'), seed)
+        self.assertQueriesConstant(self.get(self.user, 'presence-online-users'), seed)
+        presence = UserPresence.objects.filter(user__contact_of__user=self.user).first()
+        self.assertMaxQueries(1, self.get(self.user, 'presence-detail', presence.pk))
+
+
+async def open_socket(user, path):
+    communicator = WebsocketCommunicator(URLRouter(routing.websocket_urlpatterns), path)
+    communicator.scope['user'] = user
+    connected, _ = await communicator.connect()
+    assert connected, f'{path} refused the connection'
+    return communicator
+
+
+async def status_changes(communicator):
+    """``(user_id, is_online)`` for every status change the socket has received."""
+    changes = []
+    while not await communicator.receive_nothing(0.2):
+        event = await communicator.receive_json_from()
+        if event['type'] == 'user_status_change':
+            changes.append((event['user_id'], event['is_online']))
+    return changes
+
+
+@mock.patch('chat.consumers.ensure_presence_maintenance', new=mock.Mock())
+class PresenceTests(TransactionTestCase):
+    """Chat and presence sockets share one refcount; either one announces transitions."""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create(email='alice@example.com', username='alice', first_name='Alice')
+        self.bob = User.objects.create(email='bob@example.com', username='bob', first_name='Bob')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.alice, self.bob)
+        self.chat_path = f'/ws/chat/{self.conversation.pk}/'
+
+    async def test_chat_socket_opened_first_announces_online(self):
+        bob = await open_socket(self.bob, '/ws/presence/')
+        await status_changes(bob)
+
+        chat = await open_socket(self.alice, self.chat_path)
+        presence = await open_socket(self.alice, '/ws/presence/')
+        self.assertEqual(await status_changes(bob), [(self.alice.pk, True)])
+
+        for communicator in (presence, chat, bob):
+            await communicator.disconnect()
+
+    async def test_chat_socket_closed_last_announces_offline(self):
+        chat = await open_socket(self.alice, self.chat_path)
+        presence = await open_socket(self.alice, '/ws/presence/')
+        bob = await open_socket(self.bob, '/ws/presence/')
+        await status_changes(bob)
+
+        await presence.disconnect()
+        self.assertEqual(await status_changes(bob), [])
+        await chat.disconnect()
+        self.assertEqual(await status_changes(bob), [(self.alice.pk, False)])
+
+        await bob.disconnect()
+
+    async def test_status_goes_only_to_contacts(self):
+        carol = await User.objects.acreate(email='carol@example.com', username='carol')
+        bob = await open_socket(self.bob, '/ws/presence/')
+        stranger = await open_socket(carol, '/ws/presence/')
+        await status_changes(bob)
+        await status_changes(stranger)
+
+        alice = await open_socket(self.alice, '/ws/presence/')
+        self.assertEqual(await status_changes(bob), [(self.alice.pk, True)])
+        self.assertEqual(await status_changes(stranger), [])
+
+        for communicator in (alice, stranger, bob):
+            await communicator.disconnect()
+
+    async def test_initial_presence_lists_online_contacts_only(self):
+        carol = await User.objects.acreate(email='carol@example.com', username='carol')
+        bob = await open_socket(self.bob, '/ws/presence/')
+        stranger = await open_socket(carol, '/ws/presence/')
+
+        alice = await open_socket(self.alice, '/ws/presence/')
+        self.assertEqual(await alice.receive_json_from(), {'type': 'initial_presence', 'online_users': [self.bob.pk]})
+
+        for communicator in (alice, stranger, bob):
+            await communicator.disconnect()
+
+    def test_presence_list_reads_the_presence_store(self):
+        # A stale row left behind by a worker that died
+        UserPresence.objects.create(user=self.bob, is_online=True)
+        api = APIClient()
+        api.force_authenticate(self.alice)
+
+        response = api.get(reverse('presence-list'))
+        self.assertEqual([row['is_online'] for row in response.data], [False])
+        self.assertEqual(api.get(reverse('presence-online-users')).data['results'], [])
+
+        presence_store.connect(self.bob.pk)
+        response = api.get(reverse('presence-list'))
+        self.assertEqual([row['is_online'] for row in response.data], [True])
+        self.assertEqual(len(api.get(reverse('presence-online-users')).data['results']), 1)
+
+
+class SerializingLayerTests(SimpleTestCase):
+
+    async def test_group_send_delivers_a_decoded_copy_per_channel(self):
+        layer = SerializingInMemoryChannelLayer()
+        channels = [await layer.new_channel() for _ in range(2)]
+        for channel in channels:
+            await layer.group_add('room', channel)
+        message = {'type': 'chat.message', 'seq': 1, 'tags': ['a']}
+        await layer.group_send('room', message)
+        for channel in channels:
+            received = await layer.receive(channel)
+            self.assertEqual(received, message)
+            self.assertIsNot(received, message)
+
+    async def test_round_trip_is_waited_for(self):
+        layer = SerializingInMemoryChannelLayer(round_trip=0.05)
+        channel = await layer.new_channel()
+        started = asyncio.get_running_loop().time()
+        await layer.send(channel, {'type': 'ping'})
+        self.assertGreaterEqual(asyncio.get_running_loop().time() - started, 0.05)
+        self.assertEqual(await layer.receive(channel), {'type': 'ping'})
+
+
+@mock.patch('chat.consumers.ensure_presence_maintenance', new=mock.Mock())
+class WebSocketLoadCommandTests(TransactionTestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile([], 50), 0.0)
+        self.assertEqual(percentile(values, 50), 51)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+
+    def test_rejects_bad_arguments(self):
+        with self.assertRaisesMessage(CommandError, 'Unknown layer(s): carrier-pigeon'):
+            call_command('bench_websocket_load', layers='memory,carrier-pigeon', stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, '--members cannot exceed --users'):
+            call_command('bench_websocket_load', users=2, members=3, stdout=io.StringIO())
+
+    def test_short_run_reports_and_cleans_up(self):
+        out = io.StringIO()
+        call_command(
+            'bench_websocket_load', users=2, conversations=1, members=2, duration=0.3, message_rate=20,
+            layers='redis-standin', round_trip_ms=0, stdout=out,
+        )
+        output = out.getvalue()
+        self.assertIn('[redis-standin]', output)
+        self.assertRegex(output, r'delivered [1-9]')
+        self.assertIn('delivery latency: p50', output)
+        self.assertFalse(User.objects.filter(email__startswith='ws-bench-').exists())
+        self.assertFalse(Conversation.objects.exists())
+
+
+class PresenceStoreTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.store = PresenceStore()
+        self.user = User.objects.create(email='me@example.com', username='me')
+
+    def test_connections_are_refcounted(self):
+        self.assertTrue(self.store.connect(self.user.pk))
+        self.assertFalse(self.store.connect(self.user.pk))
+        self.assertFalse(self.store.disconnect(self.user.pk))
+        self.assertTrue(self.store.is_online(self.user.pk))
+        self.assertTrue(self.store.disconnect(self.user.pk))
+        self.assertEqual(self.store.online_user_ids([self.user.pk]), [])
+
+    def test_flush_writes_the_latest_transition_in_one_query(self):
+        self.store.connect(self.user.pk)
+        self.store.disconnect(self.user.pk)
+        self.store.connect(self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.store.flush(), 1)
+        self.assertTrue(UserPresence.objects.get(user=self.user).is_online)
+        self.assertEqual(self.store.flush(), 0)
+
+
+
+@override_settings(CHAT_PRESENCE_HEARTBEAT_SECONDS=3600)
+class PresenceShutdownTests(TransactionTestCase):
+    """Transitions buffered since the last tick are written when the worker stops."""
+
+    def setUp(self):
+        cache.clear()
+        pending = mock.patch.object(presence_store, '_pending', {})
+        pending.start()
+        self.addCleanup(pending.stop)
+        self.user = User.objects.create(email='me@example.com', username='me')
+
+    async def test_cancelling_maintenance_flushes(self):
+        with mock.patch('chat.presence.atexit.register'), mock.patch('chat.presence._exit_flush_registered', False):
+            presence.ensure_presence_maintenance()
+            task = presence._maintenance_task
+            await sync_to_async(presence_store.connect)(self.user.pk)
+            await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        row = await UserPresence.objects.aget(user=self.user)
+        self.assertTrue(row.is_online)
+        self.assertEqual(presence_store._pending, {})
+        await sync_to_async(presence_store.disconnect)(self.user.pk)
+
+    async def test_exit_hook_is_registered_once_and_flushes(self):
+        with mock.patch('chat.presence.atexit.register') as register, \
+                mock.patch('chat.presence._exit_flush_registered', False):
+            presence.ensure_presence_maintenance()
+            presence.ensure_presence_maintenance()
+            task = presence._maintenance_task
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+        register.assert_called_once_with(presence.flush_on_exit)
+
+        await sync_to_async(presence_store.connect)(self.user.pk)
+        await sync_to_async(presence_store.disconnect)(self.user.pk)
+        await sync_to_async(presence.flush_on_exit)()
+        row = await UserPresence.objects.aget(user=self.user)
+        self.assertFalse(row.is_online)
+
+class CanonicalConversationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create(email='alice@example.com', username='alice')
+        cls.bob = User.objects.create(email='bob@example.com', username='bob')
+        cls.carol = User.objects.create(email='carol@example.com', username='carol')
+
+    def test_same_participants_reuse_the_thread(self):
+        first, created = get_or_create_conversation([self.alice.pk, self.bob.pk])
+        self.assertTrue(created)
+        second, created = get_or_create_conversation([self.bob.pk, self.alice.pk])
+        self.assertFalse(created)
+        self.assertEqual(first.pk, second.pk)
+
+    def test_lost_race_returns_the_winner(self):
+        winner, _ = get_or_create_conversation([self.alice.pk, self.bob.pk])
+        # The lookup misses, as if the other create committed right after it
+        with mock.patch.object(Conversation.objects, 'filter', return_value=Conversation.objects.none()):
+            conversation, created = get_or_create_conversation([self.alice.pk, self.bob.pk])
+        self.assertFalse(created)
+        self.assertEqual(conversation.pk, winner.pk)
+        self.assertEqual(Conversation.objects.count(), 1)
+
+    def test_participant_changes_recompute_the_key(self):
+        conversation, _ = get_or_create_conversation([self.alice.pk, self.bob.pk])
+        conversation.participants.add(self.carol)
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.canonical_key, make_canonical_key([self.alice.pk, self.bob.pk, self.carol.pk]))
+
+        self.carol.conversations.clear()
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.canonical_key, make_canonical_key([self.alice.pk, self.bob.pk]))
+
+    def test_change_onto_an_existing_thread_gives_up_the_key(self):
+        pair, _ = get_or_create_conversation([self.alice.pk, self.bob.pk])
+        group, _ = get_or_create_conversation([self.alice.pk, self.bob.pk, self.carol.pk])
+        group.participants.remove(self.carol)
+        group.refresh_from_db()
+        self.assertIsNone(group.canonical_key)
+        self.assertEqual(get_or_create_conversation([self.alice.pk, self.bob.pk]), (pair, False))
+
+
+class MergeDuplicateConversationsMigrationTests(TransactionTestCase):
+    before = [('chat', '0006_conversation_canonical_key')]
+    after = [('chat', '0008_alter_conversation_canonical_key')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_duplicates_are_merged_and_renumbered(self):
+        apps = self.migrate(self.before)
+        User = apps.get_model('users', 'User')
+        Conversation = apps.get_model('chat', 'Conversation')
+        Message = apps.get_model('chat', 'Message')
+        ArchivedMessageBlock = apps.get_model('chat', 'ArchivedMessageBlock')
+        alice = User.objects.create(email='alice@example.com', username='alice')
+        bob = User.objects.create(email='bob@example.com', username='bob')
+        start = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+        conversations = []
+        for offset in range(2):
+            conversation = Conversation.objects.create(last_seq=3)
+            conversation.participants.add(alice, bob)
+            conversations.append(conversation)
+            # Seq 1-2 archived, seq 3 hot; the two threads interleave in time
+            records = [
+                {
+                    'id': f'00000000-0000-0000-0000-00000000{offset}{seq}00', 'seq': seq, 'sender_id': alice.pk,
+                    'content': f'old {offset}.{seq}', 'message_type': 'text', 'file_attachment': None,
+                    'is_read': True, 'created_at': (start + timedelta(hours=2 * seq + offset)).isoformat(),
+                    'updated_at': start.isoformat(),
+                }
+                for seq in (1, 2)
+            ]
+            ArchivedMessageBlock.objects.create(
+                conversation=conversation, month=start.date(), first_seq=1, last_seq=2, message_count=2,
+                codec='zlib', payload=zlib.compress('\n'.join(json.dumps(record) for record in records).encode()),
+            )
+            message = Message.objects.create(conversation=conversation, sender=bob, content=f'new {offset}', seq=3)
+            Message.objects.filter(pk=message.pk).update(created_at=start + timedelta(days=40, hours=offset))
+
+        apps = self.migrate(self.after)
+        Conversation = apps.get_model('chat', 'Conversation')
+        Message = apps.get_model('chat', 'Message')
+        ArchivedMessageBlock = apps.get_model('chat', 'ArchivedMessageBlock')
+
+        conversation = Conversation.objects.get()
+        self.assertEqual(conversation.pk, conversations[0].pk)
+        self.assertEqual(conversation.canonical_key, make_canonical_key([alice.pk, bob.pk]))
+        self.assertEqual(conversation.last_seq, 6)
+        self.assertEqual(list(Message.objects.order_by('seq').values_list('content', 'seq')), [('new 0', 5), ('new 1', 6)])
+        self.assertEqual(conversation.last_message_id, Message.objects.get(seq=6).pk)
+
+        block = ArchivedMessageBlock.objects.get()
+        self.assertEqual((block.first_seq, block.last_seq, block.message_count), (1, 4, 4))
+        records = [json.loads(line) for line in decompress(block.codec, block.payload).decode().splitlines()]
+        self.assertEqual(
+            [(record['content'], record['seq']) for record in records],
+            [('old 0.1', 1), ('old 1.1', 2), ('old 0.2', 3), ('old 1.2', 4)],
+        )
+
+
+class MessageWritePathTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='me@example.com', username='me')
+        cls.conversation = Conversation.objects.create()
+        cls.conversation.participants.add(cls.user)
+
+    def test_messages_get_consecutive_seqs(self):
+        messages = [post_message(self.conversation.pk, self.user, content=str(i)) for i in range(3)]
+        self.assertEqual([message.seq for message in messages], [1, 2, 3])
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_seq, 3)
+        self.assertEqual(self.conversation.last_message_id, messages[-1].pk)
+
+    def test_missing_conversation_writes_nothing(self):
+        with self.assertRaises(Conversation.DoesNotExist):
+            post_message('00000000-0000-0000-0000-000000000000', self.user, content='Hello')
+        self.assertFalse(Message.objects.exists())
+
+    @override_settings(CHAT_CONVERSATION_TOUCH_INTERVAL=60)
+    def test_updated_at_is_bumped_at_most_once_per_interval(self):
+        stale = timezone.now() - timedelta(hours=1)
+        Conversation.objects.filter(pk=self.conversation.pk).update(updated_at=stale)
+        post_message(self.conversation.pk, self.user, content='first')
+        self.conversation.refresh_from_db()
+        touched = self.conversation.updated_at
+        self.assertGreater(touched, stale)
+        post_message(self.conversation.pk, self.user, content='second')
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.updated_at, touched)
+
+
+class RecordingLayer:
+    """Channel layer stand-in that records group sends."""
+
+    def __init__(self):
+        self.sends = []
+
+    async def group_send(self, group, message):
+        self.sends.append((group, message))
+
+
+class BulkRecordingLayer(RecordingLayer):
+
+    async def group_send_bulk(self, groups, message):
+        self.sends.append((tuple(groups), message))
+
+
+class NotificationFanOutTests(SimpleTestCase):
+
+    async def test_bulk_layer_gets_one_call(self):
+        layer = BulkRecordingLayer()
+        await group_send_many(layer, ['a', 'b', 'c'], {'type': 'ping'})
+        self.assertEqual(layer.sends, [(('a', 'b', 'c'), {'type': 'ping'})])
+
+    async def test_other_layers_get_one_send_per_group(self):
+        layer = RecordingLayer()
+        await group_send_many(layer, ['a', 'b'], {'type': 'ping'})
+        self.assertEqual(sorted(group for group, _ in layer.sends), ['a', 'b'])
+        await group_send_many(layer, [], {'type': 'ping'})
+        self.assertEqual(len(layer.sends), 2)
+
+    async def test_new_message_skips_the_sender(self):
+        sender = User(pk=1, email='sender@example.com', first_name='Sam')
+        message = Message(sender=sender, content='Hello', created_at=timezone.now())
+        layer = BulkRecordingLayer()
+        await notify_new_message(layer, 'c1', message, [1, 2, 3])
+        (groups, event), = layer.sends
+        self.assertEqual(groups, (notification_group(2), notification_group(3)))
+        self.assertEqual(event['type'], 'new_message_notification')
+        self.assertEqual(event['sender_name'], 'Sam')
+
+
+class CoalescingTests(SimpleTestCase):
+
+    async def test_typing_changes_are_debounced_to_the_trailing_edge(self):
+        emitted = []
+
+        async def emit(is_typing):
+            emitted.append(is_typing)
+
+        typing = TypingCoalescer(emit, 0.05)
+        await typing.set(True)
+        await typing.set(True)
+        await typing.set(False)
+        await typing.set(True)
+        await typing.set(False)
+        self.assertEqual(emitted, [True])
+        await asyncio.sleep(0.1)
+        self.assertEqual(emitted, [True, False])
+
+    async def test_close_clears_a_visible_typing_state(self):
+        emitted = []
+
+        async def emit(is_typing):
+            emitted.append(is_typing)
+
+        typing = TypingCoalescer(emit, 10)
+        await typing.set(True)
+        await typing.close()
+        self.assertEqual(emitted, [True, False])
+
+    async def test_read_receipts_flush_once_per_window(self):
+        flushed = []
+
+        async def flush(message_ids):
+            flushed.append(message_ids)
+
+        first, second = str(uuid.uuid4()), str(uuid.uuid4())
+        receipts = ReadReceiptBatcher(flush, 0.05)
+        await receipts.add([first, 'not-a-uuid'])
+        await receipts.add([second, first])
+        self.assertEqual(flushed, [])
+        await asyncio.sleep(0.1)
+        self.assertEqual(flushed, [[first, second]])
+
+    async def test_close_flushes_buffered_receipts(self):
+        flushed = []
+
+        async def flush(message_ids):
+            flushed.append(message_ids)
+
+        message_id = str(uuid.uuid4())
+        receipts = ReadReceiptBatcher(flush, 10)
+        await receipts.add([message_id])
+        await receipts.close()
+        self.assertEqual(flushed, [[message_id]])
+
+
+class ReplayTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='me@example.com', username='me')
+        cls.conversation = Conversation.objects.create()
+
+    def setUp(self):
+        cache.clear()
+        self.messages = []
+        for i in range(5):
+            message = post_message(self.conversation.pk, self.user, content=str(i))
+            remember_message(self.conversation.pk, serialize_message(message))
+            self.messages.append(message)
+
+    def test_gap_is_served_from_the_ring(self):
+        with self.assertNumQueries(1):
+            messages, complete = messages_since(self.conversation.pk, 2)
+        self.assertTrue(complete)
+        self.assertEqual([message['seq'] for message in messages], [3, 4, 5])
+
+    def test_evicted_ring_falls_back_to_the_database(self):
+        cache.clear()
+        messages, complete = messages_since(self.conversation.pk, 2)
+        self.assertTrue(complete)
+        self.assertEqual([message['content'] for message in messages], ['2', '3', '4'])
+
+    @override_settings(CHAT_REPLAY_MAX_MESSAGES=3)
+    def test_large_gap_asks_for_a_reload(self):
+        self.assertEqual(messages_since(self.conversation.pk, 1), ([], False))
+        self.assertEqual(messages_since(self.conversation.pk, 5), ([], True))
+
+    def test_resolve_seq(self):
+        self.assertEqual(resolve_seq(self.conversation.pk, self.messages[1].pk), 2)
+        self.assertIsNone(resolve_seq(self.conversation.pk, 'not-a-uuid'))
+
+
+class FakeSocket(OutboundQueueMixin):
+    """Just enough of a consumer to drive OutboundQueueMixin."""
+
+    def __init__(self, fail=False):
+        self.frames = []
+        self.close_codes = []
+        self.fail = fail
+
+    async def send(self, text_data=None, bytes_data=None):
+        if self.fail:
+            raise ConnectionResetError('socket gone')
+        self.frames.append(text_data if text_data is not None else bytes_data)
+
+    async def close(self, code=None):
+        self.close_codes.append(code)
+
+
+class OutboundQueueTests(SimpleTestCase):
+
+    async def test_high_priority_first_and_low_priority_coalesced(self):
+        sent = []
+
+        async def send(frame):
+            sent.append(frame)
+
+        queue = OutboundQueue(send, None)
+        queue.put('typing 1', PRIORITY_LOW, coalesce_key='typing')
+        queue.put('typing 2', PRIORITY_LOW, coalesce_key='typing')
+        queue.put('message')
+        await asyncio.sleep(0)
+        self.assertEqual(sent, ['message', 'typing 2'])
+        self.assertEqual(queue.coalesced, 1)
+        await queue.close()
+
+    @override_settings(CHAT_OUTBOUND_QUEUE_SIZE=2)
+    async def test_backlog_closes_with_the_slow_consumer_code(self):
+        socket = FakeSocket()
+        with self.assertLogs('chat.outbound', 'WARNING'):
+            for i in range(3):
+                socket.send_event({'type': 'message', 'n': i})
+        await asyncio.sleep(0)
+        self.assertEqual(socket.close_codes, [SLOW_CONSUMER_CLOSE_CODE])
+        self.assertEqual(socket.frames, [])
+
+    async def test_failed_send_closes_the_socket(self):
+        socket = FakeSocket(fail=True)
+        with self.assertLogs('chat.outbound', 'ERROR'):
+            socket.send_event({'type': 'message'})
+            await asyncio.sleep(0)
+        self.assertEqual(socket.close_codes, [1011])
+        self.assertIsNone(socket.outbound._writer)
+        socket.send_event({'type': 'message'})
+        self.assertEqual(socket.outbound.depth, 0)
+
+
+class MessageSearchTests(TestCase):
+    """The term-matching fallback used off Postgres."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='me@example.com', username='me')
+        cls.other = User.objects.create(email='other@example.com', username='other')
+        cls.mine = Conversation.objects.create()
+        cls.mine.participants.add(cls.user, cls.other)
+        cls.theirs = Conversation.objects.create()
+        cls.theirs.participants.add(cls.other)
+        post_message(cls.mine.pk, cls.user, content='The sink is leaking again')
+        post_message(cls.mine.pk, cls.other, content='Leaking sink, leaking tap')
+        post_message(cls.mine.pk, cls.other, content='The tap is fine')
+        post_message(cls.theirs.pk, cls.other, content='Private leaking sink')
+
+    def test_results_are_scoped_ranked_and_highlighted(self):
+        results = search_messages(self.user, 'leaking sink')
+        self.assertEqual([message.content for message in results], [
+            'Leaking sink, leaking tap', 'The sink is leaking again',
+        ])
+        self.assertGreater(results[0].rank, results[1].rank)
+        self.assertEqual(results[1].highlight, 'The <mark>sink</mark> is <mark>leaking</mark> again')
+
+    def test_conversation_filter_and_empty_query(self):
+        self.assertEqual(search_messages(self.other, 'private', conversation_id=self.mine.pk), [])
+        self.assertEqual(len(search_messages(self.other, 'private', conversation_id=self.theirs.pk)), 1)
+        self.assertEqual(search_messages(self.user, '?!'), [])
+
+    def test_endpoint_turns_a_timeout_into_503(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        url = reverse('message-search')
+        self.assertEqual(api.get(url, {'q': 'fine'}).data['results'][0]['highlight'], 'The tap is <mark>fine</mark>')
+        with mock.patch('chat.views.search_messages', side_effect=OperationalError('canceling statement due to statement timeout')):
+            self.assertEqual(api.get(url, {'q': 'tap'}).status_code, 503)
+
+
+class ArchiveTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email='me@example.com', username='me', first_name='Morgan')
+        cls.conversation = Conversation.objects.create()
+        start = datetime(2026, 1, 20, tzinfo=dt_timezone.utc)
+        # Four old messages (two in January, two in February) and four recent ones
+        for i in range(8):
+            message = post_message(cls.conversation.pk, cls.user, content=f'message {i}')
+            sent_at = start + timedelta(days=10 * i) if i < 4 else timezone.now() - timedelta(minutes=8 - i)
+            Message.objects.filter(pk=message.pk).update(created_at=sent_at)
+
+    def test_old_messages_round_trip_through_monthly_blocks(self):
+        archived = archive_conversation(self.conversation.pk, cutoff=timezone.now() - timedelta(days=1))
+        self.assertEqual(archived, 4)
+        self.assertEqual(self.conversation.messages.count(), 4)
+        blocks = ArchivedMessageBlock.objects.filter(conversation=self.conversation).order_by('first_seq')
+        self.assertEqual([(block.first_seq, block.last_seq) for block in blocks], [(1, 2), (3, 4)])
+
+        history, total = conversation_history(self.conversation, 0, 10)
+        self.assertEqual(total, 8)
+        self.assertEqual([message.seq for message in history], [8, 7, 6, 5, 4, 3, 2, 1])
+        self.assertEqual(history[-1].content, 'message 0')
+        self.assertEqual(history[-1].sender, self.user)
+
+    def test_pages_that_straddle_hot_and_cold(self):
+        archive_conversation(self.conversation.pk, cutoff=timezone.now() - timedelta(days=1))
+        pages = [conversation_history(self.conversation, offset, 3)[0] for offset in (0, 3, 6)]
+        self.assertEqual([[message.seq for message in page] for page in pages], [[8, 7, 6], [5, 4, 3], [2, 1]])
+
+    def test_last_message_stays_hot(self):
+        archive_conversation(self.conversation.pk, cutoff=timezone.now() + timedelta(days=1))
+        self.conversation.refresh_from_db()
+        self.assertEqual(list(self.conversation.messages.values_list('pk', flat=True)), [self.conversation.last_message_id])
+
+
+    def test_command_honours_an_explicit_zero_day_horizon(self):
+        out = io.StringIO()
+        call_command('archive_messages', older_than_days=0, stdout=out)
+        self.assertIn('older than 0 days', out.getvalue())
+        self.assertIn('Archived 7 messages', out.getvalue())
+        self.assertEqual(self.conversation.messages.count(), 1)
+
+class InboxUpkeepTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create(email='alice@example.com', username='alice')
+        cls.bob = User.objects.create(email='bob@example.com', username='bob')
+        cls.carol = User.objects.create(email='carol@example.com', username='carol')
+        cls.conversation = Conversation.objects.create()
+
+    def entries(self):
+        return dict(InboxEntry.objects.filter(conversation=self.conversation).values_list('user_id', 'unread_count'))
+
+    def test_entries_follow_participants(self):
+        self.conversation.participants.add(self.alice, self.bob)
+        self.carol.conversations.add(self.conversation)
+        self.assertEqual(set(self.entries()), {self.alice.pk, self.bob.pk, self.carol.pk})
+        self.conversation.participants.remove(self.bob)
+        self.alice.conversations.remove(self.conversation)
+        self.assertEqual(set(self.entries()), {self.carol.pk})
+        self.conversation.participants.clear()
+        self.assertEqual(self.entries(), {})
+
+    def test_messages_count_as_unread_for_everyone_but_the_sender(self):
+        self.conversation.participants.add(self.alice, self.bob)
+        post_message(self.conversation.pk, self.alice, content='Hi')
+        post_message(self.conversation.pk, self.alice, content='Still there?')
+        self.assertEqual(self.entries(), {self.alice.pk: 0, self.bob.pk: 2})
+
+    def test_inbox_revalidates_until_a_message_arrives(self):
+        self.conversation.participants.add(self.alice, self.bob)
+        api = APIClient()
+        api.force_authenticate(self.bob)
+        url = reverse('conversation-list')
+        etag = api.get(url)['ETag']
+        response = api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        post_message(self.conversation.pk, self.alice, content='Hi')
+        response = api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['unread_count'], 1)
+
+    def test_inbox_revalidates_when_a_participant_or_job_changes(self):
+        category = JobCategory.objects.create(name='Plumbing', slug='plumbing')
+        job = Job.objects.create(
+            client=self.alice, category=category, title='Fix a sink', description='Leaks', address='1 Main St', city='Springfield',
+            budget=Decimal('150.00'),
+        )
+        Conversation.objects.filter(pk=self.conversation.pk).update(job=job)
+        self.conversation.participants.add(self.alice, self.bob)
+        api = APIClient()
+        api.force_authenticate(self.bob)
+        url = reverse('conversation-list')
+        response = api.get(url)
+        self.assertFalse(response.has_header('Last-Modified'))
+        etag = response['ETag']
+
+        self.alice.first_name = 'Alicia'
+        self.alice.save()
+        response = api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Alicia', {p['name'] for p in response.data['results'][0]['participants']})
+
+        etag = response['ETag']
+        job.title = 'Fix two sinks'
+        job.save()
+        response = api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['job_title'], 'Fix two sinks')
+
+    def test_removing_a_non_member_keeps_contacts(self):
+        self.conversation.participants.add(self.alice, self.bob)
+        elsewhere = Conversation.objects.create()
+        elsewhere.participants.add(self.alice, self.carol)
+        self.conversation.participants.remove(self.carol)
+        self.carol.conversations.remove(self.conversation)
+        self.assertEqual(
+            set(Contact.objects.values_list('user_id', 'contact_id', 'conversation_count')),
+            {
+                (self.alice.pk, self.bob.pk, 1), (self.bob.pk, self.alice.pk, 1),
+                (self.alice.pk, self.carol.pk, 1), (self.carol.pk, self.alice.pk, 1),
+            },
+        )
+
+
+class ContactUpkeepTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create(email='alice@example.com', username='alice')
+        cls.bob = User.objects.create(email='bob@example.com', username='bob')
+        cls.carol = User.objects.create(email='carol@example.com', username='carol')
+
+    def count(self, user, contact):
+        return Contact.objects.filter(user=user, contact=contact).values_list('conversation_count', flat=True).first()
+
+    def test_counts_shared_conversations_both_ways(self):
+        first = Conversation.objects.create()
+        first.participants.add(self.alice, self.bob)
+        second = Conversation.objects.create()
+        second.participants.add(self.alice, self.bob, self.carol)
+        self.assertEqual((self.count(self.alice, self.bob), self.count(self.bob, self.alice)), (2, 2))
+        self.assertEqual(get_contact_ids(self.alice.pk), {self.bob.pk, self.carol.pk})
+
+        second.participants.remove(self.bob)
+        self.assertEqual(self.count(self.alice, self.bob), 1)
+        self.assertEqual(self.count(self.carol, self.alice), 1)
+        self.assertIsNone(self.count(self.carol, self.bob))
+
+    def test_clear_and_delete_drop_contacts(self):
+        first = Conversation.objects.create()
+        first.participants.add(self.alice, self.bob)
+        second = Conversation.objects.create()
+        second.participants.add(self.alice, self.carol)
+
+        self.carol.conversations.clear()
+        self.assertEqual(get_contact_ids(self.alice.pk), {self.bob.pk})
+        first.delete()
+        self.assertFalse(Contact.objects.exists())
+
+
+class MsgpackProtocolTests(SimpleTestCase):
+
+    def message(self, sender_name='Sam'):
+        return {
+            'type': 'message_received',
+            'message': {'id': 'm1', 'seq': 3, 'content': 'Hi', 'sender': {'id': 7, 'name': sender_name, 'avatar': None, 'role': 'worker'}},
+        }
+
+    def test_negotiation(self):
+        self.assertIsInstance(negotiate([MSGPACK_SUBPROTOCOL]), MsgpackCodec)
+        self.assertIsInstance(negotiate(['something-else']), JSONCodec)
+        self.assertIsInstance(negotiate(None), JSONCodec)
+
+    def test_keys_are_shortened_and_senders_interned(self):
+        codec = MsgpackCodec()
+        first = msgpack.unpackb(codec.encode(self.message()))
+        self.assertEqual(first, {
+            't': 'message_received',
+            'm': {'i': 'm1', 'q': 3, 'c': 'Hi', 'si': 7, 'sp': {'n': 'Sam', 'a': None, 'r': 'worker'}},
+        })
+        self.assertNotIn('sp', msgpack.unpackb(codec.encode(self.message()))['m'])
+        self.assertEqual(msgpack.unpackb(codec.encode(self.message('Samira')))['m']['sp']['n'], 'Samira')
+
+    def test_decode_expands_keys_and_rejects_bad_frames(self):
+        codec = MsgpackCodec()
+        self.assertEqual(codec.decode(bytes_data=msgpack.packb({'t': 'resume', 'ls': 4})), {'type': 'resume', 'last_seq': 4})
+        for frame in ({'text_data': '{}'}, {'bytes_data': b'\xc1'}, {'bytes_data': msgpack.packb([1])}):
+            with self.subTest(frame), self.assertRaises(ValueError):
+                codec.decode(**frame)
+
+    async def test_socket_speaks_msgpack_when_offered(self):
+        communicator = WebsocketCommunicator(
+            URLRouter(routing.websocket_urlpatterns), '/ws/notifications/', subprotocols=[MSGPACK_SUBPROTOCOL]
+        )
+        communicator.scope['user'] = User(pk=41, email='me@example.com')
+        with self.assertLogs('chat.consumers', 'INFO'):
+            connected, subprotocol = await communicator.connect()
+            self.assertTrue(connected)
+            self.assertEqual(subprotocol, MSGPACK_SUBPROTOCOL)
+
+            await get_channel_layer().group_send(notification_group(41), {
+                'type': 'new_message_notification', 'conversation_id': 'c1', 'message': {'id': 'm1'}, 'sender_name': 'Sam',
+            })
+            frame = msgpack.unpackb(await communicator.receive_from())
+            self.assertEqual(frame, {'t': 'new_message_notification', 'cv': 'c1', 'm': {'i': 'm1'}, 'sn': 'Sam'})
+            await communicator.disconnect()
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class ChunkedUploadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create(email='alice@example.com', username='alice')
+        cls.conversation = Conversation.objects.create()
+        cls.conversation.participants.add(cls.alice)
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, CHAT_UPLOAD_CHUNK_SIZE=4)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.data = b'hello world'
+        self.upload = start_upload(
+            self.conversation.pk, self.alice, 'hello.txt', 'text/plain', len(self.data), sha256=sha256(self.data)
+        )
+
+    def send(self, index, data=None):
+        data = self.data[index * 4:index * 4 + 4] if data is None else data
+        return store_chunk(self.upload, index, io.BytesIO(data), len(data), sha256(data))
+
+    def complete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return complete_upload(self.upload.pk, self.alice)
+
+    def test_chunks_in_any_order_assemble_the_file(self):
+        for index in (2, 0):
+            self.send(index)
+        self.assertEqual(received_chunks(self.upload), [0, 2])
+        with self.assertRaisesMessage(UploadError, 'Missing chunks: [1]'):
+            self.complete()
+
+        self.send(1)
+        parts = [chunk.name for chunk in self.upload.chunks.all()]
+        message, created = self.complete()
+        self.assertTrue(created)
+        with message.file_attachment.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(any(default_storage.exists(name) for name in parts))
+        self.assertEqual(self.complete(), (message, False))
+
+    def test_assembly_reads_the_name_storage_chose(self):
+        default_storage.save(part_name(self.upload, 0), ContentFile(b'left'))
+        chunk = self.send(0)
+        self.assertNotEqual(chunk.name, part_name(self.upload, 0))
+        self.send(1)
+        self.send(2)
+        message, _ = self.complete()
+        with message.file_attachment.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_retried_chunk_is_kept_and_a_changed_one_replaced(self):
+        first = self.send(0, b'hexx')
+        self.assertEqual(self.send(0, b'hexx').name, first.name)
+        with mock.patch.object(default_storage, 'save') as save:
+            self.send(0, b'hexx')
+        save.assert_not_called()
+
+        replaced = self.send(0)
+        self.assertEqual(self.upload.chunks.get().sha256, sha256(b'hell'))
+        with default_storage.open(replaced.name, 'rb') as f:
+            self.assertEqual(f.read(), b'hell')
+        # The old part went first, so the replacement reuses its name
+        self.assertEqual(replaced.name, first.name)
+
+    def test_checksum_mismatch_discards_the_chunk(self):
+        with self.assertRaisesMessage(UploadError, 'Checksum mismatch for chunk 0'):
+            store_chunk(self.upload, 0, io.BytesIO(b'hell'), 4, sha256(b'nope'))
+        self.assertEqual(received_chunks(self.upload), [])
+        self.assertFalse(default_storage.exists(part_name(self.upload, 0)))
+        with self.assertRaisesMessage(UploadError, 'exactly 4 bytes'):
+            self.send(0, b'hel')
+
+    def test_filename_is_checked_when_the_upload_starts(self):
+        api = APIClient()
+        api.force_authenticate(self.alice)
+        url = reverse('conversation-uploads', args=[self.conversation.pk])
+        body = {'content_type': 'text/plain', 'size': 11}
+        for filename in ('../x.txt', 'notes/x.txt', '..'):
+            with self.subTest(filename):
+                response = api.post(url, {**body, 'filename': filename}, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('filename', response.data)
+
+        response = api.post(url, {**body, 'filename': 'my notes (final).txt'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['filename'], 'my_notes_final.txt')
+
+    def test_purge_honours_an_explicit_zero_hour_expiry(self):
+        self.send(0)
+        out = io.StringIO()
+        call_command('purge_chat_uploads', older_than_hours=1, stdout=out)
+        self.assertIn('Purged 0', out.getvalue())
+        call_command('purge_chat_uploads', older_than_hours=0, stdout=out)
+        self.assertIn('Purged 1', out.getvalue())
+        self.assertFalse(ChatUpload.objects.filter(pk=self.upload.pk).exists())
+        self.assertFalse(default_storage.exists(part_name(self.upload, 0)))
+
+    def test_whole_file_mismatch_releases_the_claim(self):
+        ChatUpload.objects.filter(pk=self.upload.pk).update(sha256=sha256(b'something else'))
+        for index in range(3):
+            self.send(index)
+        with self.assertRaisesMessage(UploadError, 'Checksum mismatch for the assembled file'):
+            self.complete()
+        self.upload.refresh_from_db()
+        self.assertIsNone(self.upload.assembling_since)
+        self.assertIsNone(self.upload.message_id)
+        self.assertEqual(received_chunks(self.upload), [0, 1, 2])
+
+    def test_claimed_upload_rejects_chunks_and_second_completion(self):
+        for index in range(3):
+            self.send(index)
+        ChatUpload.objects.filter(pk=self.upload.pk).update(assembling_since=timezone.now())
+        self.upload.refresh_from_db()
+        with self.assertRaisesMessage(UploadError, 'already being completed'):
+            self.complete()
+        with self.assertRaisesMessage(UploadError, 'being completed'):
+            self.send(0, b'xxxx')
+
+        ChatUpload.objects.filter(pk=self.upload.pk).update(assembling_since=timezone.now() - timedelta(hours=1))
+        message, created = self.complete()
+        self.assertTrue(created)
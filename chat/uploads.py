@@ -0,0 +1,254 @@
+"""
+Resumable chunked uploads for chat attachments.
+
+A client starts an upload, then PUTs each chunk with its SHA-256. Every chunk
+is streamed from the request straight to storage as a part file while it is
+hashed, so memory per request stays at one read buffer however big the chunk
+is. Chunks can be retried or sent in any order. A chunk that is already
+stored with the same checksum is accepted without being rewritten. Each
+chunk row records the name storage actually gave its part. On completion the
+upload is claimed under a short row lock, the parts are streamed, in order,
+into the final attachment outside that lock, and the message is posted
+through ``post_message``.
+"""
+import hashlib
+import io
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ChatUpload, ChatUploadChunk, Message
+from .services import post_message
+
+READ_BUFFER_SIZE = 64 * 1024
+
+# A completion that has not finished within this long is assumed dead and
+# can be claimed again.
+ASSEMBLY_CLAIM_TIMEOUT = timedelta(minutes=15)
+
+
+class UploadError(Exception):
+    pass
+
+
+class HashingReader(io.RawIOBase):
+    """Reads exactly ``length`` bytes from ``stream`` and hashes them on the way."""
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.size = length
+        self.remaining = length
+        self.digest = hashlib.sha256()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.remaining:
+            return 0
+        data = self.stream.read(min(len(buffer), self.remaining, READ_BUFFER_SIZE))
+        if not data:
+            raise UploadError("Chunk ended early")
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        self.digest.update(data)
+        return len(data)
+
+
+class PartsReader(io.RawIOBase):
+    """Streams stored part files back-to-back as one file."""
+
+    def __init__(self, names, size):
+        self.names = list(names)
+        self.size = size
+        self.current = None
+        self.digest = hashlib.sha256()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self.names or self.current:
+            if self.current is None:
+                self.current = default_storage.open(self.names.pop(0), 'rb')
+            data = self.current.read(min(len(buffer), READ_BUFFER_SIZE))
+            if data:
+                buffer[:len(data)] = data
+                self.digest.update(data)
+                return len(data)
+            self.current.close()
+            self.current = None
+        return 0
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+        super().close()
+
+
+def part_name(upload, index):
+    return f'chat_uploads/{upload.id}/{index:06d}.part'
+
+
+def stored_part_name(chunk):
+    """Where a chunk's part actually lives; storage may have picked another name."""
+    return chunk.name or part_name(chunk.upload, chunk.index)
+
+
+def is_assembling(upload):
+    return bool(upload.assembling_since) and upload.assembling_since > timezone.now() - ASSEMBLY_CLAIM_TIMEOUT
+
+
+def start_upload(conversation_id, uploader, filename, content_type, size, sha256='', message_type='file', content=''):
+    return ChatUpload.objects.create(
+        conversation_id=conversation_id,
+        uploader=uploader,
+        filename=filename,
+        content_type=content_type,
+        size=size,
+        chunk_size=getattr(settings, 'CHAT_UPLOAD_CHUNK_SIZE', 1024 * 1024),
+        sha256=sha256.lower(),
+        message_type=message_type,
+        content=content,
+    )
+
+
+def received_chunks(upload):
+    return list(upload.chunks.values_list('index', flat=True))
+
+
+def store_chunk(upload, index, stream, length, sha256):
+    """
+    Stream one chunk of ``length`` bytes from ``stream`` to storage.
+
+    Raises ``UploadError`` for a bad index, length or checksum; the part is
+    discarded in that case so the client can simply retry the chunk.
+    """
+    if upload.message_id:
+        raise UploadError("Upload is already complete")
+    if not 0 <= index < upload.total_chunks:
+        raise UploadError(f"Chunk index must be between 0 and {upload.total_chunks - 1}")
+    if length != upload.chunk_length(index):
+        raise UploadError(f"Chunk {index} must be exactly {upload.chunk_length(index)} bytes")
+    sha256 = (sha256 or '').lower()
+    if len(sha256) != 64:
+        raise UploadError("A hex SHA-256 checksum of the chunk is required")
+
+    if is_assembling(upload):
+        raise UploadError("Upload is being completed")
+
+    existing = upload.chunks.filter(index=index).first()
+    if existing is not None:
+        if existing.sha256 == sha256:
+            # Retry of a chunk we already have
+            return existing
+        # Drop the old part before writing its replacement
+        delete_parts([stored_part_name(existing)])
+        existing.delete()
+
+    name = part_name(upload, index)
+    reader = HashingReader(stream, length)
+    try:
+        name = default_storage.save(name, File(reader, name=name))
+    except UploadError:
+        default_storage.delete(name)
+        raise
+    if reader.digest.hexdigest() != sha256:
+        default_storage.delete(name)
+        raise UploadError(f"Checksum mismatch for chunk {index}")
+
+    with transaction.atomic():
+        # A concurrent retry of the same chunk may have stored its own part
+        replaced = (
+            ChatUploadChunk.objects.select_for_update()
+            .filter(upload=upload, index=index)
+            .values_list('name', flat=True)
+            .first()
+        )
+        chunk, _ = ChatUploadChunk.objects.update_or_create(
+            upload=upload, index=index, defaults={'size': length, 'sha256': sha256, 'name': name}
+        )
+    if replaced and replaced != name:
+        delete_parts([replaced])
+    ChatUpload.objects.filter(pk=upload.pk).update(updated_at=timezone.now())
+    return chunk
+
+
+def complete_upload(upload_id, uploader):
+    """
+    Assemble the parts into the final attachment and post the message.
+
+    The upload row is locked only while it is claimed; the parts are
+    assembled outside that lock, so status and chunk requests are not held
+    up behind a large file being copied. Returns ``(message, created)``;
+    completing an already completed upload returns its message. Raises
+    ``UploadError`` while chunks are missing or another request is still
+    assembling the file.
+    """
+    with transaction.atomic():
+        upload = ChatUpload.objects.select_for_update().get(pk=upload_id, uploader=uploader)
+        if upload.message_id:
+            return upload.message, False
+        if is_assembling(upload):
+            raise UploadError("Upload is already being completed")
+
+        chunks = list(upload.chunks.order_by('index'))
+        missing = sorted(set(range(upload.total_chunks)) - {chunk.index for chunk in chunks})
+        if missing:
+            raise UploadError(f"Missing chunks: {missing[:20]}")
+
+        upload.assembling_since = timezone.now()
+        upload.save(update_fields=['assembling_since', 'updated_at'])
+
+    parts = [stored_part_name(chunk) for chunk in chunks]
+    field = Message._meta.get_field('file_attachment')
+    try:
+        reader = PartsReader(parts, upload.size)
+        with reader:
+            name = field.storage.save(field.generate_filename(None, upload.filename), File(reader, name=upload.filename))
+        if upload.sha256 and reader.digest.hexdigest() != upload.sha256:
+            field.storage.delete(name)
+            raise UploadError("Checksum mismatch for the assembled file")
+    except BaseException:
+        ChatUpload.objects.filter(pk=upload.pk).update(assembling_since=None)
+        raise
+
+    with transaction.atomic():
+        message = post_message(
+            upload.conversation_id,
+            upload.uploader,
+            content=upload.content,
+            message_type=upload.message_type,
+            file_attachment=name,
+        )
+        upload.message = message
+        upload.assembling_since = None
+        upload.save(update_fields=['message', 'assembling_since', 'updated_at'])
+        upload.chunks.all().delete()
+
+    transaction.on_commit(lambda: delete_parts(parts))
+    return message, True
+
+
+def delete_parts(names):
+    for name in names:
+        if default_storage.exists(name):
+            default_storage.delete(name)
+
+
+def purge_stale_uploads(older_than=None):
+    """Delete unfinished uploads (and their parts) idle for longer than the expiry."""
+    if older_than is None:
+        older_than = timedelta(hours=getattr(settings, 'CHAT_UPLOAD_EXPIRY_HOURS', 24))
+    stale = ChatUpload.objects.filter(message__isnull=True, updated_at__lt=timezone.now() - older_than)
+    purged = 0
+    for upload in stale.prefetch_related('chunks'):
+        delete_parts(stored_part_name(chunk) for chunk in upload.chunks.all())
+        upload.delete()
+        purged += 1
+    return purged
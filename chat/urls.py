@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ConversationViewSet, MessageViewSet, UserPresenceViewSet
+from .views import ConversationViewSet, MessageViewSet, UserPresenceViewSet, connection_stats
 
 router = DefaultRouter()
 router.register(r'conversations', ConversationViewSet, basename='conversation')
@@ -8,5 +8,6 @@ router.register(r'messages', MessageViewSet, basename='message')
 router.register(r'presence', UserPresenceViewSet, basename='presence')
 
 urlpatterns = [
+    path('api/chat/connection-stats/', connection_stats, name='chat-connection-stats'),
     path('api/chat/', include(router.urls)),
 ] 
\ No newline at end of file
@@ -1,33 +1,94 @@
 from django.shortcuts import render
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from django.db.models import Q, Prefetch
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from django.db import OperationalError
+from django.db.models import Count, Max, Q, Prefetch, prefetch_related_objects
 from django.shortcuts import get_object_or_404
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
-from django.conf import settings
-from .models import Conversation, Message, UserPresence
+from api.conditional import conditional_response, request_etag
+from .archive import conversation_history
+from .contacts import get_contact_ids
+from .models import ChatUpload, Conversation, InboxEntry, Message, UserPresence
+from .notifications import notify_new_message
+from .outbound import outbound_stats
+from .presence import presence_store
+from .replay import remember_message
+from .search import search_messages
+from .services import serialize_message
+from .uploads import UploadError, complete_upload, received_chunks, start_upload, store_chunk
 from .serializers import (
+    ChatUploadCreateSerializer,
+    ChatUploadSerializer,
     ConversationListSerializer,
     ConversationDetailSerializer,
     ConversationCreateSerializer,
     MessageSerializer,
     MessageCreateSerializer,
+    MessageSearchResultSerializer,
     UserPresenceSerializer
 )
 
 
+class InboxPagination(CursorPagination):
+    """Keyset pagination over a user's inbox, most recent activity first."""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-last_activity', '-id')
+
+
 class ConversationViewSet(viewsets.ModelViewSet):
     """
     ViewSet for managing conversations.
     """
     permission_classes = [IsAuthenticated]
     
+    def list(self, request, *args, **kwargs):
+        """List the user's conversations from their inbox index, most recent first."""
+        entries = InboxEntry.objects.filter(user=request.user)
+        # Entries are touched on new messages, reads and participant changes;
+        # participants' profiles and job titles are also on every page, so
+        # their stamps join the validator. Leaving a conversation lowers the
+        # count without moving any stamp, so only the ETag is sent.
+        stamp = entries.aggregate(
+            count=Count('id', distinct=True),
+            updated=Max('updated_at'),
+            participants_updated=Max('conversation__participants__updated_at'),
+            jobs_updated=Max('conversation__job__updated_at'),
+        )
+        
+        def build():
+            paginator = InboxPagination()
+            page = paginator.paginate_queryset(entries.select_related(
+                'conversation',
+                'conversation__job',
+                'conversation__last_message',
+                'conversation__last_message__sender'
+            ), request, view=self)
+            
+            conversations = []
+            for entry in page:
+                entry.conversation.inbox_unread_count = entry.unread_count
+                conversations.append(entry.conversation)
+            # Participants for this page only
+            prefetch_related_objects(conversations, 'participants')
+            
+            serializer = ConversationListSerializer(conversations, many=True, context={'request': request})
+            return paginator.get_paginated_response(serializer.data)
+        
+        return conditional_response(
+            request,
+            build,
+            etag=request_etag(request, 'inbox', *stamp.values())
+        )
+    
     def get_queryset(self):
         """Get conversations where the user is a participant."""
-        return Conversation.objects.filter(
+        queryset = Conversation.objects.filter(
             participants=self.request.user
         ).select_related(
             'job',
@@ -36,6 +97,12 @@ class ConversationViewSet(viewsets.ModelViewSet):
         ).prefetch_related(
             'participants'
         ).distinct()
+        if self.action == 'retrieve':
+            # ConversationDetailSerializer nests every message with its sender
+            queryset = queryset.prefetch_related(
+                Prefetch('messages', queryset=Message.objects.select_related('sender'))
+            )
+        return queryset
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -45,17 +112,20 @@ class ConversationViewSet(viewsets.ModelViewSet):
         return ConversationListSerializer
     
     def create(self, request, *args, **kwargs):
-        """Create a new conversation."""
+        """Create a new conversation, or return the existing one for the same participants and job."""
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         conversation = serializer.save()
         
-        # Return the created conversation with full details
+        # Return the conversation with full details
         response_serializer = ConversationDetailSerializer(
             conversation, 
             context={'request': request}
         )
-        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+        return Response(
+            response_serializer.data,
+            status=status.HTTP_201_CREATED if serializer.created else status.HTTP_200_OK
+        )
     
     @action(detail=True, methods=['get'])
     def messages(self, request, pk=None):
@@ -67,14 +137,15 @@ class ConversationViewSet(viewsets.ModelViewSet):
         page_size = int(request.query_params.get('page_size', 50))
         offset = (page - 1) * page_size
         
-        messages = conversation.messages.all().order_by('-created_at')[offset:offset + page_size]
+        # Reads archived (cold) messages transparently once the page passes the hot table
+        messages, total = conversation_history(conversation, offset, page_size)
         serializer = MessageSerializer(messages, many=True, context={'request': request})
         
         return Response({
             'results': serializer.data,
             'page': page,
             'page_size': page_size,
-            'has_more': conversation.messages.count() > offset + page_size
+            'has_more': total > offset + page_size
         })
     
     def broadcast_message(self, message, conversation):
@@ -82,60 +153,20 @@ class ConversationViewSet(viewsets.ModelViewSet):
         channel_layer = get_channel_layer()
         room_group_name = f'chat_{conversation.id}'
         
-        # Get avatar URL
-        avatar_url = None
-        if message.sender.profile_picture:
-            base_url = getattr(settings, 'SITE_URL', 'http://localhost:8001')
-            avatar_url = f"{base_url}{message.sender.profile_picture.url}"
-        
-        # Get file URL
-        file_url = None
-        if message.file_attachment:
-            base_url = getattr(settings, 'SITE_URL', 'http://localhost:8001')
-            file_url = f"{base_url}{message.file_attachment.url}"
-        
-        # Broadcast to conversation participants
-        async_to_sync(channel_layer.group_send)(
-            room_group_name,
-            {
-                'type': 'chat_message',
-                'message': {
-                    'id': str(message.id),
-                    'content': message.content,
-                    'message_type': message.message_type,
-                    'sender': {
-                        'id': message.sender.id,
-                        'name': message.sender.get_full_name() or message.sender.email,
-                        'avatar': avatar_url,
-                        'role': message.sender.role
-                    },
-                    'file_url': file_url,
-                    'is_read': message.is_read,
-                    'created_at': message.created_at.isoformat(),
-                    'updated_at': message.updated_at.isoformat()
-                }
-            }
-        )
+        payload = serialize_message(message)
+        remember_message(conversation.id, payload)
+        chat_event = {
+            'type': 'chat_message',
+            'message': payload
+        }
+        participant_ids = list(conversation.participants.values_list('id', flat=True))
         
-        # Send global notifications to participants (except sender)
-        participants = conversation.participants.exclude(id=message.sender.id)
-        sender_name = message.sender.get_full_name() or message.sender.email
-        
-        for participant in participants:
-            async_to_sync(channel_layer.group_send)(
-                f'notifications_{participant.id}',
-                {
-                    'type': 'new_message_notification',
-                    'conversation_id': str(conversation.id),
-                    'message': {
-                        'id': str(message.id),
-                        'content': message.content,
-                        'sender_name': sender_name,
-                        'created_at': message.created_at.isoformat()
-                    },
-                    'sender_name': sender_name
-                }
-            )
+        async def broadcast():
+            # Room broadcast plus notification fan-out in one event-loop hop
+            await channel_layer.group_send(room_group_name, chat_event)
+            await notify_new_message(channel_layer, conversation.id, message, participant_ids)
+        
+        async_to_sync(broadcast)()
 
     @action(detail=True, methods=['post'])
     def send_message(self, request, pk=None):
@@ -160,6 +191,57 @@ class ConversationViewSet(viewsets.ModelViewSet):
         response_serializer = MessageSerializer(message, context={'request': request})
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
     
+    @action(detail=True, methods=['post'])
+    def uploads(self, request, pk=None):
+        """Start a resumable chunked upload of a file attachment."""
+        conversation = self.get_object()
+        serializer = ChatUploadCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = start_upload(conversation.id, request.user, **serializer.validated_data)
+        return Response(ChatUploadSerializer(upload).data, status=status.HTTP_201_CREATED)
+    
+    def get_upload(self, upload_id):
+        conversation = self.get_object()
+        return get_object_or_404(
+            ChatUpload.objects.prefetch_related('chunks'),
+            pk=upload_id,
+            conversation=conversation,
+            uploader=self.request.user
+        )
+    
+    @action(detail=True, methods=['get'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]{36})')
+    def upload_status(self, request, pk=None, upload_id=None):
+        """Upload state, including received chunk indexes to resume from."""
+        return Response(ChatUploadSerializer(self.get_upload(upload_id)).data)
+    
+    @action(detail=True, methods=['put'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]{36})/chunks/(?P<index>\d+)')
+    def upload_chunk(self, request, pk=None, upload_id=None, index=None):
+        """
+        Store one chunk. The raw request body is the chunk; the
+        ``X-Chunk-SHA256`` header carries its hex SHA-256.
+        """
+        upload = self.get_upload(upload_id)
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+            store_chunk(upload, int(index), request.stream, length, request.headers.get('X-Chunk-SHA256'))
+        except (UploadError, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'index': int(index), 'received_chunks': received_chunks(upload)})
+    
+    @action(detail=True, methods=['post'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]{36})/complete')
+    def upload_complete(self, request, pk=None, upload_id=None):
+        """Assemble a fully uploaded file and send it as a message."""
+        upload = self.get_upload(upload_id)
+        try:
+            message, created = complete_upload(upload.id, request.user)
+        except UploadError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if created:
+            self.broadcast_message(message, upload.conversation)
+        response_serializer = MessageSerializer(message, context={'request': request})
+        return Response(response_serializer.data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+    
     @action(detail=True, methods=['patch'])
     def mark_as_read(self, request, pk=None):
         """Mark messages as read in a conversation."""
@@ -177,6 +259,9 @@ class ConversationViewSet(viewsets.ModelViewSet):
                 is_read=False
             ).exclude(sender=request.user).update(is_read=True)
         
+        if updated_count:
+            InboxEntry.refresh_unread(conversation.id)
+        
         return Response({
             'message': f'{updated_count} messages marked as read',
             'updated_count': updated_count
@@ -205,13 +290,16 @@ class MessageViewSet(viewsets.ReadOnlyModelViewSet):
         if not query:
             return Response({'results': []})
         
-        messages = self.get_queryset().filter(content__icontains=query)
-        
-        if conversation_id:
-            messages = messages.filter(conversation_id=conversation_id)
+        try:
+            messages = search_messages(request.user, query, conversation_id=conversation_id)
+        except OperationalError:
+            # Exceeded CHAT_SEARCH_TIMEOUT_MS
+            return Response(
+                {'error': 'Search took too long, please refine your query'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
         
-        messages = messages.order_by('-created_at')[:50]
-        serializer = self.get_serializer(messages, many=True)
+        serializer = MessageSearchResultSerializer(messages, many=True, context={'request': request})
         return Response({'results': serializer.data})
 
 
@@ -223,17 +311,29 @@ class UserPresenceViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = UserPresenceSerializer
     
     def get_queryset(self):
-        """Get presence status for users in the same conversations."""
-        user_conversations = Conversation.objects.filter(participants=self.request.user)
-        participant_ids = user_conversations.values_list('participants', flat=True).distinct()
-        
+        """Get presence status for the user's contacts (users in the same conversations)."""
         return UserPresence.objects.filter(
-            user_id__in=participant_ids
+            user__contact_of__user=self.request.user
         ).select_related('user')
     
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ('list', 'online_users'):
+            # The listed users are the contacts; check them all in one cache read
+            context['online_ids'] = set(presence_store.online_user_ids(get_contact_ids(self.request.user.id)))
+        return context
+    
     @action(detail=False, methods=['get'])
     def online_users(self, request):
         """Get list of currently online users."""
-        online_users = self.get_queryset().filter(is_online=True)
-        serializer = self.get_serializer(online_users, many=True)
+        context = self.get_serializer_context()
+        online_users = UserPresence.objects.filter(user_id__in=context['online_ids']).select_related('user')
+        serializer = self.get_serializer(online_users, many=True, context=context)
         return Response({'results': serializer.data})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def connection_stats(request):
+    """Outbound WebSocket queue depth and slow-consumer counters for this process."""
+    return Response(outbound_stats())
@@ -83,34 +83,11 @@ fi
 echo "🔧 Checking Django configuration..."
 python manage.py check --deploy || echo "⚠️ Django check failed, continuing..."
 
-# Show migration status
-echo "📊 Checking migration status..."
-python manage.py showmigrations || echo "⚠️ Could not show migrations, continuing..."
-
-# Run database migrations
-echo "📊 Running database migrations..."
-python manage.py migrate --noinput --verbosity=2
-
-# Verify migrations were applied
-echo "✅ Verifying migrations..."
-python manage.py showmigrations | grep -E "\[X\]" | wc -l | xargs echo "Applied migrations count:"
-
-# Collect static files
-echo "📁 Collecting static files..."
-python manage.py collectstatic --noinput --clear || echo "⚠️ Static files collection failed, continuing..."
-
-# Create superuser if it doesn't exist
-echo "👤 Creating superuser if needed..."
-python manage.py shell -c "
-from django.contrib.auth import get_user_model
-User = get_user_model()
-if not User.objects.filter(is_superuser=True).exists():
-    print('Creating superuser...')
-    User.objects.create_superuser('admin', 'admin@workconnect.com', 'admin123')
-    print('✅ Superuser created successfully!')
-else:
-    print('✅ Superuser already exists.')
-" || echo "⚠️ Superuser creation failed, continuing..."
+# Release phase: migrations and superuser bootstrap, once per deploy.
+# Concurrent starts are serialized by an advisory lock, so only one does the work.
+# Static files are collected when the image is built.
+echo "📊 Running release tasks..."
+python manage.py release --verbosity=2
 
 # Start the application
 echo "🌟 Starting Daphne server on port 8001..."
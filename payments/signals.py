@@ -0,0 +1,8 @@
+from api.cache import invalidate_on_change
+
+from .models import SubscriptionPlan
+
+# Cache tag for api.cache entries built from subscription plans
+SUBSCRIPTION_PLANS_TAG = 'subscription_plans'
+
+invalidate_on_change(SubscriptionPlan, SUBSCRIPTION_PLANS_TAG)
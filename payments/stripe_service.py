@@ -1,19 +1,32 @@
-import stripe
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.utils.functional import SimpleLazyObject
 from decimal import Decimal
+
+from api.metrics import track_call
+
 from .models import UserSubscription, SubscriptionPlan, JobInvoice, PaymentMethod
 
 User = get_user_model()
 
-# Configure Stripe
-stripe.api_key = settings.STRIPE_SECRET_KEY
+
+def load_stripe():
+    """Import and configure the Stripe SDK; it takes about a second to import."""
+    import stripe
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    return stripe
+
+
+# Imported on first attribute access, so workers that never touch payments
+# do not pay for the SDK. Import ``stripe`` from here rather than directly.
+stripe = SimpleLazyObject(load_stripe)
 
 
 class StripeService:
     """Service class for handling Stripe operations"""
 
     @staticmethod
+    @track_call('stripe', 'create_customer')
     def create_customer(user):
         """Create a Stripe customer for a user"""
         try:
@@ -37,7 +50,8 @@ class StripeService:
             subscription = UserSubscription.objects.filter(user=user).first()
             if subscription and subscription.stripe_customer_id:
                 try:
-                    customer = stripe.Customer.retrieve(subscription.stripe_customer_id)
+                    with track_call('stripe', 'retrieve_customer'):
+                        customer = stripe.Customer.retrieve(subscription.stripe_customer_id)
                     return customer
                 except stripe.error.InvalidRequestError:
                     # Customer doesn't exist in Stripe, create new one
@@ -49,6 +63,7 @@ class StripeService:
             raise Exception(f"Failed to get or create customer: {str(e)}")
 
     @staticmethod
+    @track_call('stripe', 'create_subscription')
     def create_subscription(user, plan, payment_method_id, billing_cycle='monthly'):
         """Create a Stripe subscription"""
         try:
@@ -83,6 +98,7 @@ class StripeService:
             raise Exception(f"Failed to create subscription: {str(e)}")
 
     @staticmethod
+    @track_call('stripe', 'cancel_subscription')
     def cancel_subscription(subscription_id, at_period_end=True):
         """Cancel a Stripe subscription"""
         try:
@@ -95,6 +111,7 @@ class StripeService:
             raise Exception(f"Failed to cancel subscription: {str(e)}")
 
     @staticmethod
+    @track_call('stripe', 'create_payment_intent')
     def create_payment_intent(amount, customer_id, description="", metadata=None):
         """Create a payment intent for one-time payments"""
         try:
@@ -111,6 +128,7 @@ class StripeService:
             raise Exception(f"Failed to create payment intent: {str(e)}")
 
     @staticmethod
+    @track_call('stripe', 'create_invoice_for_job')
     def create_invoice_for_job(job_invoice):
         """Create a Stripe invoice for a completed job"""
         try:
@@ -146,6 +164,7 @@ class StripeService:
             raise Exception(f"Failed to create invoice: {str(e)}")
 
     @staticmethod
+    @track_call('stripe', 'get_payment_methods')
     def get_payment_methods(customer_id):
         """Get all payment methods for a customer"""
         try:
@@ -158,6 +177,7 @@ class StripeService:
             raise Exception(f"Failed to get payment methods: {str(e)}")
 
     @staticmethod
+    @track_call('stripe', 'detach_payment_method')
     def detach_payment_method(payment_method_id):
         """Detach a payment method from customer"""
         try:
@@ -1,3 +1,102 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from rest_framework.test import APIClient
+
+from api.testing import QueryBudgetMixin, get_routes
+from users.models import Job, JobCategory, User
+
+from . import urls
+from .models import JobInvoice, PaymentMethod, SubscriptionPlan, UserSubscription
+from .stripe_service import load_stripe
+
+
+class EndpointQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every GET route in payments.urls runs a fixed number of queries."""
+
+    covered_routes = {
+        'stripe_config', 'subscription_plans', 'current_subscription',
+        'payment_methods', 'invoices', 'invoice_detail',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(email='client@example.com', username='client', first_name='Casey', last_name='Client')
+        cls.worker = User.objects.create(
+            email='worker@example.com', username='worker', first_name='Wren', last_name='Worker', role='worker'
+        )
+        cls.category = JobCategory.objects.create(name='Plumbing', slug='plumbing')
+
+    def setUp(self):
+        self.api = APIClient()
+
+    def get(self, user, name, *args):
+        self.api.force_authenticate(user)
+        url = reverse(f'payments:{name}', args=args)
+        return lambda: self.api.get(url)
+
+    def seed_invoices(self, count):
+        jobs = Job.objects.bulk_create([
+            Job(
+                client=self.owner, title='Fix a leaking sink', category=self.category,
+                description='Leak under the sink.', address='1 Main St', city='Springfield',
+                budget=Decimal('100.00'), status='completed'
+            )
+            for _ in range(count - self.owner.client_invoices.count())
+        ])
+        JobInvoice.objects.bulk_create([
+            JobInvoice(
+                job=job, client=self.owner, worker=self.worker,
+                job_amount=Decimal('100.00'), platform_fee=Decimal('10.00'),
+                worker_payout=Decimal('90.00'), total_amount=Decimal('110.00'),
+                due_date=timezone.now() + timedelta(days=7)
+            )
+            for job in jobs
+        ])
+
+    def test_every_get_route_is_covered(self):
+        self.assertEqual(get_routes(urls.urlpatterns) - self.covered_routes, set())
+
+    def test_stripe_config(self):
+        self.assertMaxQueries(0, self.get(None, 'stripe_config'))
+
+    def test_subscription_plans(self):
+        def seed(count):
+            SubscriptionPlan.objects.bulk_create([
+                SubscriptionPlan(name=f'Plan {i}', price_monthly=Decimal(i), price_yearly=Decimal(i * 10))
+                for i in range(SubscriptionPlan.objects.count(), count)
+            ])
+        self.assertQueriesConstant(self.get(None, 'subscription_plans'), seed)
+
+    def test_current_subscription(self):
+        plan = SubscriptionPlan.objects.create(name='Starter', price_monthly=Decimal('10'), price_yearly=Decimal('100'))
+        UserSubscription.objects.create(
+            user=self.owner, stripe_customer_id='cus_test', plan=plan, status='active',
+            current_period_start=timezone.now(), current_period_end=timezone.now() + timedelta(days=30)
+        )
+        self.assertMaxQueries(2, self.get(self.owner, 'current_subscription'))
+
+    def test_payment_methods(self):
+        def seed(count):
+            PaymentMethod.objects.bulk_create([
+                PaymentMethod(user=self.owner, stripe_payment_method_id=f'pm_{i}', type='card', brand='visa', last_four='4242')
+                for i in range(self.owner.payment_methods.count(), count)
+            ])
+        self.assertQueriesConstant(self.get(self.owner, 'payment_methods'), seed)
+
+    def test_invoices(self):
+        self.assertQueriesConstant(self.get(self.owner, 'invoices'), self.seed_invoices)
+        invoice = self.owner.client_invoices.first()
+        self.assertMaxQueries(1, self.get(self.owner, 'invoice_detail', invoice.pk))
+
+
+class LazyStripeTests(SimpleTestCase):
+
+    @override_settings(STRIPE_SECRET_KEY='sk_test_lazy')
+    def test_sdk_is_configured_on_first_use(self):
+        stripe = SimpleLazyObject(load_stripe)
+        self.assertEqual(stripe.api_key, 'sk_test_lazy')
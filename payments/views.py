@@ -5,14 +5,18 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.conf import settings
 from django.shortcuts import get_object_or_404
+from django.db.models import Count, Max
 from .models import SubscriptionPlan, UserSubscription, JobInvoice, PaymentMethod
 from .serializers import (
     SubscriptionPlanSerializer, UserSubscriptionSerializer, CreateSubscriptionSerializer,
     JobInvoiceSerializer, PaymentMethodSerializer, AddPaymentMethodSerializer,
     PayInvoiceSerializer, StripeConfigSerializer, CreatePaymentIntentSerializer
 )
-from .stripe_service import StripeService
-import stripe
+from .signals import SUBSCRIPTION_PLANS_TAG
+from .stripe_service import StripeService, stripe
+from api.cache import app_cache
+from api.conditional import conditional_response, request_etag
+from api.metrics import track_call
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.http import HttpResponse
@@ -34,9 +38,28 @@ def stripe_config(request):
 @api_view(['GET'])
 def subscription_plans(request):
     """List all active subscription plans - Public endpoint"""
-    plans = SubscriptionPlan.objects.filter(is_active=True)
-    serializer = SubscriptionPlanSerializer(plans, many=True)
-    return Response(serializer.data)
+    # Over all plans so deactivations and deletes change the validators too
+    stamp = app_cache.get_or_set(
+        'subscription_plans:stamp',
+        lambda: SubscriptionPlan.objects.aggregate(count=Count('id'), updated=Max('updated_at')),
+        tags=[SUBSCRIPTION_PLANS_TAG]
+    )
+    
+    def build():
+        data = app_cache.get_or_set(
+            'subscription_plans:list',
+            lambda: SubscriptionPlanSerializer(SubscriptionPlan.objects.filter(is_active=True), many=True).data,
+            tags=[SUBSCRIPTION_PLANS_TAG]
+        )
+        return Response(data)
+    
+    return conditional_response(
+        request,
+        build,
+        # Count-based, so no Last-Modified: a delete lowers the count without
+        # moving Max(updated_at)
+        etag=request_etag(request, 'subscription_plans', stamp['count'], stamp['updated'])
+    )
 
 
 @api_view(['GET'])
@@ -44,7 +67,7 @@ def subscription_plans(request):
 def current_subscription(request):
     """Get user's current subscription"""
     try:
-        subscription = UserSubscription.objects.get(user=request.user)
+        subscription = UserSubscription.objects.select_related('plan', 'user').get(user=request.user)
         serializer = UserSubscriptionSerializer(subscription)
         return Response(serializer.data)
     except UserSubscription.DoesNotExist:
@@ -138,10 +161,11 @@ def add_payment_method(request):
             
             # Attach payment method to customer
             payment_method_id = serializer.validated_data['payment_method_id']
-            stripe_pm = stripe.PaymentMethod.attach(
-                payment_method_id,
-                customer=customer.id,
-            )
+            with track_call('stripe', 'attach_payment_method'):
+                stripe_pm = stripe.PaymentMethod.attach(
+                    payment_method_id,
+                    customer=customer.id,
+                )
             
             # Create local payment method record
             payment_method = PaymentMethod.objects.create(
@@ -188,7 +212,9 @@ def remove_payment_method(request, payment_method_id):
 @permission_classes([IsAuthenticated])
 def invoices(request):
     """List user's invoices"""
-    user_invoices = JobInvoice.objects.filter(client=request.user).order_by('-created_at')
+    user_invoices = JobInvoice.objects.filter(client=request.user).select_related(
+        'job', 'client', 'worker'
+    ).order_by('-created_at')
     serializer = JobInvoiceSerializer(user_invoices, many=True)
     return Response(serializer.data)
 
@@ -197,7 +223,9 @@ def invoices(request):
 @permission_classes([IsAuthenticated])
 def invoice_detail(request, invoice_id):
     """Get specific invoice details"""
-    invoice = get_object_or_404(JobInvoice, id=invoice_id, client=request.user)
+    invoice = get_object_or_404(
+        JobInvoice.objects.select_related('job', 'client', 'worker'), id=invoice_id, client=request.user
+    )
     serializer = JobInvoiceSerializer(invoice)
     return Response(serializer.data)
 
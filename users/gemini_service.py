@@ -1,24 +1,37 @@
 import os
 import json
 import logging
+import functools
 from typing import Dict, Any, Optional
 from django.conf import settings
 from PIL import Image
 import io
 
+from api.metrics import track_call
+
 # Setup logging
 logger = logging.getLogger(__name__)
 
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
-    logger.warning("Google GenerativeAI not installed. Install with: pip install google-generativeai")
+@functools.lru_cache(maxsize=None)
+def load_genai():
+    """
+    Import google.generativeai on first use.
+    
+    The SDK takes most of a second to import and is only needed when a
+    document is verified, so it is kept out of worker startup. Returns None
+    when the package is not installed.
+    """
+    try:
+        import google.generativeai as genai
+    except ImportError:
+        logger.warning("Google GenerativeAI not installed. Install with: pip install google-generativeai")
+        return None
+    return genai
 
 class GeminiDocumentVerifier:
     def __init__(self):
-        if not GEMINI_AVAILABLE:
+        genai = load_genai()
+        if genai is None:
             raise ImportError("Google GenerativeAI package not installed")
         
         api_key = getattr(settings, 'GEMINI_API_KEY', None)
@@ -48,7 +61,8 @@ class GeminiDocumentVerifier:
             prompt = self._get_verification_prompt(document_type, user_data)
             
             # Send to Gemini
-            response = self.model.generate_content([prompt, image])
+            with track_call('gemini', 'generate_content'):
+                response = self.model.generate_content([prompt, image])
             
             # Parse response
             result = self._parse_verification_result(response.text, document_type)
@@ -201,6 +201,7 @@ class JobCategory(models.Model):
     icon = models.CharField(max_length=50, blank=True, help_text="Icon name for UI")
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name_plural = "Job Categories"
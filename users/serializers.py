@@ -911,7 +911,9 @@ class WorkerSerializer(serializers.ModelSerializer):
     
     def get_backgroundCheck(self, obj):
         """Check if worker has background check"""
-        # Check if user has verified documents
+        # Check if user has verified documents (annotated by WorkersListView)
+        if hasattr(obj, 'has_verified_document'):
+            return obj.has_verified_document
         return obj.documents.filter(status='verified').exists()
     
     def get_image(self, obj):
@@ -0,0 +1,29 @@
+from api.cache import invalidate_on_change
+
+from .models import Bid, Document, Job, JobCategory, User
+
+# Cache tags for api.cache entries built from these models
+JOB_CATEGORIES_TAG = 'job_categories'
+WORKERS_TAG = 'workers'
+
+
+def worker_tag(user_id):
+    return f'worker:{user_id}'
+
+
+invalidate_on_change(JobCategory, JOB_CATEGORIES_TAG)
+# last_login is bumped on every login and never shown on worker cards
+invalidate_on_change(User, WORKERS_TAG, lambda user: worker_tag(user.pk), ignore_fields={'last_login'})
+# Worker cards show a background-check flag from verified documents
+invalidate_on_change(Document, WORKERS_TAG, lambda document: worker_tag(document.user_id))
+# Worker profiles list recent accepted bids and their jobs
+invalidate_on_change(Bid, lambda bid: worker_tag(bid.worker_id))
+# Every job view bumps views_count, which worker profiles do not show
+invalidate_on_change(
+    Job,
+    lambda job: [
+        worker_tag(worker_id)
+        for worker_id in job.bids.filter(status='accepted').values_list('worker_id', flat=True)
+    ],
+    ignore_fields={'views_count'},
+)
@@ -1,3 +1,288 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+
+from api.cache import app_cache
+from api.testing import QueryBudgetMixin, get_routes
+
+from . import urls
+from .models import Bid, BidDocument, Document, Job, JobCategory, JobImage, User, WorkSample
+
+
+def seed_users(role, count, prefix):
+    """Bring the users whose email starts with ``prefix`` up to ``count``."""
+    existing = User.objects.filter(email__startswith=f'{prefix}-').count()
+    User.objects.bulk_create([
+        User(
+            email=f'{prefix}-{i}@example.com',
+            username=f'{prefix}-{i}',
+            first_name='Test',
+            last_name=f'{role.title()} {i}',
+            role=role,
+            skills=['plumbing', 'pipes'],
+            password='!',
+        )
+        for i in range(existing, count)
+    ])
+    return User.objects.filter(email__startswith=f'{prefix}-').order_by('id')
+
+
+def new_job(client, category, title='Fix a leaking sink', status='open'):
+    return Job(
+        client=client,
+        title=title,
+        category=category,
+        description='The kitchen sink leaks under the cabinet.',
+        address='1 Main St',
+        city='Springfield',
+        budget=Decimal('150.00'),
+        status=status,
+    )
+
+
+class EndpointQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every GET route in users.urls runs a fixed number of queries."""
+
+    covered_routes = {
+        'api-root', 'profile', 'workers-list', 'worker-detail',
+        'documents-list', 'documents-detail',
+        'job-categories-list', 'job-categories-detail',
+        'jobs-list', 'jobs-detail', 'jobs-my-jobs', 'jobs-job-detail', 'jobs-job-bids', 'jobs-download-report',
+        'bids-list', 'bids-detail',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = JobCategory.objects.create(name='Plumbing', slug='plumbing')
+        cls.owner = User.objects.create(
+            email='client@example.com', username='client', first_name='Casey', last_name='Client', role='client'
+        )
+        cls.worker = User.objects.create(
+            email='worker@example.com', username='worker', first_name='Wren', last_name='Worker', role='worker',
+            skills=['plumbing']
+        )
+        cls.job = new_job(cls.owner, cls.category)
+        cls.job.save()
+
+    def setUp(self):
+        self.api = APIClient()
+
+    def get(self, user, name, *args):
+        self.api.force_authenticate(user)
+        url = reverse(name, args=args)
+        return lambda: self.api.get(url)
+
+    def seed_bids(self, job):
+        """Seeder for ``n`` bids on ``job``, each with a document and a work sample."""
+        def seed(count):
+            workers = list(seed_users('worker', count, f'bidder-{job.pk}'))
+            have = set(Bid.objects.filter(job=job).values_list('worker_id', flat=True))
+            bids = Bid.objects.bulk_create([
+                Bid(job=job, worker=worker, price=Decimal('120.00'), availability='Within 1 week', proposal='I can fix it.')
+                for worker in workers if worker.pk not in have
+            ])
+            BidDocument.objects.bulk_create([BidDocument(bid=bid, document='bid_documents/quote.pdf', name='Quote') for bid in bids])
+            WorkSample.objects.bulk_create([WorkSample(bid=bid, image='work_samples/sink.jpg', title='Sink') for bid in bids])
+        return seed
+
+    def test_every_get_route_is_covered(self):
+        self.assertEqual(get_routes(urls.urlpatterns) - self.covered_routes, set())
+
+    def test_api_root(self):
+        self.assertMaxQueries(0, self.get(self.worker, 'api-root'))
+
+    def test_profile(self):
+        self.assertMaxQueries(1, self.get(self.worker, 'profile'))
+
+    def test_workers_list(self):
+        def seed(count):
+            workers = seed_users('worker', count, 'listed')
+            Document.objects.bulk_create([
+                Document(user=worker, document_type='national_id', document_file='documents/id.pdf', status='verified')
+                for worker in workers.filter(documents__isnull=True)
+            ])
+        self.assertQueriesConstant(self.get(self.worker, 'workers-list'), seed)
+
+    def test_worker_detail(self):
+        def seed(count):
+            jobs = Job.objects.bulk_create([new_job(self.owner, self.category, status='completed') for _ in range(count - self.worker.bids.count())])
+            Bid.objects.bulk_create([
+                Bid(job=job, worker=self.worker, price=Decimal('120.00'), availability='Now', proposal='Done.', status='accepted')
+                for job in jobs
+            ])
+        self.assertQueriesConstant(self.get(self.owner, 'worker-detail', self.worker.pk), seed)
+
+    def test_documents(self):
+        types = [code for code, _ in Document.DOCUMENT_TYPES]
+
+        def seed(count):
+            for document_type in types[:count]:
+                Document.objects.get_or_create(
+                    user=self.worker, document_type=document_type, defaults={'document_file': 'documents/doc.pdf'}
+                )
+        # One document per type per user, so the list is short by construction
+        self.assertQueriesConstant(self.get(self.worker, 'documents-list'), seed, sizes=(1, len(types)))
+        document = self.worker.documents.first()
+        self.assertMaxQueries(1, self.get(self.worker, 'documents-detail', document.pk))
+
+    def test_job_categories(self):
+        def seed(count):
+            existing = JobCategory.objects.count()
+            JobCategory.objects.bulk_create([
+                JobCategory(name=f'Category {i}', slug=f'category-{i}') for i in range(existing, count)
+            ])
+        self.assertQueriesConstant(self.get(None, 'job-categories-list'), seed)
+        self.assertMaxQueries(1, self.get(None, 'job-categories-detail', self.category.pk))
+
+    def test_jobs_list(self):
+        clients = seed_users('client', 1, 'poster')
+
+        def seed(count):
+            Job.objects.bulk_create([
+                new_job(clients[0], self.category) for _ in range(count - Job.objects.filter(client=clients[0]).count())
+            ])
+        self.assertQueriesConstant(self.get(self.worker, 'jobs-list'), seed)
+
+    def test_my_jobs(self):
+        def seed(count):
+            Job.objects.bulk_create([new_job(self.owner, self.category) for _ in range(count - self.owner.posted_jobs.count())])
+        self.assertQueriesConstant(self.get(self.owner, 'jobs-my-jobs'), seed)
+
+    def test_job_detail(self):
+        def seed(count):
+            JobImage.objects.bulk_create([
+                JobImage(job=self.job, image='job_images/sink.jpg', order=i) for i in range(self.job.images.count(), count)
+            ])
+        self.assertQueriesConstant(self.get(self.owner, 'jobs-detail', self.job.pk), seed)
+
+    def test_job_bid_pages(self):
+        seed = self.seed_bids(self.job)
+        for name in ('jobs-job-detail', 'jobs-job-bids', 'jobs-download-report'):
+            with self.subTest(name):
+                self.assertQueriesConstant(self.get(self.owner, name, self.job.pk), seed)
+
+    def test_bids_list(self):
+        def seed(count):
+            jobs = Job.objects.bulk_create([new_job(self.owner, self.category) for _ in range(count - self.worker.bids.count())])
+            Bid.objects.bulk_create([
+                Bid(job=job, worker=self.worker, price=Decimal('120.00'), availability='Now', proposal='Hello')
+                for job in jobs
+            ])
+        self.assertQueriesConstant(self.get(self.worker, 'bids-list'), seed)
+        self.assertQueriesConstant(self.get(self.owner, 'bids-list'), seed)
+
+    def test_bid_detail(self):
+        bid = Bid.objects.create(job=self.job, worker=self.worker, price=Decimal('120.00'), availability='Now', proposal='Hi')
+
+        def seed(count):
+            BidDocument.objects.bulk_create([
+                BidDocument(bid=bid, document='bid_documents/quote.pdf', name=f'Quote {i}') for i in range(bid.documents.count(), count)
+            ])
+        self.assertQueriesConstant(self.get(self.worker, 'bids-detail', bid.pk), seed)
+
+
+class WorkerCacheInvalidationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = JobCategory.objects.create(name='Plumbing', slug='plumbing')
+        cls.owner = User.objects.create(email='client@example.com', username='client', role='client')
+        cls.worker = User.objects.create(email='worker@example.com', username='worker', role='worker')
+        cls.viewer = User.objects.create(email='viewer@example.com', username='viewer', role='worker')
+        cls.job = new_job(cls.owner, cls.category)
+        cls.job.save()
+        Bid.objects.create(
+            job=cls.job, worker=cls.worker, price=Decimal('120.00'), availability='Now', proposal='Hi', status='accepted'
+        )
+
+    def test_viewing_a_job_does_not_invalidate(self):
+        api = APIClient()
+        api.force_authenticate(self.viewer)
+        with mock.patch('api.cache.app_cache.invalidate_tags') as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = api.get(reverse('jobs-detail', args=[self.job.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.views_count, 1)
+        invalidate.assert_not_called()
+
+    def test_editing_a_job_invalidates_its_accepted_workers(self):
+        with mock.patch('api.cache.app_cache.invalidate_tags') as invalidate:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.job.title = 'Fix two leaking sinks'
+                self.job.save()
+        invalidate.assert_called_once_with(f'worker:{self.worker.pk}')
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = JobCategory.objects.create(name='Plumbing', slug='plumbing')
+        cls.owner = User.objects.create(email='client@example.com', username='client', role='client')
+        cls.worker = User.objects.create(email='worker@example.com', username='worker', role='worker')
+        cls.job = new_job(cls.owner, cls.category)
+        cls.job.save()
+
+    def setUp(self):
+        cache.clear()
+        app_cache.clear_local()
+        self.api = APIClient()
+
+    def test_category_list_revalidates(self):
+        url = reverse('job-categories-list')
+        response = self.api.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        etag = response['ETag']
+
+        response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            JobCategory.objects.create(name='Painting', slug='painting')
+        response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_count_based_list_sends_no_last_modified(self):
+        url = reverse('job-categories-list')
+        response = self.api.get(url)
+        self.assertFalse(response.has_header('Last-Modified'))
+        etag = response['ETag']
+
+        # A delete lowers the count without moving Max(updated_at)
+        with self.captureOnCommitCallbacks(execute=True):
+            JobCategory.objects.create(name='Painting', slug='painting').delete()
+            self.category.delete()
+        response = self.api.get(url, HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_varies_by_user(self):
+        url = reverse('job-categories-list')
+        anonymous = self.api.get(url)['ETag']
+        self.api.force_authenticate(self.worker)
+        response = self.api.get(url, HTTP_IF_NONE_MATCH=anonymous)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_revalidated_job_view_is_not_counted(self):
+        url = reverse('jobs-detail', args=[self.job.pk])
+        self.api.force_authenticate(self.worker)
+        etag = self.api.get(url)['ETag']
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.views_count, 1)
 
-# Create your tests here.
+        self.job.title = 'Fix two leaking sinks'
+        self.job.save()
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
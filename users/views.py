@@ -6,26 +6,18 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
-from allauth.socialaccount.models import SocialAccount
-from allauth.socialaccount.providers.google.views import GoogleOAuth2Adapter
-from allauth.socialaccount.providers.facebook.views import FacebookOAuth2Adapter
-from allauth.socialaccount.providers.oauth2.client import OAuth2Client
-from allauth.socialaccount.helpers import complete_social_login
 from django.utils.translation import gettext_lazy as _
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
-import requests
-import jwt
 from django.conf import settings
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.core.files.storage import default_storage
 from django.http import HttpResponse, Http404
+import logging
 import os
 import uuid
 import mimetypes
-from django.db.models import Q
+from django.db.models import Count, Exists, Max, OuterRef, Q
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.viewsets import ModelViewSet
 from django.utils import timezone
@@ -57,6 +49,12 @@ from .serializers import (
     BidDetailSerializer
 )
 from .gemini_service import GeminiDocumentVerifier
+from .signals import JOB_CATEGORIES_TAG, WORKERS_TAG, worker_tag
+from api.cache import app_cache, make_key
+from api.conditional import conditional_response, request_etag
+from api.instrumentation import log_event
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 
@@ -312,7 +310,10 @@ class DocumentViewSet(ModelViewSet):
                 }, status=status.HTTP_201_CREATED)
                 
             except Exception as e:
-                print(f"Gemini verification failed: {e}")
+                log_event(
+                    logger, 'document.verification_failed', level=logging.WARNING,
+                    document_id=document.id, document_type=document_type, error=repr(e)
+                )
                 # If Gemini fails, still save the document but mark for manual review
                 document.status = 'manual_review'
                 document.verification_notes = 'Automatic verification failed, requires manual review'
@@ -383,7 +384,10 @@ class DocumentViewSet(ModelViewSet):
                 }, status=status.HTTP_200_OK)
                 
             except Exception as e:
-                print(f"Gemini re-verification failed: {e}")
+                log_event(
+                    logger, 'document.reverification_failed', level=logging.WARNING,
+                    document_id=document.id, document_type=document.document_type, error=repr(e)
+                )
                 return Response({
                     'error': 'Verification service temporarily unavailable'
                 }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -407,6 +411,31 @@ class JobCategoryViewSet(ModelViewSet):
         if self.action in ['list', 'retrieve']:
             return [permissions.AllowAny()]
         return [permissions.IsAdminUser()]
+    
+    def list(self, request, *args, **kwargs):
+        """Cached category list; invalidated whenever a category changes"""
+        # Over all categories so deactivations and deletes change the validators too
+        stamp = app_cache.get_or_set(
+            'job_categories:stamp',
+            lambda: JobCategory.objects.aggregate(count=Count('id'), updated=Max('updated_at')),
+            tags=[JOB_CATEGORIES_TAG]
+        )
+        
+        def build():
+            data = app_cache.get_or_set(
+                make_key('job_categories', 'list', sorted(request.query_params.lists())),
+                lambda: super(JobCategoryViewSet, self).list(request, *args, **kwargs).data,
+                tags=[JOB_CATEGORIES_TAG]
+            )
+            return Response(data)
+        
+        return conditional_response(
+            request,
+            build,
+            # Count-based, so no Last-Modified: a delete lowers the count
+            # without moving Max(updated_at)
+            etag=request_etag(request, 'job_categories', stamp['count'], stamp['updated'])
+        )
 
 class JobViewSet(ModelViewSet):
     """ViewSet for job management with CRUD operations"""
@@ -504,14 +533,30 @@ class JobViewSet(ModelViewSet):
     def retrieve(self, request, pk=None):
         """Get job details and increment view count"""
         job = self.get_object()
+        is_owner = job.client_id == request.user.id
+        
+        # Client, category and images are already loaded by get_queryset, so
+        # the validators cost no extra queries. Only the owner's copy tracks
+        # views_count; a worker's revalidation is not counted as a new view.
+        # Image edits and the client's profile leave job.updated_at alone, so
+        # only the ETag is sent.
+        etag = request_etag(
+            request, 'job', job.pk, job.updated_at, job.applications_count,
+            job.views_count if is_owner else None, job.posted_time_ago,
+            job.client.updated_at, job.category.updated_at if job.category else None,
+            [(image.pk, image.order, image.caption) for image in job.images.all()]
+        )
         
-        # Increment view count (only for workers viewing client jobs)
-        if request.user.role == 'worker' and job.client != request.user:
-            job.views_count += 1
-            job.save(update_fields=['views_count'])
+        def build():
+            # Increment view count (only for workers viewing client jobs)
+            if request.user.role == 'worker' and not is_owner:
+                job.views_count += 1
+                job.save(update_fields=['views_count'])
+            
+            serializer = JobSerializer(job, context={'request': request})
+            return Response(serializer.data)
         
-        serializer = JobSerializer(job, context={'request': request})
-        return Response(serializer.data)
+        return conditional_response(request, build, etag=etag)
     
     def update(self, request, pk=None):
         """Update a job (owner only)"""
@@ -1057,8 +1102,13 @@ class WorkersListView(APIView):
     
     def get(self, request):
         try:
-            # Get all workers (users with role='worker')
-            workers = User.objects.filter(role='worker')
+            # Get all workers (users with role='worker'); backgroundCheck reads the
+            # annotation instead of querying documents per worker
+            workers = User.objects.filter(role='worker').annotate(
+                has_verified_document=Exists(
+                    Document.objects.filter(user=OuterRef('pk'), status='verified')
+                )
+            )
             
             # Apply filters
             search = request.query_params.get('search', '')
@@ -1127,17 +1177,26 @@ class WorkersListView(APIView):
             else:
                 workers = workers.order_by('-average_rating', '-total_reviews')  # Default sort
             
-            # Serialize workers
-            serializer = WorkerSerializer(workers, many=True, context={'request': request})
-            
-            # Get category counts
-            categories = self.get_category_counts()
+            def build_payload():
+                # Serialize workers
+                serializer = WorkerSerializer(workers, many=True, context={'request': request})
+                
+                # Get category counts
+                categories = self.get_category_counts()
+                
+                return {
+                    'workers': serializer.data,
+                    'categories': categories,
+                    'total_count': workers.count()
+                }
             
-            return Response({
-                'workers': serializer.data,
-                'categories': categories,
-                'total_count': workers.count()
-            })
+            # Image URLs are absolute, so the host is part of the key
+            payload = app_cache.get_or_set(
+                make_key('workers', 'list', request.build_absolute_uri('/'), sorted(request.query_params.lists())),
+                build_payload,
+                tags=[WORKERS_TAG]
+            )
+            return Response(payload)
             
         except Exception as e:
             return Response({
@@ -1176,22 +1235,24 @@ class WorkersListView(APIView):
                 }
             ]
             
-            category_data = []
+            # Count workers with skills matching each category, in one query
+            filters = {}
             for category in categories:
-                # Count workers with skills matching this category
                 skills_filter = Q()
                 for skill in category['skills']:
                     skills_filter |= Q(skills__icontains=skill)
-                
-                count = User.objects.filter(role='worker').filter(skills_filter).count()
-                
-                category_data.append({
+                filters[category['name']] = Count('id', filter=skills_filter)
+            
+            counts = User.objects.filter(role='worker').aggregate(**filters)
+            
+            return [
+                {
                     'name': category['name'],
-                    'count': count,
+                    'count': counts[category['name']],
                     'icon': category['icon']
-                })
-            
-            return category_data
+                }
+                for category in categories
+            ]
             
         except Exception as e:
             # Return default categories if error
@@ -1209,13 +1270,44 @@ class WorkerDetailView(APIView):
     
     def get(self, request, worker_id):
         try:
-            # Get the worker by ID
-            worker = get_object_or_404(User, id=worker_id, role='worker')
+            def build_payload():
+                # Get the worker by ID
+                worker = get_object_or_404(User, id=worker_id, role='worker')
+                
+                # Serialize worker data
+                return WorkerDetailSerializer(worker, context={'request': request}).data
             
-            # Serialize worker data
-            serializer = WorkerDetailSerializer(worker, context={'request': request})
+            def build():
+                payload = app_cache.get_or_set(
+                    make_key('workers', 'detail', worker_id, request.build_absolute_uri('/')),
+                    build_payload,
+                    tags=[worker_tag(worker_id)]
+                )
+                return Response(payload)
             
-            return Response(serializer.data)
+            # The profile plus the accepted bids and jobs shown in its work history
+            accepted = Q(bids__status='accepted')
+            stamp = app_cache.get_or_set(
+                make_key('workers', 'stamp', worker_id),
+                lambda: User.objects.filter(id=worker_id, role='worker').aggregate(
+                    updated=Max('updated_at'),
+                    accepted_bids=Count('bids', filter=accepted),
+                    bids_updated=Max('bids__updated_at', filter=accepted),
+                    jobs_updated=Max('bids__job__updated_at', filter=accepted)
+                ),
+                tags=[worker_tag(worker_id)]
+            )
+            if stamp['updated'] is None:
+                # Unknown worker; let build() raise the 404
+                return build()
+            
+            return conditional_response(
+                request,
+                build,
+                # No Last-Modified: a bid that stops being accepted lowers the
+                # count without moving any stamp
+                etag=request_etag(request, 'worker', worker_id, *stamp.values())
+            )
             
         except User.DoesNotExist:
             return Response({
@@ -17,26 +17,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'workconnect.settings')
 # is populated before importing code that may import ORM models.
 django_asgi_app = get_asgi_application()
 
-# Run migrations automatically when Django starts
-try:
-    print("🚀 Running migrations automatically...")
-    from django.core.management import execute_from_command_line
-    execute_from_command_line(['manage.py', 'migrate', '--noinput'])
-    print("✅ Migrations completed successfully!")
-    
-    # Create superuser if needed
-    print("👤 Creating superuser if needed...")
-    from django.contrib.auth import get_user_model
-    User = get_user_model()
-    if not User.objects.filter(is_superuser=True).exists():
-        print('Creating superuser...')
-        User.objects.create_superuser('admin', 'admin@workconnect.com', 'admin123')
-        print('✅ Superuser created successfully!')
-    else:
-        print('✅ Superuser already exists.')
-except Exception as e:
-    print(f"⚠️ Migration or superuser creation failed: {e}")
-    print("Continuing with application startup...")
+# No database work happens at import: migrations and the superuser bootstrap
+# run once per deploy in ``manage.py release``, before the servers start.
 
 # Import routing and middleware after Django is set up
 from chat import routing
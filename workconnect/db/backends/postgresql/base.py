@@ -0,0 +1,97 @@
+"""
+PostgreSQL backend that draws connections from a per-process pool.
+
+Configure it with ``OPTIONS['pool']`` (see ``workconnect.db.pool``)::
+
+    'ENGINE': 'workconnect.db.backends.postgresql',
+    'CONN_MAX_AGE': 0,
+    'OPTIONS': {'pool': {'max_size': 10, 'timeout': 10}},
+
+``CONN_MAX_AGE`` should stay 0 so Django hands the connection back at the
+end of each request; the pool, not Django, keeps it open.
+"""
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from workconnect.db.pool import ConnectionPool, PoolTimeout, get_pool
+
+Database = base.Database
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    @property
+    def pool(self):
+        target = tuple(self.settings_dict.get(key) for key in ('HOST', 'PORT', 'NAME', 'USER'))
+        return get_pool(self.alias, self._create_pool, target)
+
+    def _create_pool(self):
+        conn_params = self.get_connection_params()
+        return ConnectionPool(
+            connect=lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+            is_healthy=self._is_healthy,
+            reset=self._reset,
+            **(self.settings_dict['OPTIONS'].get('pool') or {})
+        )
+
+    def get_new_connection(self, conn_params):
+        try:
+            return self.pool.checkout()
+        except PoolTimeout as exc:
+            # Surfaces as django.db.OperationalError through wrap_database_errors
+            raise Database.OperationalError(str(exc)) from exc
+
+    def _close(self):
+        if self.connection is None:
+            return
+        if self.in_atomic_block:
+            # Django keeps referencing a connection closed mid-transaction
+            # until the atomic block exits, so it must not be reused
+            self.pool.discard(self.connection)
+        else:
+            self.pool.checkin(self.connection)
+
+    @staticmethod
+    def _is_healthy(connection):
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except Database.Error:
+            return False
+        return True
+
+    @staticmethod
+    def _reset(connection):
+        """
+        Make a returned connection look freshly opened; False if it is broken.
+
+        Anything left open is rolled back, then ``DISCARD ALL`` drops session
+        state a request may have set: ``SET`` parameters, temporary tables,
+        prepared statements, advisory locks and LISTEN registrations. The
+        time zone and role Django sets are applied again on the next checkout
+        by ``init_connection_state``.
+        """
+        if connection.closed:
+            return False
+        status = connection.info.transaction_status
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        try:
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            # DISCARD ALL cannot run inside a transaction block
+            autocommit = connection.autocommit
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute('DISCARD ALL')
+            connection.autocommit = autocommit
+        except Database.Error:
+            return False
+        return True
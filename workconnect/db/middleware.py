@@ -0,0 +1,76 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .routers import begin_request, end_request, replica_aliases
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+PIN_COOKIE = 'db_primary_pin'
+PIN_CACHE_PREFIX = 'db_primary_pin:'
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets safe-method requests read from a replica, except for clients that
+    wrote recently.
+
+    A request that writes pins its client to the primary for
+    ``DB_REPLICA_STICKY_SECONDS``, so the client reads its own writes despite
+    replication lag. With ``DB_REPLICA_STICKINESS = 'cache'`` the pin is
+    stored in the shared cache under a hash of the client's credentials
+    (Authorization header or session cookie), which also covers token
+    clients that do not keep cookies. With ``'cookie'``, or for clients with
+    no credentials, it is a short-lived cookie.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_aliases():
+            return self.get_response(request)
+
+        state, token = begin_request(request.method in SAFE_METHODS and not self.is_pinned(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+
+        if state.wrote and request.method not in SAFE_METHODS:
+            self.pin(request, response)
+        return response
+
+    def sticky_seconds(self):
+        return getattr(settings, 'DB_REPLICA_STICKY_SECONDS', 10)
+
+    def client_key(self, request):
+        if getattr(settings, 'DB_REPLICA_STICKINESS', 'cache') != 'cache':
+            return None
+        credentials = (
+            request.META.get('HTTP_AUTHORIZATION')
+            or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        )
+        if not credentials:
+            return None
+        return PIN_CACHE_PREFIX + hashlib.sha256(credentials.encode()).hexdigest()
+
+    def is_pinned(self, request):
+        if PIN_COOKIE in request.COOKIES:
+            return True
+        key = self.client_key(request)
+        return key is not None and cache.get(key) is not None
+
+    def pin(self, request, response):
+        key = self.client_key(request)
+        if key is not None:
+            cache.set(key, 1, self.sticky_seconds())
+        else:
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=self.sticky_seconds(),
+                httponly=True,
+                samesite='Lax',
+                secure=request.is_secure(),
+            )
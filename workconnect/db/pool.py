@@ -0,0 +1,217 @@
+"""
+Process-wide database connection pool.
+
+Each Django ``DatabaseWrapper`` (one per thread) checks a connection out of
+the pool when it connects and hands it back when it closes. With
+``CONN_MAX_AGE = 0`` that happens at the end of every request and around
+every ``database_sync_to_async`` call, so a worker's many threads share at
+most ``max_size`` server connections instead of holding one each.
+
+Connections are health-checked on checkout when they have been idle for
+longer than ``health_check_interval``. They are recycled after
+``max_lifetime`` and dropped after ``max_idle`` seconds idle, keeping
+``min_size`` around. A checkout that finds the pool exhausted waits up to
+``timeout`` seconds. The time spent waiting is recorded (see
+``pool_stats``), so a pool that is too small shows up as wait time rather
+than as Postgres running out of backends.
+"""
+import collections
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Capped pool of DB-API connections opened by ``connect``.
+
+    ``is_healthy(connection)`` runs a cheap round trip and ``reset(connection)``
+    makes a returned connection reusable, returning False if it cannot be.
+    """
+
+    def __init__(self, connect, is_healthy, reset, max_size=10, min_size=0, timeout=10.0,
+                 max_idle=300.0, max_lifetime=3600.0, health_check_interval=30.0):
+        self.connect = connect
+        self.is_healthy = is_healthy
+        self.reset = reset
+        self.max_size = max_size
+        self.min_size = min_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        # (connection, opened_at, returned_at); the right end is the most recently returned
+        self._idle = collections.deque()
+        self._opened_at = {}
+        self._size = 0
+        self._condition = threading.Condition()
+        self.stats = collections.Counter()
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def checkout(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        with self._condition:
+            expired = self._take_expired(started)
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    entry = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'No database connection available within {self.timeout:.1f}s '
+                        f'({self.max_size} in use)'
+                    )
+                waited = True
+                self._condition.wait(remaining)
+
+            wait = time.monotonic() - started
+            self.stats['checkouts'] += 1
+            if waited:
+                self.stats['waits'] += 1
+            self.wait_seconds_total += wait
+            self.wait_seconds_max = max(self.wait_seconds_max, wait)
+
+        self._close_all(expired)
+        if waited and wait > 1:
+            logger.warning('Waited %.2fs for a database connection; the pool (max %d) is saturated', wait, self.max_size)
+
+        now = time.monotonic()
+        if entry is not None:
+            connection, opened_at, returned_at = entry
+            if now - opened_at > self.max_lifetime:
+                self._close(connection)
+            elif now - returned_at > self.health_check_interval and not self.is_healthy(connection):
+                self.stats['health_check_failures'] += 1
+                self._close(connection)
+            else:
+                self._opened_at[id(connection)] = opened_at
+                return connection
+
+        # A fresh connection fills the slot reserved above
+        try:
+            connection = self.connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        self.stats['opened'] += 1
+        self._opened_at[id(connection)] = now
+        return connection
+
+    def checkin(self, connection):
+        opened_at = self._opened_at.pop(id(connection), None)
+        if opened_at is None:
+            # Not ours (already discarded); just close it
+            self._close(connection)
+            return
+        reusable = time.monotonic() - opened_at <= self.max_lifetime and self.reset(connection)
+        with self._condition:
+            if reusable:
+                self._idle.append((connection, opened_at, time.monotonic()))
+            else:
+                self._size -= 1
+            self._condition.notify()
+        if not reusable:
+            self._close(connection)
+
+    def discard(self, connection):
+        """Close a checked-out connection instead of returning it."""
+        self._opened_at.pop(id(connection), None)
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+        self._close(connection)
+
+    def close_all(self):
+        with self._condition:
+            idle = [connection for connection, _, _ in self._idle]
+            self._size -= len(idle)
+            self._idle.clear()
+        self._close_all(idle)
+
+    def get_stats(self):
+        with self._condition:
+            idle = len(self._idle)
+            size = self._size
+        checkouts = self.stats['checkouts']
+        return {
+            'max_size': self.max_size,
+            'size': size,
+            'idle': idle,
+            'in_use': size - idle,
+            'checkouts': checkouts,
+            'waits': self.stats['waits'],
+            'timeouts': self.stats['timeouts'],
+            'wait_seconds_total': self.wait_seconds_total,
+            'wait_seconds_max': self.wait_seconds_max,
+            'wait_seconds_avg': self.wait_seconds_total / checkouts if checkouts else 0.0,
+            'opened': self.stats['opened'],
+            'closed': self.stats['closed'],
+            'health_check_failures': self.stats['health_check_failures'],
+        }
+
+    def _take_expired(self, now):
+        # Oldest returns sit at the left; keep min_size around
+        expired = []
+        while (
+            self._idle
+            and self._size > self.min_size
+            and now - self._idle[0][2] > self.max_idle
+        ):
+            expired.append(self._idle.popleft()[0])
+            self._size -= 1
+        return expired
+
+    def _close_all(self, connections):
+        for connection in connections:
+            self._close(connection)
+
+    def _close(self, connection):
+        self.stats['closed'] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def get_pool(alias, factory, target=()):
+    """
+    The pool for ``alias`` in this process, created by ``factory()`` on first use.
+
+    ``target`` identifies the server and database; a settings change such as
+    the test runner switching to the test database gets a new pool.
+    """
+    key = (alias, os.getpid(), target)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = factory()
+    return pool
+
+
+def pool_stats():
+    """Stats for each pool in this process, keyed by database alias."""
+    pid = os.getpid()
+    return {alias: pool.get_stats() for (alias, owner, _), pool in list(_pools.items()) if owner == pid}
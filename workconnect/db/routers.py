@@ -0,0 +1,90 @@
+"""
+Read-replica routing with read-your-writes stickiness.
+
+Only reads made while serving a safe-method HTTP request (see
+``ReplicaRoutingMiddleware``) go to a replica. Everything else reads from and
+writes to the primary, including management commands and WebSocket
+consumers. Within a request, the first write pins the rest of the request to
+the primary, and so does an open transaction on the primary. One replica is
+chosen per request, so a request never reads from two replicas at different
+points of replication.
+"""
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_routing = contextvars.ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    """
+    Routing decision for one request.
+
+    Mutated in place rather than re-set, so code running in a copied context
+    (``sync_to_async``) and the middleware see the same state.
+    """
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.replica = None
+        self.wrote = False
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def begin_request(use_replica):
+    """Start routing for a request; pass the returned token to ``end_request``."""
+    state = RoutingState(use_replica)
+    return state, _routing.set(state)
+
+
+def end_request(token):
+    _routing.reset(token)
+
+
+def use_primary():
+    """Send the rest of the current request's reads to the primary."""
+    state = _routing.get()
+    if state is not None:
+        state.use_replica = False
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or not state.use_replica:
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related lookups follow the instance they start from
+            return instance._state.db
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        if state.replica is None:
+            replicas = replica_aliases()
+            if not replicas:
+                state.use_replica = False
+                return None
+            state.replica = random.choice(replicas)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+            state.use_replica = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replica_aliases():
+            return False
+        return None
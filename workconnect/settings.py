@@ -78,8 +78,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',  # Request latency histogram for /metrics
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add whitenoise for static files
+    'api.middleware.SQLInstrumentationMiddleware',  # Sampled query counts, Server-Timing and N+1 logs
+    'workconnect.db.middleware.ReplicaRoutingMiddleware',  # Replica reads, pinned to the primary after writes
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -114,12 +117,40 @@ WSGI_APPLICATION = 'workconnect.wsgi.application'
 ASGI_APPLICATION = 'workconnect.asgi.application'
 
 # Channel layers configuration
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-    },
-}
+# Use Redis (with bulk group sends for notification fan-out) when REDIS_URL is set
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'chat.layers.BulkRedisChannelLayer',
+            'CONFIG': {
+                'hosts': [REDIS_URL],
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'chat.layers.TimedInMemoryChannelLayer',
+        },
+    }
 
+# Cache configuration
+# Shared Redis cache when REDIS_URL is set, per-process local memory otherwise
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -162,6 +193,76 @@ else:
         }
     }
 
+# Read replicas, as comma-separated database URLs. Reads made while serving
+# GET/HEAD/OPTIONS requests go to a replica (workconnect.db.routers); a client
+# that writes is pinned to the primary for DB_REPLICA_STICKY_SECONDS, tracked
+# in the cache under its credentials ("cache") or in a cookie ("cookie")
+DATABASE_REPLICA_URLS = config('DATABASE_REPLICA_URLS', default='')
+DB_REPLICA_STICKY_SECONDS = config('DB_REPLICA_STICKY_SECONDS', default=10, cast=int)
+DB_REPLICA_STICKINESS = config('DB_REPLICA_STICKINESS', default='cache')
+
+DATABASE_REPLICAS = []
+for index, replica_url in enumerate(url.strip() for url in DATABASE_REPLICA_URLS.split(',') if url.strip()):
+    alias = f'replica_{index + 1}'
+    if HAS_DJ_DATABASE_URL:
+        DATABASES[alias] = dj_database_url.parse(replica_url, ssl_require=True)
+    else:
+        from urllib.parse import urlparse
+        replica = urlparse(replica_url)
+        DATABASES[alias] = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': replica.path[1:],
+            'USER': replica.username,
+            'PASSWORD': replica.password,
+            'HOST': replica.hostname,
+            'PORT': replica.port or 5432,
+            'OPTIONS': {
+                'sslmode': 'require',
+            },
+        }
+    # Tests read the primary through the replica aliases
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['workconnect.db.routers.ReplicaRouter']
+
+# Connection management for each worker process (DB_POOL_MODE):
+#   "pool"       - capped in-process pool (workconnect.db.backends.postgresql);
+#                  connections go back to the pool after every request and
+#                  database_sync_to_async call
+#   "pgbouncer"  - connect through PgBouncer in transaction mode; no
+#                  server-side cursors. Run `manage.py release` against the
+#                  database directly, its advisory lock needs a real session
+#   "persistent" - Django's own per-thread connections, kept DB_CONN_MAX_AGE
+DB_POOL_MODE = config('DB_POOL_MODE', default='pool')
+DB_POOL_MAX_SIZE = config('DB_POOL_MAX_SIZE', default=10, cast=int)
+DB_POOL_MIN_SIZE = config('DB_POOL_MIN_SIZE', default=0, cast=int)
+DB_POOL_TIMEOUT = config('DB_POOL_TIMEOUT', default=10, cast=float)
+DB_POOL_MAX_IDLE = config('DB_POOL_MAX_IDLE', default=300, cast=float)
+DB_POOL_MAX_LIFETIME = config('DB_POOL_MAX_LIFETIME', default=3600, cast=float)
+DB_POOL_HEALTH_CHECK_INTERVAL = config('DB_POOL_HEALTH_CHECK_INTERVAL', default=30, cast=float)
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=600, cast=int)
+
+for database in DATABASES.values():
+    if database['ENGINE'] != 'django.db.backends.postgresql':
+        continue
+    if DB_POOL_MODE == 'pool':
+        database['ENGINE'] = 'workconnect.db.backends.postgresql'
+        database['CONN_MAX_AGE'] = 0
+        database.setdefault('OPTIONS', {})['pool'] = {
+            'max_size': DB_POOL_MAX_SIZE,
+            'min_size': DB_POOL_MIN_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+            'max_idle': DB_POOL_MAX_IDLE,
+            'max_lifetime': DB_POOL_MAX_LIFETIME,
+            'health_check_interval': DB_POOL_HEALTH_CHECK_INTERVAL,
+        }
+    else:
+        database['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+        database['CONN_HEALTH_CHECKS'] = True
+        if DB_POOL_MODE == 'pgbouncer':
+            database['DISABLE_SERVER_SIDE_CURSORS'] = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -304,3 +405,101 @@ GEMINI_API_KEY = config('GEMINI_API_KEY', default='')
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='')
 STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
+
+# Chat tuning
+# Minimum seconds between conversation.updated_at bumps when messages are posted
+CHAT_CONVERSATION_TOUCH_INTERVAL = config('CHAT_CONVERSATION_TOUCH_INTERVAL', default=5, cast=int)
+
+# Typing indicators: at most one state change per user per conversation in this window
+CHAT_TYPING_DEBOUNCE_SECONDS = config('CHAT_TYPING_DEBOUNCE_SECONDS', default=2.0, cast=float)
+
+# Read receipts are batched into one UPDATE and one broadcast per window (0 disables batching)
+CHAT_READ_RECEIPT_WINDOW_SECONDS = config('CHAT_READ_RECEIPT_WINDOW_SECONDS', default=1.0, cast=float)
+
+# Presence: cache TTL for a user's connection refcount, refreshed by heartbeats.
+# The heartbeat interval also sets how often last_seen is flushed to the DB.
+CHAT_PRESENCE_TTL_SECONDS = config('CHAT_PRESENCE_TTL_SECONDS', default=90, cast=int)
+CHAT_PRESENCE_HEARTBEAT_SECONDS = config('CHAT_PRESENCE_HEARTBEAT_SECONDS', default=30, cast=int)
+
+# Reconnect replay: recent messages kept per conversation in the cache, and the
+# largest gap replayed over the socket before clients fall back to REST history
+CHAT_REPLAY_RING_SIZE = config('CHAT_REPLAY_RING_SIZE', default=200, cast=int)
+CHAT_REPLAY_RING_TTL_SECONDS = config('CHAT_REPLAY_RING_TTL_SECONDS', default=86400, cast=int)
+CHAT_REPLAY_MAX_MESSAGES = config('CHAT_REPLAY_MAX_MESSAGES', default=500, cast=int)
+
+# Per-connection outbound WebSocket queue: max queued chat frames, max age of the
+# oldest queued frame before the client is disconnected as a slow consumer, and
+# max queued droppable (typing/presence) frames
+CHAT_OUTBOUND_QUEUE_SIZE = config('CHAT_OUTBOUND_QUEUE_SIZE', default=500, cast=int)
+CHAT_OUTBOUND_MAX_LAG_SECONDS = config('CHAT_OUTBOUND_MAX_LAG_SECONDS', default=30, cast=int)
+CHAT_OUTBOUND_MAX_DROPPABLE = config('CHAT_OUTBOUND_MAX_DROPPABLE', default=100, cast=int)
+
+# Message search latency budget (enforced as a statement timeout on PostgreSQL)
+CHAT_SEARCH_TIMEOUT_MS = config('CHAT_SEARCH_TIMEOUT_MS', default=500, cast=int)
+
+# Messages older than this many days are moved to compressed cold storage by
+# the archive_messages management command
+CHAT_ARCHIVE_AFTER_DAYS = config('CHAT_ARCHIVE_AFTER_DAYS', default=180, cast=int)
+
+# Chunked chat uploads: chunk size handed to clients, and how long an unfinished
+# upload may sit idle before purge_chat_uploads removes it
+CHAT_UPLOAD_CHUNK_SIZE = config('CHAT_UPLOAD_CHUNK_SIZE', default=1024 * 1024, cast=int)
+CHAT_UPLOAD_EXPIRY_HOURS = config('CHAT_UPLOAD_EXPIRY_HOURS', default=24, cast=int)
+
+# Application cache (api.cache): in-process L1 size and TTL in front of the
+# shared cache, and the default lifetime of cached entries
+API_CACHE_L1_MAX_ENTRIES = config('API_CACHE_L1_MAX_ENTRIES', default=1000, cast=int)
+API_CACHE_L1_TTL_SECONDS = config('API_CACHE_L1_TTL_SECONDS', default=30, cast=int)
+API_CACHE_DEFAULT_TIMEOUT = config('API_CACHE_DEFAULT_TIMEOUT', default=300, cast=int)
+
+# Budget for loading the URLconf at worker startup (manage.py check_import_time)
+URLCONF_IMPORT_BUDGET_MS = config('URLCONF_IMPORT_BUDGET_MS', default=500, cast=int)
+
+# SQL instrumentation (api.middleware / api.instrumentation): fraction of requests
+# and WebSocket events measured (1.0 in staging; a few percent is cheap enough for
+# production), repeats of one query shape that flag an N+1, and query budgets.
+# SQL_QUERY_BUDGETS is keyed by URL name or '<Consumer>.<event type>'.
+SQL_INSTRUMENTATION_SAMPLE_RATE = config('SQL_INSTRUMENTATION_SAMPLE_RATE', default=0.0, cast=float)
+SQL_N_PLUS_ONE_THRESHOLD = config('SQL_N_PLUS_ONE_THRESHOLD', default=5, cast=int)
+SQL_QUERY_BUDGET_DEFAULT = config('SQL_QUERY_BUDGET_DEFAULT', default=30, cast=int)
+SQL_QUERY_BUDGETS = {
+    'workers-list': 10,
+    'worker-detail': 10,
+    'jobs-list': 10,
+    'conversation-list': 10,
+    'message-search': 10,
+}
+
+# Bearer token required to scrape /metrics (api.metrics). Without one the
+# endpoint is only served when DEBUG is on.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Log to the console; api.* loggers carry the SQL instrumentation lines, and
+# structured events (one JSON object per line) come from api, chat and users
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'plain'},
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['console'],
+            'level': config('API_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+        'chat': {
+            'handlers': ['console'],
+            'level': config('APP_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+        'users': {
+            'handlers': ['console'],
+            'level': config('APP_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+    },
+}
@@ -19,12 +19,15 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from api.views import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
     path('api/payments/', include('payments.urls')),  # Payment endpoints
     path('', include('chat.urls')),  # Chat API endpoints
     path('accounts/', include('allauth.urls')),
+    path('metrics', metrics, name='metrics'),  # Prometheus scrape endpoint
 ]
 
 # Serve media files during development